@@ -0,0 +1,5 @@
+import sys
+
+from part_1_2.src.pipeline import main
+
+sys.exit(main())
@@ -0,0 +1,178 @@
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from psycopg2 import sql
+
+from part_1_2.benchmarks.synthetic_data import TABLE_GENERATORS, write_synthetic_csv
+from part_1_2.config.config import CONFIG
+from part_1_2.src.data_diff import validate_table
+from part_1_2.src.data_loader import DataLoader
+from part_1_2.src.s3_client import S3Client
+from part_1_2.src.table_creation import TableCreator
+from part_1_2.src.utils.aws_utils import download_parquet, get_s3_client, open_parquet
+from part_1_2.src.utils.db_utils import fetch_table_arrow, get_connection_pool
+from part_1_2.src.utils.instrumentation import PeakRssSampler
+
+DEFAULT_SCALES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+DEFAULT_THRESHOLDS = Path(__file__).resolve().parent / "thresholds.json"
+
+
+@dataclass
+class StageResult:
+    table_shape: str
+    table_name: str
+    rows: int
+    stage: str
+    seconds: float
+    bytes: int
+    rows_per_second: float
+    mb_per_second: float
+    peak_rss_mb: float
+
+
+def measure(results, table_shape, table_name, rows, stage, size_bytes, function, *args, **kwargs):
+    with PeakRssSampler() as sampler:
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    results.append(StageResult(
+        table_shape=table_shape,
+        table_name=table_name,
+        rows=rows,
+        stage=stage,
+        seconds=seconds,
+        bytes=size_bytes,
+        rows_per_second=rows / seconds if seconds else 0.0,
+        mb_per_second=size_bytes / 2 ** 20 / seconds if seconds else 0.0,
+        peak_rss_mb=sampler.peak / 2 ** 20,
+    ))
+    print(f"{table_name:<32} {stage:<24} {seconds:9.3f}s {results[-1].rows_per_second:14,.0f} rows/s "
+          f"{results[-1].peak_rss_mb:9.1f} MiB peak RSS")
+    return value
+
+
+def bench_table(connection, s3, bucket_name, data_dir, table_shape, rows, keep_tables=False):
+    results = []
+    table_name = f"bench_{table_shape}_{rows}"
+    csv_path = write_synthetic_csv(table_shape, rows, Path(data_dir) / f"{table_name}.csv")
+    csv_bytes = csv_path.stat().st_size
+    creator = TableCreator(connection)
+    loader = DataLoader(connection)
+
+    with connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table_name)))
+    connection.commit()
+
+    measure(results, table_shape, table_name, rows, "infer_column_types", csv_bytes,
+            creator.infer_column_types, csv_path)
+    measure(results, table_shape, table_name, rows, "create_table_from_csv", csv_bytes,
+            creator.create_table_from_csv, csv_path)
+    measure(results, table_shape, table_name, rows, "load_csv_to_postgres", csv_bytes,
+            loader.load_csv_to_postgres, csv_path)
+    with connection.cursor() as cur:
+        cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(table_name)))
+    connection.commit()
+    measure(results, table_shape, table_name, rows, "load_csv_binary", csv_bytes,
+            loader.load_csv_binary, csv_path)
+    object_key = measure(results, table_shape, table_name, rows, "upload_parquet", 0,
+                         s3.upload_parquet, table_name, connection, skip_unchanged=False)
+    parquet_bytes = s3.s3_client.head_object(Bucket=bucket_name, Key=object_key)["ContentLength"]
+    results[-1].bytes = parquet_bytes
+    results[-1].mb_per_second = parquet_bytes / 2 ** 20 / results[-1].seconds if results[-1].seconds else 0.0
+    measure(results, table_shape, table_name, rows, "fetch_table_arrow", 0,
+            fetch_table_arrow, connection, table_name)
+    measure(results, table_shape, table_name, rows, "download_parquet", parquet_bytes,
+            download_parquet, s3.s3_client, bucket_name, object_key, table_name=table_name)
+    measure(results, table_shape, table_name, rows, "validation", parquet_bytes,
+            validate_table, connection, table_name, open_parquet(s3.s3_client, bucket_name, object_key))
+
+    if not keep_tables:
+        with connection.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(table_name)))
+        connection.commit()
+        s3.s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+    csv_path.unlink()
+    return results
+
+
+def check_thresholds(results, thresholds, baseline=None, max_regression=None):
+    """
+    Compare results with the absolute thresholds per stage and, when a baseline run is
+    given, with its throughput for the same table and stage.
+
+    :return: List of human readable violations.
+    """
+    violations = []
+    for result in results:
+        limits = thresholds.get("stages", {}).get(result.stage, {})
+        if result.rows >= thresholds.get("min_rows", 0):
+            if "min_rows_per_second" in limits and result.rows_per_second < limits["min_rows_per_second"]:
+                violations.append(f"{result.table_name} {result.stage}: {result.rows_per_second:,.0f} rows/s "
+                                  f"< {limits['min_rows_per_second']:,} rows/s")
+        if "max_peak_rss_mb" in limits and result.peak_rss_mb > limits["max_peak_rss_mb"]:
+            violations.append(f"{result.table_name} {result.stage}: {result.peak_rss_mb:,.1f} MiB peak RSS "
+                              f"> {limits['max_peak_rss_mb']:,} MiB")
+
+    if baseline and max_regression is not None:
+        previous = {(r["table_name"], r["stage"]): r for r in baseline["results"]}
+        for result in results:
+            before = previous.get((result.table_name, result.stage))
+            if before and before["rows_per_second"] and \
+                    result.rows_per_second < before["rows_per_second"] * (1 - max_regression):
+                violations.append(f"{result.table_name} {result.stage}: {result.rows_per_second:,.0f} rows/s is more "
+                                  f"than {max_regression:.0%} below the baseline {before['rows_per_second']:,.0f}")
+    return violations
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the part_1_2 data pipeline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Row counts per table")
+    parser.add_argument("--tables", nargs="+", default=list(TABLE_GENERATORS), choices=list(TABLE_GENERATORS))
+    parser.add_argument("--output", default="bench_results.json", help="Machine-readable results file")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS), help="Regression thresholds file")
+    parser.add_argument("--baseline", help="Previous results file to compare throughput against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed throughput drop against the baseline, as a fraction")
+    parser.add_argument("--data-dir", help="Directory for the generated CSV files (default: a temporary one)")
+    parser.add_argument("--bucket", default=CONFIG["aws"]["bucket_name"])
+    parser.add_argument("--keep-tables", action="store_true", help="Keep benchmark tables and objects")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    thresholds = json.loads(Path(args.thresholds).read_text()) if args.thresholds else {}
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    s3 = S3Client(get_s3_client(), args.bucket)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir, get_connection_pool().connection() as connection:
+        data_dir = args.data_dir or temp_dir
+        for rows in args.scales:
+            for table_shape in args.tables:
+                results.extend(bench_table(connection, s3, args.bucket, data_dir, table_shape, rows, args.keep_tables))
+
+    violations = check_thresholds(results, thresholds, baseline, args.max_regression)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "s3_endpoint": CONFIG["aws"]["endpoint_url"] or "aws"},
+        "results": [asdict(result) for result in results],
+        "violations": violations,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    for violation in violations:
+        print(f"THRESHOLD VIOLATION: {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = np.array(["John", "Sarah", "Michael", "Emma", "David", "Lisa", "Mary", "James", "Olivia", "Daniel"])
+LAST_NAMES = np.array(["Doe", "Smith", "Johnson", "Brown", "Wilson", "Kim", "Cox", "Lee", "Garcia", "Martinez"])
+PHYSICIANS = np.array(["Dr. Sarah Johnson", "Dr. Michael Chen", "Dr. Emily Brown", "Dr. David Wilson",
+                       "Dr. Mia Patel", "Dr. Cara Lott", "Dr. Harry Pitts", "Dr. Ida Noe"])
+INSURANCE_PROVIDERS = np.array(["BlueCross", "Medicare", "Aetna", "UnitedHealth", "Cigna", "Kaiser"])
+BLOOD_TYPES = np.array(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
+ALLERGIES = np.array(["None", "Penicillin", "Latex", "Sulfa", "Soy", "Mold", "Peanuts"])
+DEPARTMENTS = np.array(["Cardiology", "Neurology", "Orthopedics", "Oncology", "Urology", "Pediatrics"])
+TEST_NAMES = np.array(["Cortisol", "Ammonia", "(ESR)", "Testosterone", "A1C", "HIV", "B12", "Lipid Panel"])
+
+FIRST_PATIENT_ID = 1_000_000
+
+
+def _us_dates(rng, size, start="1940-01-01", days=30_000):
+    dates = pd.Series(pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, size), unit="D"))
+    return (dates.dt.month.astype(str) + "/" + dates.dt.day.astype(str) + "/" + dates.dt.year.astype(str)).to_numpy()
+
+
+def _iso_dates(rng, size, start="2015-01-01", days=3_650):
+    dates = pd.Series(pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, size), unit="D"))
+    return dates.dt.strftime("%Y-%m-%d").to_numpy()
+
+
+def _times_12h(rng, size):
+    hours = pd.Series(rng.integers(1, 13, size)).astype(str)
+    minutes = pd.Series(rng.integers(0, 60, size)).astype(str).str.zfill(2)
+    suffixes = pd.Series(rng.choice(np.array(["AM", "PM"]), size))
+    return (hours + ":" + minutes + ":00 " + suffixes).to_numpy()
+
+
+def _times_24h(rng, size):
+    hours = pd.Series(rng.integers(0, 24, size)).astype(str).str.zfill(2)
+    minutes = pd.Series(rng.integers(0, 60, size)).astype(str).str.zfill(2)
+    return (hours + ":" + minutes).to_numpy()
+
+
+def patient_information(rng, start, size, total_rows):
+    physicians = rng.choice(PHYSICIANS, size)
+    return pd.DataFrame({
+        "patient_id": FIRST_PATIENT_ID + np.arange(start, start + size),
+        "first_name": rng.choice(FIRST_NAMES, size),
+        "last_name": rng.choice(LAST_NAMES, size),
+        "date_of_birth": _us_dates(rng, size),
+        "primary_physician": np.where(rng.random(size) < 0.04, "", physicians),
+        "insurance_provider": rng.choice(INSURANCE_PROVIDERS, size),
+        "blood_type": rng.choice(BLOOD_TYPES, size),
+        "allergies": rng.choice(ALLERGIES, size),
+    })
+
+
+def admissions(rng, start, size, total_rows):
+    released = rng.random(size) >= 0.55
+    rooms = pd.Series(rng.integers(1, 600, size)).astype(str) + pd.Series(rng.choice(np.array(list("ABCD")), size))
+    return pd.DataFrame({
+        "patient_id": FIRST_PATIENT_ID + rng.integers(0, total_rows, size),
+        "hospitalization_case_number": 100_000 + np.arange(start, start + size),
+        "admission_date": _us_dates(rng, size, start="2015-01-01", days=3_650),
+        "admission_time": _times_12h(rng, size),
+        "release_date": np.where(released, _iso_dates(rng, size), "NULL"),
+        "release_time": np.where(released, _times_24h(rng, size), "NULL"),
+        "department": rng.choice(DEPARTMENTS, size),
+        "room_number": rooms.to_numpy(),
+    })
+
+
+def lab_tests(rng, start, size, total_rows):
+    return pd.DataFrame({
+        "test_id": 10_000 + np.arange(start, start + size),
+        "patient_id": FIRST_PATIENT_ID + rng.integers(0, max(total_rows // 6, 1), size),
+        "test_name": rng.choice(TEST_NAMES, size),
+        "order_date": _us_dates(rng, size, start="2015-01-01", days=3_650),
+        "order_time": _times_12h(rng, size),
+        "ordering_physician": rng.choice(PHYSICIANS, size),
+    })
+
+
+TABLE_GENERATORS = {
+    "patient_information": patient_information,
+    "admissions": admissions,
+    "lab_tests": lab_tests,
+}
+
+
+def write_synthetic_csv(table_shape, rows, path, chunk_rows=500_000, seed=0):
+    """
+    Write ``rows`` synthetic rows shaped like ``table_shape`` to ``path``, one chunk at a time.
+    The columns and value formats (M/D/YYYY and ISO dates, 12h and 24h times, NULL tokens)
+    match the test data, and values are generated with vectorized numpy/pandas code.
+
+    :return: The path of the written file.
+    """
+    generator = TABLE_GENERATORS[table_shape]
+    rng = np.random.default_rng(seed)
+    path = Path(path)
+    with open(path, "w", newline="") as file:
+        for start in range(0, rows, chunk_rows):
+            size = min(chunk_rows, rows - start)
+            generator(rng, start, size, rows).to_csv(file, header=start == 0, index=False)
+    if rows == 0:
+        path.write_text(",".join(generator(rng, 0, 0, 0).columns) + "\n")
+    return path
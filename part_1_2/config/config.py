@@ -8,11 +8,34 @@ CONFIG = {
         'host': os.getenv('DB_HOST'),
         'dbname': os.getenv('DB_NAME'),
         'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD')
+        'password': os.getenv('DB_PASSWORD'),
+        'schema': os.getenv('DB_SCHEMA'),  # search_path of every connection, None for the server default
+        'pool_min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        'pool_max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30))
     },
     'aws': {
         'access_key': os.getenv('AWS_ACCESS_KEY_ID'),
         'secret_key': os.getenv('AWS_SECRET_ACCESS_KEY'),
-        'bucket_name': os.getenv('S3_BUCKET_NAME')
+        'bucket_name': os.getenv('S3_BUCKET_NAME'),
+        'endpoint_url': os.getenv('S3_ENDPOINT_URL'),  # e.g. a local MinIO server, None for AWS
+        # 's3' for boto3, or an in-process object store: 'memory', or 'local' files below local_root
+        'backend': os.getenv('S3_BACKEND', 's3').lower(),
+        'local_root': os.getenv('S3_LOCAL_ROOT', '.object_store'),
+        'part_size': int(os.getenv('S3_PART_SIZE_MB', 8)) * 1024 * 1024,
+        'max_concurrency': int(os.getenv('S3_MAX_CONCURRENCY', 4))  # parts uploaded at the same time per object
+    },
+    'ingestion': {
+        # Load CSVs through Arrow and binary COPY; 0 sends the raw CSV text through COPY instead
+        'binary_copy': os.getenv('INGEST_BINARY_COPY', '1').lower() in ('1', 'true', 'yes'),
+        'block_size': int(os.getenv('INGEST_BLOCK_SIZE_MB', 4)) * 1024 * 1024  # CSV bytes per Arrow record batch
+    },
+    'pipeline': {
+        'checkpoint': os.getenv('PIPELINE_CHECKPOINT', '.pipeline/checkpoint.json'),  # Stages completed by earlier runs
+        'max_workers': int(os.getenv('PIPELINE_WORKERS', 4))  # Table stages run at the same time
+    },
+    'metrics': {
+        'enabled': os.getenv('PIPELINE_METRICS', '0').lower() in ('1', 'true', 'yes'),
+        'directory': os.getenv('PIPELINE_METRICS_DIR', 'test_results/metrics')
     }
-}
\ No newline at end of file
+}
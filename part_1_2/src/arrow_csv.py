@@ -0,0 +1,113 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv
+
+from part_1_2.src.utils.pg_binary import FIXED_WIDTH_TYPES
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024  # Bytes of CSV parsed per record batch
+
+# The DATE_FORMATS of type_inference (ISO and M/D/YYYY) and its 24 and 12 hour TIME formats, with named parts
+DATE_REGEX = (r"^(?:(?P<iso_year>\d{4})-(?P<iso_month>\d{1,2})-(?P<iso_day>\d{1,2})"
+              r"|(?P<us_month>\d{1,2})/(?P<us_day>\d{1,2})/(?P<us_year>\d{4}))$")
+TIME_REGEX = r"^(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2})(?:\.(?P<fraction>\d+))?)?\s?(?P<period>[AaPp][Mm])?$"
+
+INTEGER_TYPES = {"smallint": pa.int16(), "integer": pa.int32(), "bigint": pa.int64()}
+
+
+def read_csv_batches(csv_file_path, column_names, null_tokens=("NULL",), block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Stream a CSV file as Arrow record batches of string columns, parsed by Arrow's multi-threaded
+    reader. Like a CSV-mode COPY with NULL set to a token, unquoted null tokens become nulls
+    and everything else, including empty fields, stays a string. Quoted values may contain
+    newlines, and empty lines are rows, as in COPY.
+    """
+    return csv.open_csv(
+        csv_file_path,
+        read_options=csv.ReadOptions(use_threads=True, block_size=block_size),
+        parse_options=csv.ParseOptions(newlines_in_values=True, ignore_empty_lines=False),
+        convert_options=csv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            null_values=list(null_tokens),
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+
+
+def _check_parsed(values, parsed, kind):
+    failed = pc.and_(values.is_valid(), parsed.is_null())
+    if pc.any(failed).as_py():
+        raise ValueError(f"Not a {kind}: '{values.filter(failed)[0]}'")
+    return parsed
+
+
+def _part(parts, name):
+    return pc.struct_field(parts, name)
+
+
+def _first_non_empty(first, second):
+    return pc.if_else(pc.equal(first, ""), second, first)
+
+
+def parse_dates(values: pa.Array) -> pa.Array:
+    """
+    Parse ISO and M/D/YYYY dates to date32. Values that are not valid dates raise a ValueError.
+    """
+    parts = pc.extract_regex(values, DATE_REGEX)
+    year = _first_non_empty(_part(parts, "iso_year"), _part(parts, "us_year"))
+    month = pc.cast(_first_non_empty(_part(parts, "iso_month"), _part(parts, "us_month")), pa.int8())
+    day = pc.cast(_first_non_empty(_part(parts, "iso_day"), _part(parts, "us_day")), pa.int8())
+    iso = pc.binary_join_element_wise(year, pc.utf8_lpad(pc.cast(month, pa.string()), 2, "0"),
+                                      pc.utf8_lpad(pc.cast(day, pa.string()), 2, "0"), "-")
+    timestamps = pc.strptime(iso, format="%Y-%m-%d", unit="s", error_is_null=True)
+    # strptime rolls days past the end of a month over, e.g. 2/30 to 3/2
+    rolled_over = pc.or_(pc.not_equal(pc.month(timestamps), month), pc.not_equal(pc.day(timestamps), day))
+    timestamps = pc.if_else(pc.fill_null(rolled_over, False), pa.scalar(None, timestamps.type), timestamps)
+    return _check_parsed(values, pc.cast(timestamps, pa.date32()), "date")
+
+
+def parse_times(values: pa.Array) -> pa.Array:
+    """
+    Parse 24 hour and 12 hour (``5:20:00 AM``) times to time64 microseconds. Values that are not
+    valid times raise a ValueError.
+    """
+    parts = pc.extract_regex(values, TIME_REGEX)
+    hour = pc.cast(_part(parts, "hour"), pa.int64())
+    minute = pc.cast(_part(parts, "minute"), pa.int64())
+    second = pc.cast(_first_non_empty(_part(parts, "second"), "0"), pa.int64())
+    fraction = pc.utf8_slice_codeunits(pc.utf8_rpad(_part(parts, "fraction"), 6, "0"), 0, 6)
+    period = pc.utf8_upper(_part(parts, "period"))
+
+    is_12_hour = pc.not_equal(period, "")
+    valid = pc.and_(pc.if_else(is_12_hour, pc.and_(pc.greater_equal(hour, 1), pc.less_equal(hour, 12)),
+                               pc.less_equal(hour, 23)),
+                    pc.and_(pc.less_equal(minute, 59), pc.less_equal(second, 59)))
+    hour = pc.if_else(is_12_hour, pc.add(pc.remainder(hour, 12), pc.if_else(pc.equal(period, "PM"), 12, 0)), hour)
+
+    microseconds = pc.add(pc.multiply(pc.add(pc.multiply(pc.add(pc.multiply(hour, 60), minute), 60), second),
+                                      1_000_000), pc.cast(fraction, pa.int64()))
+    microseconds = pc.if_else(valid, microseconds, pa.scalar(None, pa.int64()))
+    return _check_parsed(values, pc.cast(microseconds, pa.time64("us")), "time")
+
+
+def normalize_column(values: pa.Array, data_type: str) -> pa.Array:
+    """
+    Convert a string column read by read_csv_batches to the Arrow type matching its
+    information_schema data type. NUMERIC and character columns stay strings.
+    """
+    if data_type in INTEGER_TYPES:
+        return pc.cast(pc.utf8_ltrim(values, "+"), INTEGER_TYPES[data_type])
+    if data_type == "date":
+        return parse_dates(values)
+    if data_type == "time without time zone":
+        return parse_times(values)
+    if data_type in FIXED_WIDTH_TYPES:  # real, double precision, boolean
+        return pc.cast(values, {"real": pa.float32(), "double precision": pa.float64()}.get(data_type, pa.bool_()))
+    return values
+
+
+def normalize_batch(batch: pa.RecordBatch, data_types) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays(
+        [normalize_column(values, data_type) for values, data_type in zip(batch.columns, data_types)],
+        names=batch.schema.names,
+    )
@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from part_1_2.src.data_diff import default_key_columns, partition_sql
+
+
+class ChangeTracker:
+    """
+    Records which hash partitions of a table were touched by the db_utils DML helpers.
+
+    Partitions are computed in PostgreSQL with the same key hash the diff engine and the
+    partitioned export use, so only the touched partitions need to be re-exported and
+    re-validated after a change.
+
+    :param key_columns: Mapping of table name to key columns. Tables without an entry
+                        are partitioned by their primary key, like TableDiff.
+    :param num_partitions: Number of hash partitions per table.
+    """
+
+    def __init__(self, key_columns=None, num_partitions=64):
+        self.key_columns = dict(key_columns or {})
+        self.num_partitions = num_partitions
+        self._touched = defaultdict(set)
+
+    def key_columns_for(self, connection, table_name):
+        if table_name not in self.key_columns:
+            self.key_columns[table_name] = default_key_columns(connection, table_name)
+        return self.key_columns[table_name]
+
+    def partition_sql(self, connection, table_name):
+        """
+        SQL expression of the partition of a row, for use in SELECT and RETURNING clauses.
+        """
+        return partition_sql(self.key_columns_for(connection, table_name), self.num_partitions)
+
+    def record(self, table_name, partitions):
+        self._touched[table_name].update(partitions)
+
+    def touched_partitions(self, table_name):
+        return set(self._touched.get(table_name, ()))
+
+    def clear(self, table_name=None):
+        if table_name is None:
+            self._touched.clear()
+        else:
+            self._touched.pop(table_name, None)
@@ -0,0 +1,490 @@
+import hashlib
+import math
+import uuid
+import warnings
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from psycopg2 import errors, sql
+
+from part_1_2.src.utils.db_utils import get_connection_pool
+from part_1_2.src.utils.instrumentation import instrumentation
+
+NULL_TEXT = "\\N"
+SEPARATOR = "|"
+# Row hashes are summed per partition; 60 bits keeps the sum exact in PostgreSQL numeric
+# and makes accidental collisions of the partition digest negligible.
+ROW_HASH_HEX_DIGITS = 15
+PARTITION_HEX_DIGITS = 8
+
+
+@dataclass
+class RowDiff:
+    """
+    A row that differs between the database and the Parquet data.
+    ``db_row`` or ``parquet_row`` is None when the row only exists on one side.
+    """
+    key: Tuple[str, ...]
+    db_row: Optional[Dict[str, str]] = None
+    parquet_row: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class DiffResult:
+    """
+    Structured difference between a table and its Parquet export.
+
+    ``missing`` rows are in the database but not in the Parquet data, ``extra`` rows
+    are only in the Parquet data and ``changed`` rows exist on both sides with the
+    same key but different values. Values are in their PostgreSQL text form.
+    ``truncated`` is set when the comparison stopped after the maximum number of
+    differing rows, so the lists only hold the first of them.
+    """
+    table_name: str
+    partitions_checked: int
+    differing_partitions: List[int] = field(default_factory=list)
+    missing: List[RowDiff] = field(default_factory=list)
+    extra: List[RowDiff] = field(default_factory=list)
+    changed: List[RowDiff] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def is_equal(self):
+        return not (self.missing or self.extra or self.changed)
+
+    @property
+    def num_differences(self):
+        return len(self.missing) + len(self.extra) + len(self.changed)
+
+    def __str__(self):
+        if self.is_equal:
+            return f"'{self.table_name}': no differences in {self.partitions_checked} partitions"
+        return (f"'{self.table_name}': {len(self.missing)} missing, {len(self.extra)} extra and "
+                f"{len(self.changed)} changed rows in {len(self.differing_partitions)} of "
+                f"{self.partitions_checked} partitions"
+                + (f" (stopped after the first {self.num_differences} differing rows)" if self.truncated else ""))
+
+
+def _hex_to_int_sql(expression, digits):
+    return sql.SQL("('x' || substr({}, 1, {}))::bit({})::bigint").format(
+        expression, sql.Literal(digits), sql.Literal(digits * 4)
+    )
+
+
+def _text_sql(columns):
+    # || rather than concat_ws (which is only stable) so the partition expression can be indexed
+    parts = [sql.SQL("coalesce({}::text, {})").format(sql.Identifier(col), sql.Literal(NULL_TEXT)) for col in columns]
+    separator = sql.SQL(" || {} || ").format(sql.Literal(SEPARATOR))
+    text = parts[0]
+    for part in parts[1:]:
+        text = sql.Composed([text, separator, part])
+    return sql.SQL("({})").format(text)
+
+
+def partition_sql(key_columns, num_partitions):
+    """
+    SQL expression assigning a row to one of ``num_partitions`` hash partitions by its key columns.
+    """
+    key_hash = _hex_to_int_sql(sql.SQL("md5({})").format(_text_sql(key_columns)), PARTITION_HEX_DIGITS)
+    return sql.SQL("mod({}, {})").format(key_hash, sql.Literal(num_partitions))
+
+
+def partition_index_name(table_name, key_columns, num_partitions):
+    digest = hashlib.md5(f"{SEPARATOR.join(key_columns)}/{num_partitions}".encode()).hexdigest()[:8]
+    return f"{table_name[:40]}_partition_{digest}_idx"
+
+
+def create_partition_index(table_name, key_columns, num_partitions, pool=None):
+    """
+    Index the partition_sql expression of a table, so that selecting some partitions with
+    ``partition = ANY(...)`` reads only their rows instead of hashing the whole table. The
+    table is analyzed once the index is created, so the planner knows how rows spread over
+    the partitions. Key columns whose text form depends on settings (e.g. dates) cannot be
+    indexed; their partitions are still selected, with a full scan.
+
+    The index is built with ``CREATE INDEX CONCURRENTLY`` on a connection of its own (from
+    ``pool``, by default the process-wide pool) in autocommit mode, so writes to the table
+    are not blocked and no transaction of the caller is committed. The build waits for
+    transactions that wrote to the table, so the caller must not hold uncommitted writes
+    to it. An invalid index left behind by an interrupted build is dropped and rebuilt.
+
+    :return: Whether the index exists.
+    """
+    index_name = partition_index_name(table_name, key_columns, num_partitions)
+    with (pool or get_connection_pool()).connection() as connection:
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                            (sql.Identifier(index_name).as_string(connection),))
+                existing = cur.fetchone()
+                if existing is not None and existing[0]:
+                    return True
+                if existing is not None:
+                    cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(index_name)))
+                try:
+                    cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (({}))").format(
+                        sql.Identifier(index_name), sql.Identifier(table_name),
+                        partition_sql(key_columns, num_partitions)
+                    ))
+                except errors.InvalidObjectDefinition as error:  # The expression is not immutable
+                    print(f"Partitions of '{table_name}' by {list(key_columns)} are selected with a full scan: {error}")
+                    return False
+                cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table_name)))
+        finally:
+            if not connection.closed:
+                connection.autocommit = False
+    return True
+
+
+def _row_hash_sql(columns):
+    return _hex_to_int_sql(sql.SQL("md5({})").format(_text_sql(columns)), ROW_HASH_HEX_DIGITS)
+
+
+def _strip_fraction_zeros(text):
+    # PostgreSQL prints fractional seconds without trailing zeros, Arrow prints all digits of the unit
+    text = pc.replace_substring_regex(text, r"\.0+$", "")
+    return pc.replace_substring_regex(text, r"(\.\d*[1-9])0+$", r"\1")
+
+
+def _format_float(value):
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def canonical_text(array):
+    """
+    Convert an Arrow array to the strings PostgreSQL produces for ``value::text``,
+    with NULL as ``\\N``. Common types are converted with Arrow compute kernels.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    arrow_type = array.type
+    if pa.types.is_boolean(arrow_type):
+        text = pc.if_else(array, "t", "f")
+    elif pa.types.is_time(arrow_type) or (pa.types.is_timestamp(arrow_type) and arrow_type.tz is None):
+        text = _strip_fraction_zeros(pc.cast(array, pa.string()))
+    elif pa.types.is_floating(arrow_type):
+        text = pa.array([None if v is None else _format_float(v) for v in array.to_pylist()], pa.string())
+    elif pa.types.is_timestamp(arrow_type):
+        text = pa.array([None if v is None else str(v) for v in array.to_pylist()], pa.string())
+    else:
+        text = pc.cast(array, pa.string())
+    return text.fill_null(NULL_TEXT).to_pylist()
+
+
+def partition_of(key_text, num_partitions):
+    """
+    Python counterpart of partition_sql for a key in its canonical text form.
+    """
+    return int(hashlib.md5(key_text.encode()).hexdigest()[:PARTITION_HEX_DIGITS], 16) % num_partitions
+
+
+def _row_hash(row_text):
+    return int(hashlib.md5(row_text.encode()).hexdigest()[:ROW_HASH_HEX_DIGITS], 16)
+
+
+def _iter_parquet_rows(parquet_file, columns, key_columns, num_partitions, batch_size):
+    """
+    Yield (partition, key, row hash, row values) for every row of the Parquet file,
+    one record batch at a time.
+    """
+    key_indexes = [columns.index(col) for col in key_columns]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=list(columns)):
+        texts = [canonical_text(batch.column(i)) for i in range(batch.num_columns)]
+        for values in zip(*texts):
+            key = tuple(values[i] for i in key_indexes)
+            yield (partition_of(SEPARATOR.join(key), num_partitions), key,
+                   _row_hash(SEPARATOR.join(values)), values)
+
+
+def table_columns(connection, table_name):
+    """
+    Column names of the table, in ``SELECT *`` order.
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table_name)))
+        return [column.name for column in cur.description]
+
+
+def primary_key_columns(connection, table_name):
+    """
+    Columns of the table's primary key in key order, or an empty list if it has none.
+    """
+    query = """
+        SELECT a.attname FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = quote_ident(%s)::regclass AND i.indisprimary
+        ORDER BY array_position(i.indkey::int2[], a.attnum)
+    """
+    with connection.cursor() as cur:
+        cur.execute(query, (table_name,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def default_key_columns(connection, table_name):
+    """
+    Key columns rows are matched by when none are given: the primary key, or all columns
+    of a table without one. Rows are then only equal or not, so a changed row is reported
+    as a missing and an extra row, and a warning says so.
+    """
+    key_columns = primary_key_columns(connection, table_name)
+    if key_columns:
+        return key_columns
+    warnings.warn(f"'{table_name}' has no primary key; rows are keyed by all columns, so changed rows are "
+                  f"reported as missing and extra rows. Pass key_columns to match them.", stacklevel=3)
+    return table_columns(connection, table_name)
+
+
+def table_digest(connection, table_name, row_filter=None):
+    """
+    Row count and row-hash sum of the table, computed in PostgreSQL. Tables with the same
+    rows, in any order, have the same digest.
+    """
+    query = sql.SQL("SELECT count(*), coalesce(sum({row_hash}), 0) FROM {table} WHERE {row_filter}").format(
+        row_hash=_row_hash_sql(table_columns(connection, table_name)),
+        table=sql.Identifier(table_name),
+        row_filter=row_filter if row_filter is not None else sql.SQL("true"),
+    )
+    with connection.cursor() as cur:
+        cur.execute(query)
+        count, hash_sum = cur.fetchone()
+    return count, int(hash_sum)
+
+
+class TableDiff:
+    """
+    Compares a PostgreSQL table with Parquet data one hash partition at a time.
+
+    Rows are assigned to ``num_partitions`` partitions by an MD5 hash of their key
+    columns, by default the primary key (see default_key_columns). A row-count and
+    row-hash digest is computed per partition in a single aggregate query in PostgreSQL
+    and in one streaming pass over the Parquet row groups. Only partitions whose digests
+    differ are fetched row by row and compared, a group of at most ``drill_down_rows``
+    rows at a time; larger partitions are split by a finer hash partitioning, so memory
+    is bounded even when every partition differs. The comparison stops once ``max_rows``
+    differing rows were found.
+    """
+
+    def __init__(self, connection, table_name, key_columns: Optional[Sequence[str]] = None,
+                 num_partitions=64, batch_size=100_000, row_filter: Optional[sql.Composable] = None,
+                 drill_down_rows=100_000, max_rows=1000):
+        self.conn = connection
+        self.table_name = table_name
+        self.num_partitions = num_partitions
+        self.batch_size = batch_size
+        self.drill_down_rows = drill_down_rows
+        self.max_rows = max_rows
+        # Restricts the database side to the rows the Parquet files are expected to hold
+        self.row_filter = row_filter if row_filter is not None else sql.SQL("true")
+        self.columns = table_columns(connection, table_name)
+        self.key_columns = list(key_columns) if key_columns else default_key_columns(connection, table_name)
+
+    def db_digests(self, partitions=None) -> Dict[int, Tuple[int, int]]:
+        """
+        Row count and row-hash sum per partition, computed in PostgreSQL.
+        """
+        query = sql.SQL(
+            "SELECT part, count(*), sum(row_hash) FROM "
+            "(SELECT {partition} AS part, {row_hash} AS row_hash FROM {table} WHERE {row_filter}) AS hashed "
+            "{where} GROUP BY part"
+        ).format(
+            partition=partition_sql(self.key_columns, self.num_partitions),
+            row_hash=_row_hash_sql(self.columns),
+            table=sql.Identifier(self.table_name),
+            row_filter=self.row_filter,
+            where=sql.SQL("WHERE part = ANY(%s)") if partitions is not None else sql.SQL(""),
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (list(partitions),) if partitions is not None else None)
+            return {part: (count, int(hash_sum)) for part, count, hash_sum in cur.fetchall()}
+
+    def parquet_digests(self, parquet_files, partitions=None) -> Dict[int, Tuple[int, int]]:
+        """
+        Row count and row-hash sum per partition, computed in one pass over the Parquet files.
+        """
+        digests = defaultdict(lambda: [0, 0])
+        for parquet_file in parquet_files:
+            self._check_columns(parquet_file)
+            for part, _, row_hash, _ in _iter_parquet_rows(parquet_file, self.columns, self.key_columns,
+                                                           self.num_partitions, self.batch_size):
+                if partitions is None or part in partitions:
+                    digests[part][0] += 1
+                    digests[part][1] += row_hash
+        return {part: tuple(digest) for part, digest in digests.items()}
+
+    def _check_columns(self, parquet_file):
+        parquet_columns = set(parquet_file.schema_arrow.names)
+        if parquet_columns != set(self.columns):
+            raise ValueError(
+                f"Column mismatch for '{self.table_name}': only in DB {sorted(set(self.columns) - parquet_columns)}, "
+                f"only in Parquet {sorted(parquet_columns - set(self.columns))}"
+            )
+
+    def _db_rows(self, partitions, num_partitions):
+        """
+        Yield (key, row hash, row values) of the rows in the given partitions of a
+        ``num_partitions`` partitioning, read through a server-side cursor.
+        """
+        key_indexes = [self.columns.index(col) for col in self.key_columns]
+        query = sql.SQL("SELECT {row_text} FROM {table} WHERE {partition} = ANY(%s) AND {row_filter}").format(
+            row_text=sql.SQL(", ").join(
+                sql.SQL("coalesce({}::text, {})").format(sql.Identifier(col), sql.Literal(NULL_TEXT))
+                for col in self.columns
+            ),
+            table=sql.Identifier(self.table_name),
+            partition=partition_sql(self.key_columns, num_partitions),
+            row_filter=self.row_filter,
+        )
+        with self.conn.cursor(name=f"diff_{uuid.uuid4().hex}") as cur:
+            cur.itersize = self.batch_size
+            cur.execute(query, (list(partitions),))
+            for values in cur:
+                yield tuple(values[i] for i in key_indexes), _row_hash(SEPARATOR.join(values)), values
+
+    def diff(self, parquet_files, partitions=None) -> DiffResult:
+        """
+        Compare the table with the given Parquet files (``pyarrow.parquet.ParquetFile``
+        objects). ``partitions`` restricts the comparison to a subset of partitions.
+        """
+        if not isinstance(parquet_files, (list, tuple)):
+            parquet_files = [parquet_files]
+        partitions = set(partitions) if partitions is not None else None
+        with instrumentation.stage("validation", self.table_name) as record:
+            db_digests = self.db_digests(partitions)
+            parquet_digests = self.parquet_digests(parquet_files, partitions)
+
+            checked = partitions if partitions is not None else range(self.num_partitions)
+            differing = sorted(part for part in set(db_digests) | set(parquet_digests)
+                               if db_digests.get(part) != parquet_digests.get(part))
+            result = DiffResult(self.table_name, len(checked), differing)
+            sizes = {part: max(db_digests.get(part, (0, 0))[0], parquet_digests.get(part, (0, 0))[0])
+                     for part in differing}
+            for parts, num_partitions in self.drill_down_groups(sizes, self.num_partitions, self.drill_down_rows):
+                if self._drill_down(parquet_files, parts, num_partitions, result):
+                    break
+            record.rows = sum(parquet_file.metadata.num_rows for parquet_file in parquet_files)
+            record.bytes = sum(parquet_file.metadata.row_group(i).total_byte_size
+                               for parquet_file in parquet_files for i in range(parquet_file.metadata.num_row_groups))
+        return result
+
+    @staticmethod
+    def drill_down_groups(sizes, num_partitions, max_group_rows):
+        """
+        Split differing partitions into groups of about ``max_group_rows`` rows.
+
+        Partition p of a ``num_partitions`` partitioning is the union of partitions
+        p + i * num_partitions (i < k) of a ``k * num_partitions`` partitioning, so a
+        partition too large for one group is split into k such finer partitions.
+
+        :param sizes: Dict of differing partition to its larger row count of both sides.
+        :return: List of (partitions, num_partitions) groups.
+        """
+        groups, group, group_rows = [], [], 0
+        for part, rows in sorted(sizes.items()):
+            if rows > max_group_rows:
+                splits = math.ceil(rows / max_group_rows)
+                groups += [([part + i * num_partitions], splits * num_partitions) for i in range(splits)]
+                continue
+            if group and group_rows + rows > max_group_rows:
+                groups.append((group, num_partitions))
+                group, group_rows = [], 0
+            group.append(part)
+            group_rows += rows
+        if group:
+            groups.append((group, num_partitions))
+        return groups
+
+    def _drill_down(self, parquet_files, partitions, num_partitions, result):
+        """
+        Compare the rows of a group of partitions and add the differences to the result.
+
+        :return: Whether ``max_rows`` differences were found, which ends the comparison.
+        """
+        partitions = set(partitions)
+        db_rows = defaultdict(list)
+        for key, row_hash, values in self._db_rows(partitions, num_partitions):
+            db_rows[key].append((row_hash, values))
+
+        parquet_rows = defaultdict(list)
+        for parquet_file in parquet_files:
+            for part, key, row_hash, values in _iter_parquet_rows(parquet_file, self.columns, self.key_columns,
+                                                                  num_partitions, self.batch_size):
+                if part in partitions:
+                    parquet_rows[key].append((row_hash, values))
+
+        for key in sorted(db_rows.keys() | parquet_rows.keys()):
+            only_db, only_parquet = self._unmatched(db_rows.get(key, []), parquet_rows.get(key, []))
+            differences = [RowDiff(key, self._as_dict(db_values), self._as_dict(parquet_values))
+                           for db_values, parquet_values in zip(only_db, only_parquet)]
+            differences += [RowDiff(key, db_row=self._as_dict(db_values)) for db_values in only_db[len(only_parquet):]]
+            differences += [RowDiff(key, parquet_row=self._as_dict(parquet_values))
+                            for parquet_values in only_parquet[len(only_db):]]
+            for difference in differences:
+                if result.num_differences >= self.max_rows:
+                    result.truncated = True
+                    return True
+                if difference.db_row is None:
+                    result.extra.append(difference)
+                elif difference.parquet_row is None:
+                    result.missing.append(difference)
+                else:
+                    result.changed.append(difference)
+        return False
+
+    @staticmethod
+    def _unmatched(db_rows, parquet_rows):
+        """
+        Drop rows present on both sides (as a multiset) and return the rest of each side.
+        """
+        common = Counter(h for h, _ in db_rows) & Counter(h for h, _ in parquet_rows)
+
+        def remaining(rows):
+            left = Counter(common)
+            unmatched = []
+            for row_hash, values in rows:
+                if left[row_hash]:
+                    left[row_hash] -= 1
+                else:
+                    unmatched.append(values)
+            return unmatched
+
+        return remaining(db_rows), remaining(parquet_rows)
+
+    def _as_dict(self, values):
+        return {col: (None if value == NULL_TEXT else value) for col, value in zip(self.columns, values)}
+
+
+def diff_table(connection, table_name, parquet_files, key_columns=None, num_partitions=64, partitions=None,
+               row_filter=None, max_rows=1000):
+    """
+    Compare a table with its Parquet export, see TableDiff.
+    """
+    return TableDiff(connection, table_name, key_columns, num_partitions, row_filter=row_filter,
+                     max_rows=max_rows).diff(parquet_files, partitions)
+
+
+def validate_table(connection, table_name, parquet_files, key_columns=None, num_partitions=64, partitions=None,
+                   row_filter=None, max_rows=1000):
+    """
+    Validates that a table and its Parquet export contain the same rows.
+    Raises an AssertionError describing the differences if they do not.
+
+    ``row_filter`` (SQL condition) limits the table to the rows exported to the given files,
+    e.g. the partitions of a partitioned dataset that are being checked.
+    """
+    result = diff_table(connection, table_name, parquet_files, key_columns, num_partitions, partitions, row_filter,
+                        max_rows)
+    if not result.is_equal:
+        samples = (result.missing + result.extra + result.changed)[:5]
+        raise AssertionError(f"Data validation failed: {result}. First differences: {samples}")
+    print(f"Validation successful: {result}")
+    return result
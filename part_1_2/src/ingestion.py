@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from part_1_2.config.config import CONFIG
+from part_1_2.src.data_loader import DataLoader
+from part_1_2.src.table_creation import TableCreator
+from part_1_2.src.utils.db_utils import get_connection_pool
+from part_1_2.src.utils.file_utils import get_csv_file_paths
+
+
+def ingest_csv_file(pool, csv_file_path, clear_table=False, null_token='NULL', binary_copy=None):
+    """
+    Create the table for one CSV file and COPY the file into it, using a connection
+    borrowed from the pool for the whole operation. With ``binary_copy`` (by default
+    ``CONFIG['ingestion']['binary_copy']``) the file is loaded with DataLoader.load_csv_binary.
+
+    :return: LoadResult with rows and bytes per second for the table.
+    """
+    conn = pool.getconn()
+    try:
+        table = TableCreator(conn, null_tokens=(null_token,))
+        table.create_table_from_csv(csv_file_path)
+        if clear_table:
+            table.clear_table(Path(csv_file_path).stem)
+        loader = DataLoader(conn, null_token=null_token)
+        if CONFIG['ingestion']['binary_copy'] if binary_copy is None else binary_copy:
+            return loader.load_csv_binary(csv_file_path)
+        return loader.load_csv_to_postgres(csv_file_path)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def ingest_csv_directory(directory_path, max_workers=4, clear_tables=False, null_token='NULL', pool=None,
+                         binary_copy=None):
+    """
+    Create and load a table for every CSV file in the directory concurrently.
+
+    Each file is handled by its own worker on its own pooled connection. When no pool
+    is given, the shared pool is used; workers wait for a free connection when
+    ``max_workers`` exceeds its size.
+
+    :param directory_path: Directory containing the CSV files.
+    :param max_workers: Number of files loaded at the same time.
+    :param clear_tables: Empty existing tables before loading.
+    :param null_token: CSV value loaded as SQL NULL.
+    :param binary_copy: Load through Arrow and binary COPY, see ingest_csv_file.
+    :return: List of LoadResult, in the order of the CSV files.
+    :raises: The first error raised by any worker, after all workers finished.
+    """
+    csv_paths = list(get_csv_file_paths(directory_path))
+    if not csv_paths:
+        return []
+
+    pool = pool or get_connection_pool()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest") as executor:
+        futures = [
+            executor.submit(ingest_csv_file, pool, csv_path, clear_tables, null_token, binary_copy)
+            for csv_path in csv_paths
+        ]
+    results = [future.result() for future in futures]
+
+    for result in results:
+        print(result)
+    return results
@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from psycopg2 import sql
+
+from part_1_2.config.config import CONFIG
+from part_1_2.src.data_diff import table_digest, validate_table
+from part_1_2.src.ingestion import ingest_csv_file
+from part_1_2.src.s3_client import S3Client
+from part_1_2.src.utils.aws_utils import get_s3_client, head_object, open_parquet
+from part_1_2.src.utils.db_utils import get_connection_pool
+from part_1_2.src.utils.file_utils import get_csv_file_paths
+
+STAGES = ("load", "export", "validate")
+CHECKPOINT_VERSION = 1
+DONE, SKIPPED, FAILED, BLOCKED = "done", "skipped", "failed", "blocked"
+
+
+@dataclass(frozen=True)
+class Job:
+    """One stage of one table."""
+    table_name: str
+    stage: str
+    csv_path: Path
+
+
+@dataclass
+class JobResult:
+    job: Job
+    status: str
+    seconds: float = 0.0
+    detail: str = ""
+
+    def __str__(self):
+        detail = f": {self.detail}" if self.detail else ""
+        return f"{self.job.table_name:<32} {self.job.stage:<9} {self.status:<8} {self.seconds:8.3f}s{detail}"
+
+
+def build_dag(csv_paths, stages=STAGES, table_names=None):
+    """
+    The jobs of every table and the jobs each depends on: the stages of one table run in
+    order, while the stages of different tables are independent.
+
+    :param table_names: Only build jobs for these tables (CSV file stems).
+    :return: Dict of job to the list of jobs it waits for, in table and stage order.
+    """
+    stages = [stage for stage in STAGES if stage in stages]
+    dag = {}
+    for csv_path in sorted(Path(path) for path in csv_paths):
+        if table_names is not None and csv_path.stem not in table_names:
+            continue
+        previous = None
+        for stage in stages:
+            job = Job(csv_path.stem, stage, csv_path)
+            dag[job] = [previous] if previous else []
+            previous = job
+    return dag
+
+
+def run_dag(dag, run_job, max_workers=4):
+    """
+    Run the jobs of a DAG on a pool of ``max_workers`` threads, each job as soon as the jobs
+    it depends on completed. When a job fails, the jobs depending on it are not run and get
+    a BLOCKED result; unrelated jobs carry on.
+
+    :param run_job: Function running a job and returning its JobResult.
+    :return: Dict of job to JobResult, in the order of the DAG.
+    """
+    results = {}
+    waiting = {job: set(upstream) for job, upstream in dag.items()}
+
+    def block(failed_job):
+        for job in [job for job, upstream in waiting.items() if failed_job in upstream]:
+            del waiting[job]
+            results[job] = JobResult(job, BLOCKED, detail=f"{failed_job.stage} did not complete")
+            block(job)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline") as executor:
+        running = {}
+        while waiting or running:
+            for job in [job for job, upstream in waiting.items() if not upstream]:
+                del waiting[job]
+                running[executor.submit(run_job, job)] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                results[job] = future.result()
+                print(results[job])
+                if results[job].status == FAILED:
+                    block(job)
+                else:
+                    for upstream in waiting.values():
+                        upstream.discard(job)
+    return {job: results[job] for job in dag}
+
+
+class CheckpointManifest:
+    """
+    JSON file recording the completed stages of every table with the checksums of their input
+    and output. It is rewritten atomically after every completed stage, so an interrupted run
+    keeps its progress. The SHA-256 of input files is cached by size and modification time.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.data = {"version": CHECKPOINT_VERSION, "tables": {}, "files": {}}
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("version") == CHECKPOINT_VERSION:
+                self.data = data
+
+    def get(self, table_name, stage):
+        return self.data["tables"].get(table_name, {}).get(stage)
+
+    def complete(self, table_name, stage, input_checksum, output, seconds):
+        with self._lock:
+            self.data["tables"].setdefault(table_name, {})[stage] = {
+                "input": input_checksum,
+                "output": output,
+                "seconds": round(seconds, 3),
+                "completed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            self._save()
+
+    def file_checksum(self, path):
+        """
+        Hex SHA-256 of a file, computed again only when its size or modification time changed.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        cached = self.data["files"].get(str(path))
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        with self._lock:
+            self.data["files"][str(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                             "sha256": sha256.hexdigest()}
+            self._save()
+        return sha256.hexdigest()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=self.path.parent, prefix=".checkpoint-", delete=False) as file:
+            json.dump(self.data, file, indent=2)
+        os.replace(file.name, self.path)
+
+
+def checksum(values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Pipeline:
+    """
+    Loads CSV files into PostgreSQL, exports the tables to S3 as Parquet and validates the
+    exports, one job per table and stage. A stage is skipped when the checkpoint shows it
+    completed with the same input and its output is still in place:
+
+    - load: the SHA-256 of the CSV file; the table digest (row count and row-hash sum) must
+      still match, so a table changed or dropped since is loaded again.
+    - export: the table digest and the object key; the object must still have the recorded ETag.
+    - validate: the table digest, the ETag of the object and the validation mode.
+    """
+
+    def __init__(self, pool, s3, checkpoint, null_token="NULL", fast_validation=False, force=False):
+        self.pool = pool
+        self.s3 = s3
+        self.checkpoint = checkpoint
+        self.null_token = null_token
+        self.fast_validation = fast_validation
+        self.force = force
+        self._tables = {}  # Table name -> digest and ETag found by its earlier stages in this run
+
+    def run(self, dag, max_workers=4):
+        return run_dag(dag, self.run_job, max_workers)
+
+    def run_job(self, job):
+        start = time.perf_counter()
+        try:
+            status = getattr(self, f"_{job.stage}")(job, start)
+        except Exception as error:
+            return JobResult(job, FAILED, time.perf_counter() - start, f"{type(error).__name__}: {error}")
+        return JobResult(job, status, time.perf_counter() - start)
+
+    def _is_current(self, job, input_checksum, output):
+        recorded = self.checkpoint.get(job.table_name, job.stage)
+        return not self.force and output is not None and recorded is not None \
+            and recorded["input"] == input_checksum and recorded["output"] == output
+
+    def _complete(self, job, input_checksum, output, start):
+        self.checkpoint.complete(job.table_name, job.stage, input_checksum, output, time.perf_counter() - start)
+        return DONE
+
+    def _table_digest(self, table_name):
+        """The table digest as text, or None if the table does not exist."""
+        with self.pool.connection() as connection:
+            with connection.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (sql.Identifier(table_name).as_string(connection),))
+                exists = cur.fetchone()[0] is not None
+            digest = ":".join(map(str, table_digest(connection, table_name))) if exists else None
+        self._tables.setdefault(table_name, {})["digest"] = digest
+        return digest
+
+    def _known(self, table_name, name):
+        """The table 'digest' or object 'etag' seen by an earlier stage, or looked up now."""
+        known = self._tables.get(table_name, {})
+        if name in known:
+            return known[name]
+        if name == "digest":
+            return self._table_digest(table_name)
+        return self._object_etag(table_name)
+
+    def _object_etag(self, table_name):
+        existing = head_object(self.s3.s3_client, self.s3.bucket_name, self.s3.object_key(table_name))
+        etag = existing and existing["ETag"]
+        self._tables.setdefault(table_name, {})["etag"] = etag
+        return etag
+
+    def _load(self, job, start):
+        input_checksum = checksum({"csv_sha256": self.checkpoint.file_checksum(job.csv_path),
+                                   "null_token": self.null_token})
+        if self._is_current(job, input_checksum, self._table_digest(job.table_name)):
+            return SKIPPED
+        ingest_csv_file(self.pool, job.csv_path, clear_table=True, null_token=self.null_token)
+        return self._complete(job, input_checksum, self._table_digest(job.table_name), start)
+
+    def _export(self, job, start):
+        object_key = self.s3.object_key(job.table_name)
+        input_checksum = checksum({"table_digest": self._known(job.table_name, "digest"),
+                                   "bucket": self.s3.bucket_name, "object_key": object_key})
+        if self._is_current(job, input_checksum, self._object_etag(job.table_name)):
+            return SKIPPED
+        with self.pool.connection() as connection:
+            self.s3.upload_parquet(job.table_name, connection)
+        if not self.s3.validate_upload(object_key):
+            raise AssertionError(f"'{object_key}' does not match the uploaded content")
+        etag = self.s3.uploads[object_key].etag
+        self._tables[job.table_name]["etag"] = etag
+        return self._complete(job, input_checksum, etag, start)
+
+    def _validate(self, job, start):
+        input_checksum = checksum({"table_digest": self._known(job.table_name, "digest"),
+                                   "etag": self._known(job.table_name, "etag"), "fast": self.fast_validation})
+        if self._is_current(job, input_checksum, "valid"):
+            return SKIPPED
+        with self.pool.connection() as connection:
+            if self.fast_validation:
+                self.s3.validate_stats(job.table_name, connection)
+            else:
+                parquet_file = open_parquet(self.s3.s3_client, self.s3.bucket_name, self.s3.object_key(job.table_name))
+                validate_table(connection, job.table_name, parquet_file)
+        return self._complete(job, input_checksum, "valid", start)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m part_1_2",
+                                     description="Load CSV files into PostgreSQL, export them to S3 and validate "
+                                                 "the exports, skipping stages that are already done.")
+    parser.add_argument("csv_dir", help="Directory of the CSV files, one table per file")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--tables", nargs="+", help="Only run these tables (CSV file names without .csv)")
+    parser.add_argument("--checkpoint", default=CONFIG["pipeline"]["checkpoint"], help="Checkpoint manifest file")
+    parser.add_argument("--workers", type=int, default=CONFIG["pipeline"]["max_workers"],
+                        help="Jobs run at the same time")
+    parser.add_argument("--bucket", default=CONFIG["aws"]["bucket_name"])
+    parser.add_argument("--prefix", default="output", help="S3 key prefix of the Parquet exports")
+    parser.add_argument("--null-token", default="NULL", help="CSV value loaded as SQL NULL")
+    parser.add_argument("--fast-validation", action="store_true",
+                        help="Compare statistics first and only run the full comparison when they differ")
+    parser.add_argument("--force", action="store_true", help="Run every stage, ignoring the checkpoint")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dag = build_dag(get_csv_file_paths(args.csv_dir), args.stages, set(args.tables) if args.tables else None)
+    pipeline = Pipeline(get_connection_pool(), S3Client(get_s3_client(), args.bucket, prefix=args.prefix),
+                        CheckpointManifest(args.checkpoint), null_token=args.null_token,
+                        fast_validation=args.fast_validation, force=args.force)
+    results = list(pipeline.run(dag, args.workers).values())
+
+    counts = {status: sum(result.status == status for result in results)
+              for status in (DONE, SKIPPED, FAILED, BLOCKED)}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()) + f" (checkpoint: {args.checkpoint})")
+    return 1 if counts[FAILED] or counts[BLOCKED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,395 @@
-import pandas as pd
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg2 import sql
+
+from part_1_2.config.config import CONFIG
+from part_1_2.src.data_diff import create_partition_index, default_key_columns, partition_sql, table_digest, \
+    validate_table
+from part_1_2.src.table_stats import ColumnSketches, fast_validate_table
+from part_1_2.src.utils.aws_utils import S3MultipartWriter, download_parquet, download_parquet_files, head_object, \
+    open_parquet
+from part_1_2.src.utils.db_utils import fetch_query_batches, fetch_table_batches, fetch_table_schema, \
+    get_connection_pool
+from part_1_2.src.utils.instrumentation import instrumentation
+from part_1_2.src.utils.sketches import HLL_PRECISION
+
+PARTITION_COLUMN = "__partition"
+MANIFEST_NAME = "_manifest.json"
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+DATE_GRANULARITY_FORMATS = {"year": "YYYY", "month": "YYYY-MM", "day": "YYYY-MM-DD"}
+SOURCE_DIGEST_METADATA = "source-digest"
+
+
+@dataclass
+class UploadResult:
+    """
+    An uploaded (or, when its source was unchanged, skipped) object with the size and
+    ETag it must have in S3.
+    """
+    table_name: str
+    object_key: str
+    bytes: int
+    etag: str
+    skipped: bool = False
+
+
+def partition_value_sql(column, granularity=None):
+    """
+    SQL expression of the Hive partition value of a row: the column as text, or a date
+    column truncated to ``granularity`` ('year', 'month' or 'day'), e.g. '2024-03'.
+    """
+    if granularity is None:
+        return sql.SQL("{}::text").format(sql.Identifier(column))
+    if granularity not in DATE_GRANULARITY_FORMATS:
+        raise ValueError(f"Unknown granularity '{granularity}', expected one of {list(DATE_GRANULARITY_FORMATS)}")
+    return sql.SQL("to_char({}, {})").format(sql.Identifier(column), sql.Literal(DATE_GRANULARITY_FORMATS[granularity]))
+
+
+def partition_filter_sql(column, granularity, values):
+    """
+    SQL condition selecting the rows of the given partition values; None selects the NULL partition.
+    """
+    value_sql = partition_value_sql(column, granularity)
+    values = list(values)
+    conditions = [sql.SQL("{} = ANY({})").format(value_sql, sql.Literal([v for v in values if v is not None]))]
+    if None in values:
+        conditions.append(sql.SQL("{} IS NULL").format(value_sql))
+    return sql.SQL("({})").format(sql.SQL(" OR ").join(conditions))
+
+
+def _partition_runs(batches, data_schema):
+    """
+    Split batches ordered by their first column into (partition, rows) runs without that column.
+    """
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        partition_ids = batch.column(0).to_numpy(zero_copy_only=False)
+        bounds = [0, *(np.flatnonzero(partition_ids[1:] != partition_ids[:-1]) + 1), batch.num_rows]
+        for start, end in zip(bounds, bounds[1:]):
+            rows = pa.RecordBatch.from_arrays(batch.slice(start, end - start).columns[1:], schema=data_schema)
+            yield partition_ids[start], rows
+
 
 class S3Client:
-    def __init__(self, s3_client, bucket_name):
+    def __init__(self, s3_client, bucket_name, part_size=None, prefix="output", max_concurrency=None):
         self.s3_client = s3_client
         self.bucket_name = bucket_name
+        self.part_size = part_size or CONFIG["aws"]["part_size"]
+        self.max_concurrency = max_concurrency or CONFIG["aws"]["max_concurrency"]
+        self.prefix = prefix.rstrip("/")
+        self.uploads = {}  # Object key -> UploadResult of the uploads made by this client
 
-    def upload_parquet(self, table_name, db_connection):
+    def upload_parquet(self, table_name, db_connection, row_group_size=100_000, compression='snappy',
+                       skip_unchanged=True):
         """
-        Converts table data to Parquet format and uploads it to S3.
+        Streams table data to S3 as a Parquet file, with distinct-count sketches of every
+        column in its footer for validate_stats.
+
+        Rows are read through a server-side cursor ``row_group_size`` rows at a time,
+        each batch is written as one Parquet row group and the output is sent to S3
+        with a multipart upload, so memory use does not grow with the table size and
+        no local file is written.
+
+        With ``skip_unchanged``, a digest of the table content and export settings is
+        computed in PostgreSQL first (one scan of the table) and the upload is skipped when
+        the existing object carries the same digest, which costs one HEAD request instead
+        of a full transfer; otherwise the object is tagged with the digest. Without it, the
+        table is only read once, for the upload, and the object has no digest.
         """
-        query = f"SELECT * FROM {table_name}"
-        dataframe = pd.read_sql_query(query, db_connection)
-        parquet_file_path = f"{table_name}.parquet"
-        dataframe.to_parquet(parquet_file_path)
-        self.s3_client.upload_file(parquet_file_path, self.bucket_name, f"output/{parquet_file_path}")
+        s3_object_key = self.object_key(table_name)
+        with instrumentation.stage("export", table_name) as record:
+            digest = None
+            if skip_unchanged:
+                digest = self.source_digest(table_name, db_connection, row_group_size, compression)
+                existing = head_object(self.s3_client, self.bucket_name, s3_object_key)
+                if existing and existing.get("Metadata", {}).get(SOURCE_DIGEST_METADATA) == digest:
+                    self.uploads[s3_object_key] = UploadResult(table_name, s3_object_key, existing["ContentLength"],
+                                                               existing["ETag"], skipped=True)
+                    print(f"'{table_name}' is unchanged, skipped the upload of '{s3_object_key}'")
+                    return s3_object_key
+
+            schema, batches = fetch_table_batches(db_connection, table_name, batch_size=row_group_size)
+
+            with S3MultipartWriter(self.s3_client, self.bucket_name, s3_object_key, part_size=self.part_size,
+                                   max_concurrency=self.max_concurrency,
+                                   metadata={SOURCE_DIGEST_METADATA: digest} if digest else None,
+                                   table_name=table_name) as sink:
+                with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+                    sketches = ColumnSketches(schema)
+                    for batch in batches:
+                        writer.write_batch(batch, row_group_size=row_group_size)
+                        sketches.update(batch)
+                        record.rows += batch.num_rows
+                    sketches.add_to(writer)
+            record.bytes = sink.tell()
+            self.uploads[s3_object_key] = UploadResult(table_name, s3_object_key, sink.tell(), sink.etag)
 
         # Returning the key that will be used in the validation
-        return f"output/{parquet_file_path}"
+        return s3_object_key
 
-    def validate_upload(self, s3_object_key):
+    @staticmethod
+    def source_digest(table_name, db_connection, row_group_size, compression):
+        """
+        SHA-256 over the table digest, its column types and the export settings: equal
+        digests produce Parquet files with the same content.
+        """
+        rows, row_hash_sum = table_digest(db_connection, table_name)
+        source = json.dumps({
+            "rows": rows,
+            "row_hash_sum": row_hash_sum,
+            "schema": fetch_table_schema(db_connection, table_name),
+            "row_group_size": row_group_size,
+            "compression": compression,
+            "sketch_precision": HLL_PRECISION,
+            "pyarrow": pa.__version__,
+        })
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def upload_tables(self, table_names, pool=None, max_workers=4, **kwargs):
+        """
+        Upload several tables at the same time, each on its own pooled connection.
+
+        :param kwargs: Passed to upload_parquet.
+        :return: Dict of table name to object key.
+        """
+        pool = pool or get_connection_pool()
+
+        def upload(table_name):
+            with pool.connection() as connection:
+                return self.upload_parquet(table_name, connection, **kwargs)
+
+        table_names = list(table_names)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload") as executor:
+            return dict(zip(table_names, executor.map(upload, table_names)))
+
+    def download_tables(self, table_names, max_workers=4, columns=None, as_pandas=False):
+        """
+        Download the Parquet exports of several tables at the same time.
+
+        :return: Dict of table name to Arrow table, or to DataFrame with ``as_pandas``.
+        """
+        table_names = list(table_names)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download") as executor:
+            tables = executor.map(lambda table_name: download_parquet(
+                self.s3_client, self.bucket_name, self.object_key(table_name), columns=columns, as_pandas=as_pandas,
+                table_name=table_name
+            ), table_names)
+            return dict(zip(table_names, tables))
+
+    def object_key(self, table_name):
+        return f"{self.prefix}/{table_name}.parquet"
+
+    def partition_object_key(self, table_name, partition):
+        return f"{self.prefix}/{table_name}/bucket={partition}/data.parquet"
+
+    def upload_parquet_partitions(self, table_name, db_connection, key_columns=None, num_partitions=64,
+                                  partitions=None, row_group_size=100_000, compression='snappy'):
+        """
+        Streams table data to S3 as one Parquet file per hash partition.
+
+        Rows are assigned to partitions like in the diff engine and the change tracker.
+        When ``partitions`` is given, only those partitions are re-exported, which is
+        how small changes recorded by a ChangeTracker are published. The partition
+        expression is indexed on the first export (see create_partition_index), so these
+        exports and the validation of the same partitions do not scan the whole table.
+        Partitions without rows are written as empty files so every partition object
+        always exists.
+
+        :return: The keys of the written objects.
         """
-        Validates that the Parquet file was uploaded to S3.
+        with instrumentation.stage("export", table_name) as record:
+            key_columns = key_columns or default_key_columns(db_connection, table_name)
+            create_partition_index(table_name, key_columns, num_partitions)
+            partitions = sorted(set(partitions)) if partitions is not None else list(range(num_partitions))
+            partition = partition_sql(key_columns, num_partitions)
+            query = sql.SQL("SELECT {partition} AS {column}, * FROM {table} WHERE {partition} = ANY(%s) ORDER BY 1").format(
+                partition=partition, column=sql.Identifier(PARTITION_COLUMN), table=sql.Identifier(table_name)
+            )
+            schema, batches = fetch_query_batches(db_connection, query, (partitions,), batch_size=row_group_size)
+            data_schema = schema.remove(0)
+
+            pending = _partition_runs(batches, data_schema)
+            next_slice = next(pending, None)
+            keys = []
+            for partition_id in partitions:
+                key = self.partition_object_key(table_name, partition_id)
+                with S3MultipartWriter(self.s3_client, self.bucket_name, key, part_size=self.part_size,
+                                       max_concurrency=self.max_concurrency, table_name=table_name) as sink:
+                    with pq.ParquetWriter(sink, data_schema, compression=compression) as writer:
+                        sketches = ColumnSketches(data_schema)
+                        while next_slice is not None and next_slice[0] == partition_id:
+                            writer.write_batch(next_slice[1], row_group_size=row_group_size)
+                            sketches.update(next_slice[1])
+                            record.rows += next_slice[1].num_rows
+                            next_slice = next(pending, None)
+                        sketches.add_to(writer)
+                    record.bytes += sink.tell()
+                keys.append(key)
+        return keys
+
+    def open_partitions(self, table_name, partitions):
+        """
+        Open the Parquet files of the given hash partitions for lazy, ranged reads.
+        """
+        return [open_parquet(self.s3_client, self.bucket_name, self.partition_object_key(table_name, partition))
+                for partition in sorted(partitions)]
+
+    @staticmethod
+    def partition_key_name(partition_column, granularity=None):
+        return partition_column if granularity is None else f"{partition_column}_{granularity}"
+
+    def dataset_prefix(self, table_name, partition_key):
+        return f"{self.prefix}/{table_name}/by_{partition_key}"
+
+    def dataset_object_key(self, table_name, partition_key, value):
+        path_value = HIVE_DEFAULT_PARTITION if value is None else quote(str(value), safe="")
+        return f"{self.dataset_prefix(table_name, partition_key)}/{partition_key}={path_value}/data.parquet"
+
+    def upload_parquet_dataset(self, table_name, db_connection, partition_column, granularity=None,
+                               partitions=None, row_group_size=100_000, compression='snappy'):
+        """
+        Streams table data to S3 as a Hive-style partitioned dataset with one Parquet file
+        per value of ``partition_column`` (or per year, month or day of a date column with
+        ``granularity``), e.g. ``output/lab_tests/by_order_date_month/order_date_month=2024-03/data.parquet``.
+
+        A ``_manifest.json`` next to the partitions lists the key, row count, size and SHA-256
+        of every partition file. When ``partitions`` (partition values) is given, only those
+        partitions are re-exported and merged into the existing manifest. Partitions that no
+        longer have rows are deleted.
+
+        :return: The manifest.
         """
-        response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=s3_object_key)
-        s3_objects = response.get('Contents', [])
-        is_uploaded = any(obj['Key'] == s3_object_key for obj in s3_objects)
-        return is_uploaded
+        partition_key = self.partition_key_name(partition_column, granularity)
+        row_filter = partition_filter_sql(partition_column, granularity, partitions) \
+            if partitions is not None else sql.SQL("true")
+        query = sql.SQL("SELECT {value} AS {column}, * FROM {table} WHERE {row_filter} ORDER BY 1").format(
+            value=partition_value_sql(partition_column, granularity), column=sql.Identifier(PARTITION_COLUMN),
+            table=sql.Identifier(table_name), row_filter=row_filter
+        )
+        previous = self.read_manifest(table_name, partition_key)
+        previous_entries = {entry["value"]: entry for entry in previous["partitions"]} if previous else {}
+
+        written = {}
+        with instrumentation.stage("export", table_name) as record:
+            schema, batches = fetch_query_batches(db_connection, query, batch_size=row_group_size)
+            data_schema = schema.remove(0)
+
+            for value, runs in groupby(_partition_runs(batches, data_schema), key=itemgetter(0)):
+                key = self.dataset_object_key(table_name, partition_key, value)
+                rows = 0
+                with S3MultipartWriter(self.s3_client, self.bucket_name, key, part_size=self.part_size,
+                                       max_concurrency=self.max_concurrency, table_name=table_name) as sink:
+                    with pq.ParquetWriter(sink, data_schema, compression=compression) as writer:
+                        sketches = ColumnSketches(data_schema)
+                        for _, batch in runs:
+                            writer.write_batch(batch, row_group_size=row_group_size)
+                            sketches.update(batch)
+                            rows += batch.num_rows
+                        sketches.add_to(writer)
+                written[value] = {"value": value, "key": key, "rows": rows, "bytes": sink.tell(),
+                                  "sha256": sink.sha256}
+                record.rows += rows
+                record.bytes += sink.tell()
+
+        replaced = set(previous_entries) if partitions is None else set(partitions)
+        for value in replaced - set(written):
+            if value in previous_entries:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=previous_entries[value]["key"])
+        entries = {value: entry for value, entry in previous_entries.items() if value not in replaced}
+        entries.update(written)
 
+        manifest = {
+            "table": table_name,
+            "partition_column": partition_column,
+            "granularity": granularity,
+            "partition_key": partition_key,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "rows": sum(entry["rows"] for entry in entries.values()),
+            "partitions": sorted(entries.values(), key=lambda entry: (entry["value"] is not None, entry["value"] or "")),
+        }
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=f"{self.dataset_prefix(table_name, partition_key)}/"
+                                  f"{MANIFEST_NAME}", Body=json.dumps(manifest, indent=2).encode())
+        return manifest
 
+    def read_manifest(self, table_name, partition_key):
+        """
+        The manifest of a partitioned dataset, or None if the dataset was not exported.
+        """
+        key = f"{self.dataset_prefix(table_name, partition_key)}/{MANIFEST_NAME}"
+        try:
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(body)
+
+    @staticmethod
+    def dataset_entries(manifest, partitions=None):
+        """
+        Manifest entries of the given partition values, or of all partitions.
+        """
+        if partitions is None:
+            return list(manifest["partitions"])
+        partitions = set(partitions)
+        return [entry for entry in manifest["partitions"] if entry["value"] in partitions]
+
+    def open_dataset(self, manifest, partitions=None):
+        """
+        Open the Parquet files of the selected partitions for lazy, ranged reads.
+        """
+        return [open_parquet(self.s3_client, self.bucket_name, entry["key"])
+                for entry in self.dataset_entries(manifest, partitions)]
+
+    def download_dataset(self, manifest, partitions=None, columns=None, filters=None, as_pandas=False):
+        """
+        Read only the selected partitions of a dataset into an Arrow table (a DataFrame with ``as_pandas``).
+        """
+        keys = [entry["key"] for entry in self.dataset_entries(manifest, partitions)]
+        return download_parquet_files(self.s3_client, self.bucket_name, keys, columns=columns, filters=filters,
+                                      as_pandas=as_pandas, table_name=manifest["table"])
+
+    def validate_dataset(self, db_connection, manifest, partitions=None, key_columns=None, fast=False):
+        """
+        Validates the selected partitions of a dataset against the matching table rows only,
+        so a check of a few partitions reads a few partition files and not the whole table.
+        With ``fast``, only statistics are compared first, see fast_validate_table.
+        """
+        row_filter = None
+        if partitions is not None:
+            row_filter = partition_filter_sql(manifest["partition_column"], manifest["granularity"], partitions)
+        validate = fast_validate_table if fast else validate_table
+        return validate(db_connection, manifest["table"], self.open_dataset(manifest, partitions),
+                        key_columns=key_columns, row_filter=row_filter)
+
+    def validate_stats(self, table_name, db_connection, escalate=True):
+        """
+        Quick check of the Parquet export of a table: statistics computed in PostgreSQL against
+        those in the footer, which is fetched with ranged reads. A full comparison only runs
+        when a statistic disagrees, see fast_validate_table.
+        """
+        parquet_file = open_parquet(self.s3_client, self.bucket_name, self.object_key(table_name))
+        return fast_validate_table(db_connection, table_name, parquet_file, escalate=escalate)
+
+    def validate_upload(self, s3_object_key):
+        """
+        Validates that the Parquet file was uploaded to S3 with a single HEAD request.
+        For objects uploaded by this client, the size and ETag (content checksum) must
+        also match what was written.
+        """
+        response = head_object(self.s3_client, self.bucket_name, s3_object_key)
+        if response is None:
+            return False
+        upload = self.uploads.get(s3_object_key)
+        if upload is None:
+            return True
+        return response["ContentLength"] == upload.bytes and response["ETag"] == upload.etag
@@ -0,0 +1,86 @@
+import threading
+from collections import defaultdict
+
+from part_1_2.src.utils import db_utils
+
+CATALOG_QUERY = """
+    SELECT table_name, column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, ordinal_position;
+"""
+
+
+class SchemaCatalog:
+    """
+    Cache of the column names and types of every table in the current schema.
+
+    All tables are loaded with one batched catalog query, on first use and again
+    whenever a table that is not cached is requested. Code that runs DDL must call
+    ``invalidate`` for the tables it changed.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._tables = None
+        self._lock = threading.Lock()
+
+    def load(self, connection=None):
+        """
+        (Re)load all table schemas. Without a connection, one is borrowed from the pool.
+        """
+        if connection is None:
+            with (self._pool or db_utils.get_connection_pool()).connection() as pooled_connection:
+                return self.load(pooled_connection)
+        with connection.cursor() as cur:
+            cur.execute(CATALOG_QUERY)
+            rows = cur.fetchall()
+        tables = defaultdict(list)
+        for table_name, column_name, data_type in rows:
+            tables[table_name].append((column_name, data_type))
+        with self._lock:
+            self._tables = dict(tables)
+
+    def table_schema(self, table_name, connection=None):
+        """
+        Column names and data types of the table, like ``fetch_table_schema``.
+        An unknown table yields an empty list.
+        """
+        with self._lock:
+            cached = self._tables.get(table_name) if self._tables is not None else None
+        if cached is None:
+            self.load(connection)
+            with self._lock:
+                cached = self._tables.get(table_name, [])
+        return list(cached)
+
+    def column_names(self, table_name, connection=None):
+        return [column_name for column_name, _ in self.table_schema(table_name, connection)]
+
+    def table_names(self, connection=None):
+        with self._lock:
+            loaded = self._tables is not None
+        if not loaded:
+            self.load(connection)
+        with self._lock:
+            return sorted(self._tables)
+
+    def invalidate(self, table_name=None):
+        """
+        Drop a table, or the whole catalog, from the cache after DDL.
+        """
+        with self._lock:
+            if table_name is None:
+                self._tables = None
+            elif self._tables is not None:
+                self._tables.pop(table_name, None)
+
+
+_catalog = SchemaCatalog()
+
+
+def get_schema_catalog():
+    """
+    Return the process-wide schema catalog.
+    """
+    return _catalog
@@ -1,80 +1,74 @@
-import csv
 import os
-from typing import List, Tuple
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
 from pathlib import Path
-from part_1_2.src.utils.db_utils import get_db_connection
+from part_1_2.src.schema_catalog import get_schema_catalog
+from part_1_2.src.type_inference import ColumnTypeInferrer, DATE_FORMATS, NUMERIC_PATTERN
+from part_1_2.src.utils.db_utils import get_connection_pool
+from part_1_2.src.utils.instrumentation import instrumentation
 
 
 class TableCreator:
-    def __init__(self, db_connection=None):
-        self.conn = db_connection or get_db_connection()
+    def __init__(self, db_connection=None, null_tokens=("NULL",)):
+        # Without an explicit connection, one is borrowed from the shared pool and returned by close()
+        self._pool = None if db_connection else get_connection_pool()
+        self.conn = db_connection or self._pool.getconn()
+        self.null_tokens = tuple(null_tokens)
+        self.last_inference = None
 
     @staticmethod
     def is_float(value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+        return re.fullmatch(NUMERIC_PATTERN, value) is not None
 
     @staticmethod
     def is_date(value: str) -> bool:
-        try:
-            from datetime import datetime
-            datetime.strptime(value, "%Y-%m-%d")
-            return True
-        except ValueError:
-            return False
+        for pattern, date_format in DATE_FORMATS.items():
+            if re.fullmatch(pattern, value):
+                try:
+                    datetime.strptime(value, date_format)
+                except ValueError:
+                    return False
+                return True
+        return False
 
     # Function to automatically determine column data types from the CSV file
-    def infer_column_types(self, csv_file_path: str) -> List[Tuple[str, str]]:
-        column_types = []
-        with open(csv_file_path, 'r') as file:
-            reader = csv.reader(file)
-            headers = next(reader)  # Read header row to get column names
+    def infer_column_types(self, csv_file_path: str, sample_rows: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Infer the PostgreSQL type of every column in the CSV file.
 
-            # Try to infer the type of each column based on the first data row
-            for row in reader:
-                for i, value in enumerate(row):
-                    if value.isdigit():
-                        col_type = "INT"
-                    elif self.is_float(value):
-                        col_type = "FLOAT"
-                    elif self.is_date(value):
-                        col_type = "DATE"
-                    else:
-                        col_type = "VARCHAR(255)"
-
-                    # If it's the first row, initialize column types
-                    if len(column_types) < len(headers):
-                        column_types.append((headers[i], col_type))
-                    else:
-                        # Check if the inferred type is consistent across rows
-                        if column_types[i][1] != col_type:
-                            column_types[i] = (
-                            headers[i], "VARCHAR(255)")  # Fallback to VARCHAR if types are inconsistent
-
-        return column_types
+        The file is classified column-wise in chunks (see ColumnTypeInferrer). Pass
+        ``sample_rows`` to only inspect the first rows of very large files.
+        The inference report is kept in ``self.last_inference``.
+        """
+        inferrer = ColumnTypeInferrer(sample_rows=sample_rows, null_tokens=self.null_tokens)
+        self.last_inference = inferrer.infer(csv_file_path)
+        print(f"{Path(csv_file_path).name}: {self.last_inference}")
+        return self.last_inference.column_types
 
     # Function to create the table dynamically based on the CSV
     def create_table_from_csv(self, csv_file_path):
-        # Infer the column types from the CSV
-        column_types = self.infer_column_types(csv_file_path)
         table_name = Path(csv_file_path).stem
+        with instrumentation.stage("create_table", table_name) as record:
+            # Infer the column types from the CSV
+            column_types = self.infer_column_types(csv_file_path)
+            record.rows = self.last_inference.rows_scanned
+            record.bytes = os.path.getsize(csv_file_path)
 
-        # Construct the CREATE TABLE SQL statement
-        create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ("
-        for col_name, col_type in column_types:
-            create_table_sql += f"{col_name} {col_type}, "
+            # Construct the CREATE TABLE SQL statement
+            create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ("
+            for col_name, col_type in column_types:
+                create_table_sql += f"{col_name} {col_type}, "
 
-        # Remove the trailing comma and space, then close the parentheses
-        create_table_sql = create_table_sql.rstrip(", ") + ");"
+            # Remove the trailing comma and space, then close the parentheses
+            create_table_sql = create_table_sql.rstrip(", ") + ");"
 
-        # Create the table
-        cur = self.conn.cursor()
-        cur.execute(create_table_sql)
-        self.conn.commit()
-        cur.close()
+            # Create the table
+            cur = self.conn.cursor()
+            cur.execute(create_table_sql)
+            self.conn.commit()
+            cur.close()
+            get_schema_catalog().invalidate(table_name)
 
         print(f"Table '{table_name}' created successfully.")
 
@@ -82,4 +76,8 @@ class TableCreator:
         with self.conn.cursor() as cur:
             cur.execute(f"DELETE FROM {table_name}")  # Clear the table after each test
             self.conn.commit()
-            print(f"Table '{table_name}' cleared")
\ No newline at end of file
+            print(f"Table '{table_name}' cleared")
+
+    def close(self):
+        if self._pool:
+            self._pool.putconn(self.conn)
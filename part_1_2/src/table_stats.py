@@ -0,0 +1,260 @@
+import json
+import math
+import time
+from decimal import Decimal
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+from psycopg2 import sql
+
+from part_1_2.src.data_diff import DiffResult, canonical_text, diff_table
+from part_1_2.src.utils.db_utils import fetch_table_schema
+from part_1_2.src.utils.instrumentation import instrumentation
+from part_1_2.src.utils.sketches import HLL_PRECISION, HyperLogLog
+
+SKETCH_METADATA = b"hll"  # Parquet footer key of the distinct-count sketches of every column
+TEXT_TYPES = {"character varying", "text"}
+HLL_MASK = (1 << (64 - HLL_PRECISION)) - 1
+
+
+@dataclass
+class ColumnStats:
+    """
+    Null count, min and max (in PostgreSQL text form, None when not compared) and the
+    distinct-count sketch of a column.
+    """
+    null_count: Optional[int] = None
+    min: Optional[str] = None
+    max: Optional[str] = None
+    sketch: Optional[HyperLogLog] = None
+
+
+@dataclass
+class TableStats:
+    rows: int
+    columns: Dict[str, ColumnStats] = field(default_factory=dict)
+
+
+@dataclass
+class StatsValidationResult:
+    """
+    Outcome of a statistics check. ``diff`` is the full comparison that was run because
+    a statistic disagreed, if any.
+    """
+    table_name: str
+    mismatches: List[str]
+    seconds: float
+    diff: Optional[DiffResult] = None
+
+    @property
+    def is_valid(self):
+        return not self.mismatches or (self.diff is not None and self.diff.is_equal)
+
+    def __str__(self):
+        if not self.mismatches:
+            return f"'{self.table_name}': statistics match ({self.seconds:.3f}s)"
+        return (f"'{self.table_name}': {len(self.mismatches)} statistics differ ({'; '.join(self.mismatches[:3])}), "
+                f"full comparison: {self.diff}")
+
+
+def has_comparable_min_max(arrow_type, data_type):
+    """
+    Whether Parquet min/max statistics of a column order like PostgreSQL min/max: numbers,
+    dates, times and timestamps without time zone, and text compared by bytes (COLLATE "C").
+    Floats (NaN) and booleans are left out.
+    """
+    if pa.types.is_integer(arrow_type) or pa.types.is_decimal(arrow_type) or pa.types.is_date(arrow_type) \
+            or pa.types.is_time(arrow_type):
+        return True
+    if pa.types.is_timestamp(arrow_type):
+        return arrow_type.tz is None
+    return pa.types.is_string(arrow_type) and data_type in TEXT_TYPES
+
+
+class ColumnSketches:
+    """
+    Distinct-count sketches of every column of the batches written to a Parquet file,
+    stored in its footer by ``add_to(writer)``.
+    """
+
+    def __init__(self, schema):
+        self.sketches = {name: HyperLogLog() for name in schema.names}
+
+    def update(self, batch):
+        for name, column in zip(batch.schema.names, batch.columns):
+            self.sketches[name].add_array(column)
+
+    def add_to(self, writer):
+        sketches = {name: sketch.to_base64() for name, sketch in self.sketches.items()}
+        writer.add_key_value_metadata({SKETCH_METADATA: json.dumps({"precision": HLL_PRECISION, "columns": sketches})})
+
+
+def parquet_stats(parquet_files) -> TableStats:
+    """
+    Table statistics from the footers of Parquet files: row count, and per column the null
+    count and min/max of the row group statistics and the merged sketches. No data pages are read.
+    """
+    parquet_files = parquet_files if isinstance(parquet_files, (list, tuple)) else [parquet_files]
+    stats = TableStats(rows=0)
+    unsketched = set()
+    for parquet_file in parquet_files:
+        metadata = parquet_file.metadata
+        stats.rows += metadata.num_rows
+        names = parquet_file.schema_arrow.names
+        for name in names:
+            stats.columns.setdefault(name, ColumnStats(null_count=0))
+
+        for row_group in range(metadata.num_row_groups):
+            row_group_metadata = metadata.row_group(row_group)
+            for index, name in enumerate(names):
+                column = stats.columns[name]
+                statistics = row_group_metadata.column(index).statistics
+                if statistics is None or column.null_count is None:
+                    column.null_count = None
+                    continue
+                column.null_count += statistics.null_count
+                if statistics.has_min_max:
+                    arrow_type = parquet_file.schema_arrow.field(name).type
+                    low, high = (canonical_text(pa.array([value], arrow_type))[0]
+                                 for value in (statistics.min, statistics.max))
+                    column.min = low if column.min is None else min(column.min, low, key=_sort_key(arrow_type))
+                    column.max = high if column.max is None else max(column.max, high, key=_sort_key(arrow_type))
+
+        sketches = json.loads((metadata.metadata or {}).get(SKETCH_METADATA, b"null")) or {"columns": {}}
+        for name in names:
+            if name not in sketches["columns"]:
+                unsketched.add(name)  # One file without a sketch leaves the column's distinct count unchecked
+            elif name not in unsketched:
+                sketch = HyperLogLog.from_base64(sketches["columns"][name], sketches["precision"])
+                if stats.columns[name].sketch is None:
+                    stats.columns[name].sketch = sketch
+                else:
+                    stats.columns[name].sketch.merge(sketch)
+    for name in unsketched:
+        stats.columns[name].sketch = None
+    return stats
+
+
+def _sort_key(arrow_type):
+    """Order of canonical texts of a type, to merge the min/max of several row groups."""
+    if pa.types.is_integer(arrow_type) or pa.types.is_decimal(arrow_type):
+        return Decimal
+    if pa.types.is_string(arrow_type):
+        return lambda text: text.encode()
+    return lambda text: text  # ISO dates, times and timestamps sort as text
+
+
+def stats_query(table_name, columns, min_max_columns, row_filter=None):
+    """
+    One aggregate query for the row count, and per column the non-null count, min/max and
+    HyperLogLog registers. Each row is paired with one hash per column through a LATERAL VALUES
+    list, and GROUPING SETS aggregate the (column, register) groups and the table totals in the
+    same scan; the totals only look at the first copy of each row.
+    """
+    hashes = [sql.SQL("({}, ('x' || substr(md5(t.{}::text), 1, 16))::bit(64)::bigint)").format(
+        sql.Literal(index), sql.Identifier(column)) for index, column in enumerate(columns)]
+    first_copy = sql.SQL("FILTER (WHERE v.__column_index = 0)")
+    totals = [sql.SQL("count(*) {}").format(first_copy)]
+    for column in columns:
+        totals.append(sql.SQL("count(t.{}) {}").format(sql.Identifier(column), first_copy))
+        for aggregate in ("min", "max"):
+            if column in min_max_columns:
+                collate = sql.SQL(' COLLATE "C"') if min_max_columns[column] else sql.SQL("")
+                totals.append(sql.SQL("({}(t.{}{}) {})::text").format(
+                    sql.SQL(aggregate), sql.Identifier(column), collate, first_copy))
+            else:
+                totals.append(sql.SQL("NULL"))
+    bucket = sql.SQL("(v.__hash >> {}) & {}").format(
+        sql.Literal(64 - HLL_PRECISION), sql.Literal((1 << HLL_PRECISION) - 1))
+    rank = sql.SQL("max({} - length(ltrim((v.__hash & {})::bit({})::text, '0')))").format(
+        sql.Literal(65 - HLL_PRECISION), sql.Literal(HLL_MASK), sql.Literal(64 - HLL_PRECISION))
+    return sql.SQL(
+        "SELECT GROUPING(v.__column_index), v.__column_index, {bucket}, {rank}, {totals} "
+        "FROM {table} AS t CROSS JOIN LATERAL (VALUES {hashes}) AS v(__column_index, __hash) "
+        "WHERE {row_filter} GROUP BY GROUPING SETS ((v.__column_index, {bucket}), ())"
+    ).format(bucket=bucket, rank=rank, totals=sql.SQL(", ").join(totals), table=sql.Identifier(table_name),
+             hashes=sql.SQL(", ").join(hashes), row_filter=row_filter if row_filter is not None else sql.SQL("true"))
+
+
+def db_stats(connection, table_name, min_max_columns, row_filter=None) -> TableStats:
+    """
+    Table statistics computed in PostgreSQL with stats_query.
+
+    :param min_max_columns: Dict of the columns whose min/max are compared to whether they are text.
+    """
+    columns = [name for name, _ in fetch_table_schema(connection, table_name)]
+    with connection.cursor() as cur:
+        cur.execute(stats_query(table_name, columns, min_max_columns, row_filter))
+        rows = cur.fetchall()
+
+    sketches = {index: HyperLogLog() for index in range(len(columns))}
+    totals = None
+    for is_total, column_index, bucket, rank, *values in rows:
+        if is_total:
+            totals = values
+        elif bucket is not None:
+            sketches[column_index].set_registers([bucket], [rank])
+    stats = TableStats(rows=totals[0] or 0)
+    for index, name in enumerate(columns):
+        count, low, high = totals[1 + 3 * index:4 + 3 * index]
+        stats.columns[name] = ColumnStats(stats.rows - (count or 0), low, high, sketches[index])
+    return stats
+
+
+def compare_stats(db, parquet, tolerance_sigmas=3.0) -> List[str]:
+    """
+    Statistics that disagree between the table and its Parquet export. Distinct counts are
+    estimated with independent hashes on both sides, so they may differ by ``tolerance_sigmas``
+    standard errors of their difference.
+    """
+    mismatches = []
+    if db.rows != parquet.rows:
+        mismatches.append(f"rows: {db.rows} in the table, {parquet.rows} in Parquet")
+    if set(db.columns) != set(parquet.columns):
+        mismatches.append(f"columns: {sorted(db.columns)} in the table, {sorted(parquet.columns)} in Parquet")
+    for name in sorted(set(db.columns) & set(parquet.columns)):
+        ours, theirs = db.columns[name], parquet.columns[name]
+        if theirs.null_count is not None and ours.null_count != theirs.null_count:
+            mismatches.append(f"{name} nulls: {ours.null_count} in the table, {theirs.null_count} in Parquet")
+        for bound in ("min", "max"):
+            if getattr(ours, bound) is not None and getattr(ours, bound) != getattr(theirs, bound):
+                mismatches.append(f"{name} {bound}: {getattr(ours, bound)} in the table, "
+                                  f"{getattr(theirs, bound)} in Parquet")
+        if ours.sketch is not None and theirs.sketch is not None:
+            expected, actual = ours.sketch.estimate(), theirs.sketch.estimate()
+            allowed = tolerance_sigmas * math.sqrt(2) * ours.sketch.relative_error * max(expected, actual)
+            if abs(expected - actual) > max(allowed, 1.0):
+                mismatches.append(f"{name} distinct: ~{expected:,.0f} in the table, ~{actual:,.0f} in Parquet")
+    return mismatches
+
+
+def fast_validate_table(connection, table_name, parquet_files, row_filter=None, escalate=True, key_columns=None):
+    """
+    Validates a table against its Parquet export by statistics only: row count, null counts,
+    min/max and approximate distinct counts from one aggregate query against the Parquet footers.
+    When a statistic disagrees and ``escalate`` is set, the full comparison of diff_table decides.
+    Raises an AssertionError describing the differences if the data does not match.
+
+    :param row_filter: SQL condition limiting the table to the exported rows, see validate_table.
+    """
+    with instrumentation.stage("validation", table_name):
+        start = time.perf_counter()
+        parquet_files = parquet_files if isinstance(parquet_files, (list, tuple)) else [parquet_files]
+        parquet = parquet_stats(parquet_files)
+        data_types = dict(fetch_table_schema(connection, table_name))
+        arrow_schema = parquet_files[0].schema_arrow if parquet_files else pa.schema([])
+        min_max_columns = {
+            name: data_types.get(name) in TEXT_TYPES for name in arrow_schema.names
+            if has_comparable_min_max(arrow_schema.field(name).type, data_types.get(name))
+        }
+        mismatches = compare_stats(db_stats(connection, table_name, min_max_columns, row_filter), parquet)
+        result = StatsValidationResult(table_name, mismatches, time.perf_counter() - start)
+
+    if mismatches and escalate:
+        result.diff = diff_table(connection, table_name, parquet_files, key_columns, row_filter=row_filter)
+    if not result.is_valid:
+        samples = (result.diff.missing + result.diff.extra + result.diff.changed)[:5] if result.diff else []
+        raise AssertionError(f"Data validation failed: {result}. First differences: {samples}")
+    print(f"Validation successful: {result}")
+    return result
@@ -0,0 +1,178 @@
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+VARCHAR_LIMIT = 255
+
+# Whole-value patterns, applied to a column at once with Series.str.fullmatch
+INT_PATTERN = r"[+-]?\d+"
+NUMERIC_PATTERN = r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+ISO_DATE_PATTERN = r"\d{4}-\d{1,2}-\d{1,2}"
+US_DATE_PATTERN = r"\d{1,2}/\d{1,2}/\d{4}"
+TIME_24H_PATTERN = r"(?:[01]?\d|2[0-3]):[0-5]\d(?::[0-5]\d(?:\.\d+)?)?"
+TIME_12H_PATTERN = r"(?:0?[1-9]|1[0-2]):[0-5]\d(?::[0-5]\d)?\s?[AaPp][Mm]"
+
+DATE_FORMATS = {
+    ISO_DATE_PATTERN: "%Y-%m-%d",
+    US_DATE_PATTERN: "%m/%d/%Y",
+}
+
+# Type lattice. Numeric types widen along INT -> BIGINT -> NUMERIC, anything
+# that cannot be reconciled falls back to a character type.
+UNKNOWN = "UNKNOWN"
+INT = "INT"
+BIGINT = "BIGINT"
+NUMERIC = "NUMERIC"
+DATE = "DATE"
+TIME = "TIME"
+STRING = "STRING"
+
+NUMERIC_CHAIN = [INT, BIGINT, NUMERIC]
+
+
+def widen(current: str, new: str) -> str:
+    """
+    Return the narrowest type that can hold values of both given types.
+    """
+    if current == UNKNOWN:
+        return new
+    if new == UNKNOWN or current == new:
+        return current
+    if current in NUMERIC_CHAIN and new in NUMERIC_CHAIN:
+        return max(current, new, key=NUMERIC_CHAIN.index)
+    return STRING
+
+
+@dataclass
+class InferenceResult:
+    """
+    Outcome of a type inference run over a CSV file.
+    """
+    column_types: List[Tuple[str, str]]
+    rows_scanned: int
+    elapsed_seconds: float
+    sampled: bool = False
+
+    def __str__(self):
+        mode = "sampled" if self.sampled else "scanned"
+        return (f"Inferred {len(self.column_types)} column types, {mode} {self.rows_scanned} rows "
+                f"in {self.elapsed_seconds:.3f}s")
+
+
+@dataclass
+class _ColumnState:
+    type: str = UNKNOWN
+    max_length: int = 0
+
+
+@dataclass
+class ColumnTypeInferrer:
+    """
+    Infers PostgreSQL column types from a CSV file.
+
+    The file is read in chunks of ``chunk_size`` rows and every column of a chunk
+    is classified at once with vectorized string matching. Types are widened
+    across chunks. When ``sample_rows`` is set, only the first ``sample_rows``
+    data rows are inspected.
+    """
+    sample_rows: Optional[int] = None
+    chunk_size: int = 100_000
+    null_tokens: Tuple[str, ...] = ("NULL",)
+
+    def infer(self, csv_file_path) -> InferenceResult:
+        start = time.perf_counter()
+        rows_scanned = 0
+        headers = None
+        states = {}
+
+        for chunk in self._read_chunks(csv_file_path):
+            if headers is None:
+                headers = list(chunk.columns)
+                states = {name: _ColumnState() for name in headers}
+            for name in headers:
+                self._update(states[name], chunk[name])
+            rows_scanned += len(chunk)
+
+        if headers is None:
+            headers = list(pd.read_csv(csv_file_path, nrows=0).columns)
+            states = {name: _ColumnState() for name in headers}
+
+        column_types = [(name, self._to_sql_type(states[name])) for name in headers]
+        return InferenceResult(
+            column_types=column_types,
+            rows_scanned=rows_scanned,
+            elapsed_seconds=time.perf_counter() - start,
+            sampled=self.sample_rows is not None,
+        )
+
+    def _read_chunks(self, csv_file_path) -> Iterable[pd.DataFrame]:
+        reader = pd.read_csv(
+            csv_file_path,
+            dtype=str,
+            keep_default_na=False,
+            na_filter=False,
+            nrows=self.sample_rows,
+            chunksize=self.chunk_size,
+        )
+        with reader:
+            yield from reader
+
+    def _update(self, state: _ColumnState, values: pd.Series):
+        values = values[~values.isin(self.null_tokens)]
+        if values.empty:
+            return
+        state.max_length = max(state.max_length, int(values.str.len().max()))
+        if state.type != STRING:
+            state.type = widen(state.type, self.classify(values))
+
+    @staticmethod
+    def classify(values: pd.Series) -> str:
+        """
+        Classify a non-empty series of non-null strings as a single type.
+        """
+        if values.str.fullmatch(INT_PATTERN).all():
+            return ColumnTypeInferrer._integer_type(values)
+        if values.str.fullmatch(NUMERIC_PATTERN).all():
+            return NUMERIC
+        if ColumnTypeInferrer._all_dates(values):
+            return DATE
+        if (values.str.fullmatch(TIME_24H_PATTERN) | values.str.fullmatch(TIME_12H_PATTERN)).all():
+            return TIME
+        return STRING
+
+    @staticmethod
+    def _integer_type(values: pd.Series) -> str:
+        digits = values.str.lstrip("+-").str.lstrip("0").str.len()
+        if (digits > 19).any():
+            return NUMERIC
+        # Up to 18 digits always fits in int64, only the rare 19 digit values need exact checks
+        if (digits == 19).any():
+            if any(not INT64_MIN <= int(v) <= INT64_MAX for v in values[digits == 19]):
+                return NUMERIC
+            return BIGINT
+        numbers = values.astype("int64")
+        if numbers.min() < INT32_MIN or numbers.max() > INT32_MAX:
+            return BIGINT
+        return INT
+
+    @staticmethod
+    def _all_dates(values: pd.Series) -> bool:
+        matched = pd.Series(False, index=values.index)
+        for pattern, date_format in DATE_FORMATS.items():
+            mask = values.str.fullmatch(pattern)
+            if mask.any():
+                parsed = pd.to_datetime(values[mask], format=date_format, errors="coerce")
+                if parsed.isna().any():
+                    return False
+                matched |= mask
+        return bool(matched.all())
+
+    @staticmethod
+    def _to_sql_type(state: _ColumnState) -> str:
+        if state.type in (UNKNOWN, STRING):
+            return f"VARCHAR({VARCHAR_LIMIT})" if state.max_length <= VARCHAR_LIMIT else "TEXT"
+        return state.type
@@ -1,16 +1,407 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import boto3
-import pandas as pd
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from part_1_2.config.config import CONFIG
+from part_1_2.src.utils.instrumentation import instrumentation
+from part_1_2.src.utils.object_store import MIN_PART_SIZE, open_object_store
+
+_session = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_boto3_session():
+    """
+    Return the process-wide boto3 session, creating it on first use.
+    """
+    global _session
+    with _clients_lock:
+        if _session is None:
+            _session = boto3.session.Session(
+                aws_access_key_id=CONFIG["aws"]["access_key"],
+                aws_secret_access_key=CONFIG["aws"]["secret_key"],
+                region_name="us-east-1"
+            )
+        return _session
+
+def get_s3_client(region_name="us-east-1"):
+    """
+    Return a shared S3 client. boto3 clients are thread-safe, so one client per
+    region is created and reused, keeping its credentials and HTTP connections warm.
+    With the ``memory`` or ``local`` backend (S3_BACKEND), the process-wide in-process
+    object store is returned instead, which answers the same calls without a network.
+    """
+    backend = CONFIG["aws"]["backend"]
+    if backend != "s3":
+        with _clients_lock:
+            if backend not in _clients:
+                _clients[backend] = open_object_store(backend, CONFIG["aws"]["local_root"])
+            return _clients[backend]
+    session = get_boto3_session()
+    with _clients_lock:
+        if region_name not in _clients:
+            _clients[region_name] = session.client(
+                "s3", region_name=region_name, endpoint_url=CONFIG["aws"]["endpoint_url"],
+                # Room for several tables uploading several parts each at the same time
+                config=Config(max_pool_connections=max(10, 4 * CONFIG["aws"]["max_concurrency"]))
+            )
+        return _clients[region_name]
+
+def clear_s3_clients():
+    """
+    Drop the cached session and clients, e.g. after credentials changed. This also
+    discards the content of a memory object store.
+    """
+    global _session
+    with _clients_lock:
+        _session = None
+        _clients.clear()
+
+def head_object(s3_client, bucket_name, object_key):
+    """
+    The HEAD response of an object (size, ETag and user metadata), or None if it does not exist.
+    """
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def download_parquet(s3_client, bucket_name, object_key, columns=None, filters=None, ranged=False, as_pandas=False,
+                     table_name=None):
+    """
+    Read a Parquet object from S3 into an Arrow table without touching the local disk.
+
+    :param columns: Only read these columns.
+    :param filters: Row filters pushed down to the Parquet reader, in the
+                    ``pyarrow.parquet.read_table`` format, e.g. ``[("patient_id", "=", 123)]``.
+    :param ranged: Read only the footer and the needed column chunks with ranged GETs
+                   instead of fetching the whole object into memory.
+    :param as_pandas: Return a pandas DataFrame instead.
+    :param table_name: Table the object holds, for labelling the "download" stage
+                       (defaults to the object key).
+    """
+    with instrumentation.stage("download", table_name or object_key, object_key) as record:
+        if ranged:
+            source = S3RangeReader(s3_client, bucket_name, object_key)
+        else:
+            body = s3_client.get_object(Bucket=bucket_name, Key=object_key)["Body"].read()
+            source = pa.BufferReader(body)
+        with source:
+            table = pq.read_table(source, columns=columns, filters=filters)
+            record.bytes = source.size if ranged else len(body)
+        record.rows = table.num_rows
+    return table.to_pandas() if as_pandas else table
+
+def download_parquet_files(s3_client, bucket_name, object_keys, columns=None, filters=None, max_workers=16,
+                           as_pandas=False, table_name=None):
+    """
+    Read several Parquet objects concurrently (with ranged reads) into one Arrow table,
+    or a DataFrame with ``as_pandas``, e.g. the selected partitions of a partitioned dataset.
+    The "download" stage is labelled with ``table_name`` (defaults to the common path of the keys).
+    """
+    def read(object_key):
+        with S3RangeReader(s3_client, bucket_name, object_key) as source:
+            return pq.read_table(source, columns=columns, filters=filters)
+
+    object_keys = list(object_keys)
+    if not object_keys:
+        raise ValueError("No Parquet objects to download")
+    common_path = os.path.commonpath(object_keys)
+    with instrumentation.stage("download", table_name or common_path, common_path) as record:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tables = list(executor.map(read, object_keys))
+        table = pa.concat_tables(tables, promote_options="permissive")
+        record.rows, record.bytes = table.num_rows, table.nbytes
+    return table.to_pandas() if as_pandas else table
+
+def open_parquet(s3_client, bucket_name, object_key):
+    """
+    Open a Parquet object for lazy reads. Metadata, row groups and columns are
+    fetched with ranged GETs only when they are accessed.
+    """
+    return pq.ParquetFile(S3RangeReader(s3_client, bucket_name, object_key))
+
+
+def read_parquet_schema(s3_client, bucket_name, object_key):
+    """
+    Read the Arrow schema of a Parquet object from its footer only. This normally
+    costs a single ranged GET, regardless of the object size.
+    """
+    with S3RangeReader(s3_client, bucket_name, object_key) as source:
+        return pq.read_schema(source)
+
+def read_parquet_schemas(s3_client, bucket_name, object_keys, max_workers=16):
+    """
+    Read the footer schemas of many Parquet objects concurrently.
+
+    :return: Dict of object key to Arrow schema.
+    """
+    object_keys = list(object_keys)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        schemas = executor.map(lambda key: read_parquet_schema(s3_client, bucket_name, key), object_keys)
+        return dict(zip(object_keys, schemas))
+
+def parquet_dtypes(schema):
+    """
+    The pandas dtypes a Parquet schema is read back as, without reading any data.
+    """
+    return {column: str(dtype) for column, dtype in schema.empty_table().to_pandas().dtypes.items()}
+
+def delete_prefix(s3_client, bucket_name, prefix):
+    """
+    Delete every object under the key prefix, 1000 keys per request.
+
+    :return: Number of deleted objects.
+    """
+    deleted = 0
+    for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix):
+        objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if objects:
+            s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": objects, "Quiet": True})
+            deleted += len(objects)
+    return deleted
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over an S3 object, backed by ranged GETs.
+
+    The last ``tail_size`` bytes are fetched on open with a single suffix-range GET,
+    which also yields the object size. That covers the Parquet footer in most files,
+    so reading the metadata usually costs one request. S3 rejects any range of an empty
+    object with 416 InvalidRange, so that error is followed by a HEAD request to tell an
+    empty object apart.
+    """
+
+    def __init__(self, s3_client, bucket_name, object_key, tail_size=64 * 1024):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self._position = 0
+
+        try:
+            response = s3_client.get_object(Bucket=bucket_name, Key=object_key, Range=f"bytes=-{tail_size}")
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "InvalidRange" \
+                    or s3_client.head_object(Bucket=bucket_name, Key=object_key)["ContentLength"] != 0:
+                raise
+            self._tail, self.size, self._tail_start = b"", 0, 0
+            return
+        self._tail = response["Body"].read()
+        content_range = response.get("ContentRange")
+        self.size = int(content_range.rsplit("/", 1)[1]) if content_range else len(self._tail)
+        self._tail_start = self.size - len(self._tail)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def read(self, size=-1):
+        start = self._position
+        end = self.size if size is None or size < 0 else min(start + size, self.size)
+        if start >= end:
+            return b""
+        if start >= self._tail_start:
+            data = self._tail[start - self._tail_start:end - self._tail_start]
+        else:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=self.object_key, Range=f"bytes={start}-{end - 1}"
+            )
+            data = response["Body"].read()
+        self._position = start + len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Writable file object that streams its content to S3 with a multipart upload.
+
+    Data is buffered until ``part_size`` bytes are available and then sent as one
+    part. With ``max_concurrency`` above 1, parts are uploaded by background threads
+    while writing continues, holding at most ``max_concurrency`` parts in memory.
+    The part size doubles every 1,000 parts so objects of any size stay below the
+    10,000-part limit. Closing the writer completes the upload; leaving a ``with``
+    block with an exception aborts it instead. The wall time during which at least
+    one S3 call of the upload was in flight is reported as the "upload" stage of
+    ``table_name`` (defaults to the object key); concurrent part uploads are counted
+    once, not summed.
+    """
+
+    def __init__(self, s3_client, bucket_name, object_key, part_size=8 * 1024 * 1024, max_concurrency=1,
+                 metadata=None, table_name=None):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.table_name = table_name or object_key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._buffer = bytearray()
+        self._parts = []
+        self._pending = deque()
+        self._position = 0
+        self._upload_seconds = 0.0
+        self._calls_in_flight = 0
+        self._busy_since = 0.0
+        self._timing_lock = threading.Lock()
+        self._sha256 = hashlib.sha256()
+        self._part_md5s = []
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency) if max_concurrency > 1 else None
+        self._max_pending = max_concurrency
+        self._upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket_name, Key=object_key, Metadata=metadata or {}
+        )["UploadId"]
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    @property
+    def sha256(self):
+        """
+        Hex SHA-256 of the bytes written so far.
+        """
+        return self._sha256.hexdigest()
+
+    @property
+    def etag(self):
+        """
+        The ETag S3 assigns to the completed object (MD5 of the part MD5s and the part count),
+        for verifying the upload with a HEAD request.
+        """
+        return f'"{hashlib.md5(b"".join(self._part_md5s)).hexdigest()}-{len(self._part_md5s)}"'
+
+    def write(self, data):
+        self._sha256.update(data)
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._send_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _send_part(self, body):
+        part_number = len(self._part_md5s) + 1
+        self._part_md5s.append(hashlib.md5(body).digest())
+        if part_number % 1000 == 0:
+            self.part_size *= 2
+        if self._executor is None:
+            self._parts.append(self._upload_part(part_number, body))
+            return
+        while len(self._pending) >= self._max_pending:
+            self._parts.append(self._pending.popleft().result())
+        self._pending.append(self._executor.submit(self._upload_part, part_number, body))
+
+    @contextmanager
+    def _s3_call(self):
+        """
+        Add the time until no S3 call is in flight any more to the upload time.
+        """
+        with self._timing_lock:
+            if self._calls_in_flight == 0:
+                self._busy_since = time.perf_counter()
+            self._calls_in_flight += 1
+        try:
+            yield
+        finally:
+            with self._timing_lock:
+                self._calls_in_flight -= 1
+                if self._calls_in_flight == 0:
+                    self._upload_seconds += time.perf_counter() - self._busy_since
+
+    def _upload_part(self, part_number, body):
+        with self._s3_call():
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket_name, Key=self.object_key, UploadId=self._upload_id,
+                PartNumber=part_number, Body=body
+            )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def _wait_for_parts(self):
+        while self._pending:
+            self._parts.append(self._pending.popleft().result())
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._part_md5s:
+                self._send_part(bytes(self._buffer))
+                self._buffer.clear()
+            self._wait_for_parts()
+            with self._s3_call():
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.object_key, UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts}
+                )
+            instrumentation.record("upload", self.table_name, self._upload_seconds, size_bytes=self._position,
+                                   object_key=self.object_key)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            super().close()
+
+    def abort(self):
+        """
+        Abort the multipart upload, discarding all uploaded parts.
+        """
+        for future in self._pending:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._pending.clear()
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.object_key, UploadId=self._upload_id)
+        self._buffer.clear()
+        super().close()
+
+    def __del__(self):
+        # A writer that was never closed must not publish a truncated object
+        if hasattr(self, "_upload_id") and not self.closed:
+            self.abort()
 
-def get_s3_client():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=CONFIG["aws"]["access_key"],
-        aws_secret_access_key=CONFIG["aws"]["secret_key"],
-        region_name="us-east-1"
-    )
-
-def download_parquet(s3_client, bucket_name, object_key):
-    s3_client.download_file(bucket_name, object_key, "/tmp/temp.parquet")
-    return pd.read_parquet("/tmp/temp.parquet")
\ No newline at end of file
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            if not self.closed:
+                self.abort()
+            return False
+        self.close()
+        return False
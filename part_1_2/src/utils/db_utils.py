@@ -1,28 +1,394 @@
+import csv
+import io
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
 import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as arrow_csv
+from psycopg2 import extensions, extras, sql
+from psycopg2.pool import PoolError
 from part_1_2.config.config import CONFIG
+from part_1_2.src import schema_catalog
 
-def get_db_connection():
-    return psycopg2.connect(
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes of COPY output handed to the Arrow CSV reader at a time
+COPY_BLOCK_SIZE = 4 * 1024 * 1024  # Bytes of COPY output parsed per Arrow record batch
+
+# Arrow types for PostgreSQL type OIDs returned in cursor.description. Integers are
+# widened to int64 to match what pandas writes; unconstrained NUMERIC has no fixed
+# precision, so it is kept as its exact text representation.
+PG_OID_TO_ARROW = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int64(),
+    23: pa.int64(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1082: pa.date32(),
+    1083: pa.time64('us'),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC'),
+}
+
+def _connection_kwargs():
+    kwargs = dict(
         host=CONFIG['database']['host'],
         database=CONFIG['database']['dbname'],
         user=CONFIG['database']['user'],
         password=CONFIG['database']['password']
     )
+    if CONFIG['database'].get('schema'):
+        # Unqualified table names resolve to (and are created in) this schema
+        kwargs['options'] = f"-c search_path={CONFIG['database']['schema']}"
+    return kwargs
+
+def get_db_connection():
+    """
+    Open a new, unpooled database connection. Prefer get_connection_pool() for repeated use.
+    """
+    return psycopg2.connect(**_connection_kwargs())
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections.
+
+    At most ``max_size`` connections are handed out at once; ``getconn`` waits up to
+    ``timeout`` seconds for one to be returned and raises PoolError otherwise.
+    ``min_size`` connections are opened up front and every returned connection is kept
+    for reuse. A connection that was idle longer than ``health_check_interval`` seconds
+    is checked with ``SELECT 1`` before it is handed out and replaced if it is broken.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=30.0, health_check_interval=30.0, **connect_kwargs):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f"Invalid pool size limits: min_size={min_size}, max_size={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.closed = False
+        self._connect_kwargs = connect_kwargs
+        self._idle = deque()  # (connection, returned at)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def getconn(self):
+        if self.closed:
+            raise PoolError("connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"timed out after {self.timeout}s waiting for a free connection")
+        try:
+            while True:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    return self._connect()
+                conn, returned_at = idle
+                if self._is_healthy(conn, returned_at):
+                    return conn
+                conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection to the pool. Open transactions are rolled back; broken
+        connections, or any connection when ``close`` is set, are closed instead.
+        """
+        try:
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        close = True
+            with self._lock:
+                keep = not (close or conn.closed or self.closed)
+                if keep:
+                    self._idle.append((conn, time.monotonic()))
+            if not keep:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a ``with`` block.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def create_connection_pool(max_connections, min_connections=1):
+    """
+    Create a new connection pool for the configured database.
+    """
+    return ConnectionPool(
+        min_size=min_connections,
+        max_size=max_connections,
+        timeout=CONFIG['database']['pool_timeout'],
+        **_connection_kwargs()
+    )
+
+def get_connection_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+    Its size limits come from the DB_POOL_MIN_SIZE and DB_POOL_MAX_SIZE settings.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = create_connection_pool(
+                max_connections=CONFIG['database']['pool_max_size'],
+                min_connections=CONFIG['database']['pool_min_size']
+            )
+        return _pool
+
+def close_connection_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
 
 def fetch_table_schema(connection, table_name):
-    query = f"""
-    SELECT column_name, data_type
-    FROM information_schema.columns
-    WHERE table_name = '{table_name}';
     """
-    with connection.cursor() as cur:
-        cur.execute(query)
-        return cur.fetchall()
+    Fetch column names and data types of the table from the cached schema catalog.
+    """
+    return schema_catalog.get_schema_catalog().table_schema(table_name, connection)
 
 def fetch_table_data(connection, table_name):
-    query = f"SELECT * FROM {table_name}"
-    return pd.read_sql_query(query, connection)
+    """
+    Fetch the whole table as a pandas DataFrame. Read through fetch_table_arrow; use that
+    directly unless the caller needs pandas.
+    """
+    return fetch_table_arrow(connection, table_name).to_pandas()
+
+def fetch_table_arrow(connection, table_name, columns=None):
+    """
+    Fetch the whole table, or some of its columns, as an Arrow table, see fetch_query_batches.
+    """
+    selected = sql.SQL(", ").join(map(sql.Identifier, columns)) if columns else sql.SQL("*")
+    query = sql.SQL("SELECT {} FROM {}").format(selected, sql.Identifier(table_name))
+    schema, batches = fetch_query_batches(connection, query)
+    return pa.Table.from_batches(list(batches), schema=schema)
+
+def arrow_schema_from_description(description):
+    """
+    Build an Arrow schema from a psycopg2 cursor description.
+    """
+    fields = []
+    for column in description:
+        if column.type_code == 1700 and column.precision is not None and 0 < column.precision <= 38:
+            arrow_type = pa.decimal128(column.precision, column.scale or 0)
+        else:
+            arrow_type = PG_OID_TO_ARROW.get(column.type_code, pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+class _CopyCancelled(Exception):
+    pass
+
+class _CopyOutStream(io.RawIOBase):
+    """
+    Readable stream of the output of a ``COPY ... TO STDOUT``, which runs on the connection in
+    a background thread. At most ``max_chunks`` chunks of COPY_CHUNK_SIZE bytes are buffered;
+    closing the stream early cancels the COPY.
+    """
+
+    def __init__(self, connection, copy_sql, max_chunks=8):
+        super().__init__()
+        self._chunks = queue.Queue(max_chunks)
+        self._cancelled = threading.Event()
+        self._buffer = b""
+        self._finished = False
+        self._error = None
+        self._thread = threading.Thread(target=self._copy, args=(connection, copy_sql), name="copy-out",
+                                        daemon=True)
+        self._thread.start()
+
+    def _copy(self, connection, copy_sql):
+        pending = bytearray()
+
+        def write(data):  # Called by copy_expert once per row
+            if self._cancelled.is_set():
+                raise _CopyCancelled()
+            pending.extend(data)
+            if len(pending) >= COPY_CHUNK_SIZE:
+                self._put(bytes(pending))
+                pending.clear()
+
+        try:
+            with connection.cursor() as cur:
+                cur.copy_expert(copy_sql, SimpleNamespace(write=write), size=COPY_CHUNK_SIZE)
+            if pending:
+                self._put(bytes(pending))
+        except BaseException as error:
+            self._error = error
+        finally:
+            self._put(None)
+
+    def _put(self, chunk):
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _next_chunk(self):
+        chunk = b""
+        while not self._cancelled.is_set():
+            try:
+                chunk = self._chunks.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        if chunk is None or self._cancelled.is_set():
+            self._finished = True
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+            return b""
+        return chunk
+
+    def is_empty(self):
+        """Whether the COPY produced no output at all (waits for its first chunk)."""
+        if not self._buffer and not self._finished:
+            self._buffer = self._next_chunk()
+        return not self._buffer
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        parts, length = [self._buffer], len(self._buffer)
+        while (size is None or size < 0 or length < size) and not self._finished:
+            chunk = self._next_chunk()
+            parts.append(chunk)
+            length += len(chunk)
+        data = b"".join(parts)
+        if size is None or size < 0:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed and not self._finished:
+            self._cancelled.set()
+            self._thread.join()
+        super().close()
+
+def _rebatch(batches, schema, batch_size):
+    """Regroup record batches into batches of exactly ``batch_size`` rows, except the last one."""
+    pending, rows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= batch_size:
+            table = pa.Table.from_batches(pending, schema=schema)
+            yield table.slice(0, batch_size).combine_chunks().to_batches()[0]
+            rest = table.slice(batch_size)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending, schema=schema).combine_chunks().to_batches()[0]
+
+def fetch_table_batches(connection, table_name, batch_size=100_000):
+    """
+    Stream the table as Arrow record batches, see fetch_query_batches.
+
+    :return: Tuple of the Arrow schema and a generator of record batches of at most
+             ``batch_size`` rows. Only a few batches are held in memory at a time.
+    """
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
+    return fetch_query_batches(connection, query, batch_size=batch_size)
+
+def fetch_query_batches(connection, query, params=None, batch_size=100_000):
+    """
+    Stream the result of a query as Arrow record batches. The rows are sent by a CSV-mode
+    ``COPY (query) TO STDOUT`` and parsed by Arrow's multi-threaded CSV reader straight into
+    columns of the types in the query's description, without a Python object per value. NULL
+    is the unquoted empty field and empty strings are quoted, so both survive the round trip.
+    The connection must not be used for anything else until the batches are consumed or closed;
+    closing them early aborts the COPY, so roll the connection back before reusing it.
+    """
+    with connection.cursor() as cur:
+        query = cur.mogrify(query, params).decode()
+        cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+        schema = arrow_schema_from_description(cur.description)
+
+    def batches():
+        stream = _CopyOutStream(connection, f"COPY ({query}) TO STDOUT WITH (FORMAT csv)")
+        try:
+            if stream.is_empty():
+                return
+            reader = arrow_csv.open_csv(
+                stream,
+                read_options=arrow_csv.ReadOptions(column_names=schema.names, block_size=COPY_BLOCK_SIZE),
+                # Text may contain newlines, and a NULL in a one-column result is an empty line
+                parse_options=arrow_csv.ParseOptions(newlines_in_values=True, ignore_empty_lines=False),
+                convert_options=arrow_csv.ConvertOptions(
+                    column_types=schema, null_values=[""], strings_can_be_null=True,
+                    quoted_strings_can_be_null=False, true_values=["t"], false_values=["f"],
+                ),
+            )
+            yield from _rebatch(reader, schema, batch_size)
+        finally:
+            stream.close()
+
+    return schema, batches()
 
 def normalize_schema(db_schema, parquet_schema):
     """
@@ -31,10 +397,16 @@ def normalize_schema(db_schema, parquet_schema):
     """
     normalized_db_schema = {}
 
-    # Map PostgreSQL types to corresponding Parquet types (int64 for integer and string for character varying)
+    # Map PostgreSQL types to corresponding Parquet types (int64 for integers, object for everything
+    # pandas reads back as Python objects: strings, decimals, dates and times)
     type_mapping = {
         'integer': 'int64',
-        'character varying': 'object'
+        'bigint': 'int64',
+        'numeric': 'object',
+        'date': 'object',
+        'time without time zone': 'object',
+        'character varying': 'object',
+        'text': 'object'
     }
 
     for db_col, db_type in db_schema:
@@ -53,18 +425,40 @@ def compare_schemas(db_schema, parquet_schema):
 
 def fetch_column_names(db_connection, table_name):
     """
-    Fetch column names for the given table.
+    Fetch column names for the given table from the cached schema catalog.
+    """
+    return schema_catalog.get_schema_catalog().column_names(table_name, db_connection)
+
+_write_listeners = []
+
+def add_write_listener(listener):
     """
-    query = f"""
-        SELECT column_name FROM information_schema.columns
-        WHERE table_name = '{table_name}';
+    Call ``listener(table_name)`` after every committed write made through the CRUD
+    helpers below, e.g. to invalidate cached copies of the table's data.
     """
-    with db_connection.cursor() as cur:
-        cur.execute(query)
-        columns = [row[0] for row in cur.fetchall()]
-    return columns
+    _write_listeners.append(listener)
+
+def remove_write_listener(listener):
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+def _notify_write(table_name):
+    for listener in list(_write_listeners):
+        listener(table_name)
+
+def _execute_tracked(cur, db_connection, query, params, table_name, tracker):
+    """
+    Run a DML statement. When a ChangeTracker is given, the partitions of the affected
+    rows are returned by the statement and recorded.
+    """
+    if tracker is None:
+        cur.execute(query, params)
+        return
+    returning = sql.SQL("{} RETURNING {}").format(sql.SQL(query), tracker.partition_sql(db_connection, table_name))
+    cur.execute(returning, params)
+    tracker.record(table_name, {row[0] for row in cur.fetchall()})
 
-def insert_data(db_connection, table_name, column_names, values):
+def insert_data(db_connection, table_name, column_names, values, tracker=None):
     """
     Insert data into the table.
     """
@@ -72,37 +466,249 @@ def insert_data(db_connection, table_name, column_names, values):
     placeholders = ", ".join(["%s"] * len(values))
     query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
     with db_connection.cursor() as cur:
-        cur.execute(query, values)
+        _execute_tracked(cur, db_connection, query, values, table_name, tracker)
     db_connection.commit()
+    _notify_write(table_name)
 
-def update_data(db_connection, table_name, column_name, new_value, condition):
+def update_data(db_connection, table_name, column_name, new_value, condition, tracker=None):
     """
     Update data in the table.
     """
     query = f"UPDATE {table_name} SET {column_name} = %s WHERE {condition}"
     with db_connection.cursor() as cur:
-        cur.execute(query, (new_value,))
+        if tracker is not None:
+            # The update can move rows to other partitions, so the partitions they leave are touched too
+            cur.execute(sql.SQL("SELECT {} FROM {} WHERE {}").format(
+                tracker.partition_sql(db_connection, table_name), sql.SQL(table_name), sql.SQL(condition)
+            ))
+            tracker.record(table_name, {row[0] for row in cur.fetchall()})
+        _execute_tracked(cur, db_connection, query, (new_value,), table_name, tracker)
     db_connection.commit()
+    _notify_write(table_name)
 
-def delete_data(db_connection, table_name, condition):
+def delete_data(db_connection, table_name, condition, tracker=None):
     """
     Delete data from the table.
     """
     query = f"DELETE FROM {table_name} WHERE {condition}"
     with db_connection.cursor() as cur:
-        cur.execute(query)
+        _execute_tracked(cur, db_connection, query, None, table_name, tracker)
     db_connection.commit()
+    _notify_write(table_name)
 
-def validate_data(db_data, parquet_data):
+def fetch_column_types(db_connection, table_name):
+    """
+    Fetch the full SQL type (including modifiers, e.g. ``character varying(255)``) of every column.
+    """
+    query = """
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+    """
+    with db_connection.cursor() as cur:
+        cur.execute(query, (table_name,))
+        return dict(cur.fetchall())
+
+def _typed_template(column_types, columns):
+    # Literals in a VALUES list are untyped, so every value is cast to its column's type
+    return "(" + ", ".join(f"%s::{column_types[col]}" for col in columns) + ")"
+
+def _value_aliases(prefix, count):
+    return [sql.Identifier(f"_{prefix}{i}") for i in range(count)]
+
+def _rows_to_csv(rows):
+    buffer = io.StringIO()
+    # Quoting every non-numeric value keeps empty strings distinct from NULL (an unquoted empty field)
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def insert_rows(db_connection, table_name, column_names, rows, page_size=1000, method='values', tracker=None):
+    """
+    Insert many rows in a single transaction.
+
+    :param rows: Iterable of value tuples, in the order of ``column_names``.
+    :param page_size: Number of rows sent per statement (or per COPY chunk).
+    :param method: ``'values'`` for multi-row INSERT via execute_values, ``'copy'`` for
+                   CSV-mode COPY, or ``'prepared'`` to PREPARE the INSERT once on the
+                   server and EXECUTE it for every row. A tracker always uses ``'values'``.
+    :return: Number of inserted rows.
+    """
+    table = sql.Identifier(table_name)
+    columns = sql.SQL(", ").join(map(sql.Identifier, column_names))
+    inserted = 0
+    prepared = None
+    try:
+        with db_connection.cursor() as cur:
+            if method == 'copy' and tracker is None:
+                copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(table, columns)
+                for batch in _batches(rows, page_size):
+                    cur.copy_expert(copy_sql, _rows_to_csv(batch))
+                    inserted += len(batch)
+            elif method == 'prepared' and tracker is None:
+                statement = sql.Identifier(f"insert_{uuid.uuid4().hex}")
+                placeholders = sql.SQL(", ").join(sql.SQL(f"${i + 1}") for i in range(len(column_names)))
+                cur.execute(sql.SQL("PREPARE {} AS INSERT INTO {} ({}) VALUES ({})").format(
+                    statement, table, columns, placeholders))
+                prepared = statement
+                execute_sql = sql.SQL("EXECUTE {} ({})").format(
+                    statement, sql.SQL(", ").join(sql.SQL("%s") for _ in column_names)).as_string(cur)
+                for batch in _batches(rows, page_size):
+                    extras.execute_batch(cur, execute_sql, batch, page_size=page_size)
+                    inserted += len(batch)
+            elif method in ('values', 'copy', 'prepared'):
+                query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(table, columns)
+                if tracker is not None:
+                    query = sql.SQL("{} RETURNING {}").format(query, tracker.partition_sql(db_connection, table_name))
+                for batch in _batches(rows, page_size):
+                    returned = extras.execute_values(cur, query, batch, page_size=page_size, fetch=tracker is not None)
+                    if tracker is not None:
+                        tracker.record(table_name, {row[0] for row in returned})
+                    inserted += len(batch)
+            else:
+                raise ValueError(f"Unknown insert method: {method}")
+        db_connection.commit()
+        _notify_write(table_name)
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        if prepared is not None:
+            _deallocate(db_connection, prepared)
+    return inserted
+
+def _deallocate(db_connection, statement):
+    """
+    Drop a prepared statement once the transaction has ended. A rollback does not undo
+    PREPARE, so this also runs after a failure; a lost connection took the statement with it.
+    """
+    if db_connection.closed:
+        return
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("DEALLOCATE {}").format(statement))
+    db_connection.commit()
+
+def update_rows(db_connection, table_name, key_columns, set_columns, rows, page_size=1000, tracker=None):
     """
-    Validates that two dataframes (db_data and parquet_data) are equal.
-    Raises an AssertionError if they are not.
+    Update many rows, identified by their keys, in a single transaction.
+
+    :param rows: Iterable of tuples holding the key values followed by the new values
+                 of ``set_columns``.
+    :return: Number of updated rows.
+    """
+    column_types = fetch_column_types(db_connection, table_name)
+    key_aliases = _value_aliases("key", len(key_columns))
+    set_aliases = _value_aliases("value", len(set_columns))
+    table = sql.Identifier(table_name)
+    matches = sql.SQL(" AND ").join(
+        sql.SQL("{}.{} = v.{}").format(table, sql.Identifier(col), alias) for col, alias in zip(key_columns, key_aliases)
+    )
+    values = sql.SQL("(VALUES %s) AS v ({})").format(sql.SQL(", ").join(key_aliases + set_aliases))
+    query = sql.SQL("UPDATE {} SET {} FROM {} WHERE {}").format(
+        table,
+        sql.SQL(", ").join(sql.SQL("{} = v.{}").format(sql.Identifier(col), alias)
+                           for col, alias in zip(set_columns, set_aliases)),
+        values,
+        matches,
+    )
+    template = _typed_template(column_types, list(key_columns) + list(set_columns))
+    updated = 0
+    try:
+        with db_connection.cursor() as cur:
+            for batch in _batches(rows, page_size):
+                if tracker is not None:
+                    # The update can move rows to other partitions, so the partitions they leave are touched too
+                    partition = tracker.partition_sql(db_connection, table_name)
+                    old = extras.execute_values(
+                        cur, sql.SQL("SELECT {} FROM {} JOIN {} ON {}").format(partition, table, values, matches),
+                        batch, template=template, page_size=page_size, fetch=True)
+                    new = extras.execute_values(cur, sql.SQL("{} RETURNING {}").format(query, partition),
+                                                batch, template=template, page_size=page_size, fetch=True)
+                    tracker.record(table_name, {row[0] for row in old + new})
+                    updated += len(new)
+                else:
+                    extras.execute_values(cur, query, batch, template=template, page_size=page_size)
+                    updated += cur.rowcount
+        db_connection.commit()
+        _notify_write(table_name)
+    except Exception:
+        db_connection.rollback()
+        raise
+    return updated
+
+def delete_rows(db_connection, table_name, key_columns, keys, page_size=1000, tracker=None):
+    """
+    Delete many rows, identified by their keys, in a single transaction.
+
+    :param keys: Iterable of key value tuples, in the order of ``key_columns``.
+    :return: Number of deleted rows.
     """
+    column_types = fetch_column_types(db_connection, table_name)
+    key_aliases = _value_aliases("key", len(key_columns))
+    table = sql.Identifier(table_name)
+    query = sql.SQL("DELETE FROM {} USING (VALUES %s) AS v ({}) WHERE {}").format(
+        table,
+        sql.SQL(", ").join(key_aliases),
+        sql.SQL(" AND ").join(sql.SQL("{}.{} = v.{}").format(table, sql.Identifier(col), alias)
+                              for col, alias in zip(key_columns, key_aliases)),
+    )
+    if tracker is not None:
+        query = sql.SQL("{} RETURNING {}").format(query, tracker.partition_sql(db_connection, table_name))
+    template = _typed_template(column_types, key_columns)
+    deleted = 0
     try:
-        pd.testing.assert_frame_equal(db_data, parquet_data, check_dtype=False)
-        print("Validation successful: Dataframes are equal.")
-    except AssertionError as e:
-        raise AssertionError(f"Data validation failed: {e}")
+        with db_connection.cursor() as cur:
+            for batch in _batches(keys, page_size):
+                returned = extras.execute_values(cur, query, batch, template=template, page_size=page_size,
+                                                 fetch=tracker is not None)
+                if tracker is not None:
+                    tracker.record(table_name, {row[0] for row in returned})
+                    deleted += len(returned)
+                else:
+                    deleted += cur.rowcount
+        db_connection.commit()
+        _notify_write(table_name)
+    except Exception:
+        db_connection.rollback()
+        raise
+    return deleted
+
+def _as_arrow(data):
+    return pa.Table.from_pandas(data, preserve_index=False) if isinstance(data, pd.DataFrame) else data
+
+def validate_data(db_data, parquet_data):
+    """
+    Validates that two tables (db_data and parquet_data) hold the same values in the same order,
+    column by column with Arrow compute kernels. pandas DataFrames are converted to Arrow first.
+    Parquet columns are cast to the database column types, so e.g. int32 and int64 compare equal.
+    Raises an AssertionError describing the first difference if they are not equal.
+    """
+    db_data, parquet_data = _as_arrow(db_data), _as_arrow(parquet_data)
+    if db_data.column_names != parquet_data.column_names:
+        raise AssertionError(f"Data validation failed: columns {db_data.column_names} != {parquet_data.column_names}")
+    if db_data.num_rows != parquet_data.num_rows:
+        raise AssertionError(f"Data validation failed: {db_data.num_rows} rows != {parquet_data.num_rows} rows")
+    for name in db_data.column_names:
+        expected, actual = db_data.column(name), parquet_data.column(name)
+        if actual.type != expected.type:
+            actual = actual.cast(expected.type)
+        same = pc.or_kleene(pc.equal(expected, actual), pc.and_(expected.is_null(), actual.is_null()))
+        if pa.types.is_floating(expected.type):
+            same = pc.or_kleene(same, pc.and_(pc.is_nan(expected), pc.is_nan(actual)))
+        differing = pc.indices_nonzero(pc.invert(pc.fill_null(same, False)))
+        if len(differing):
+            row = differing[0].as_py()
+            raise AssertionError(f"Data validation failed: {len(differing)} values of '{name}' differ, first in row "
+                                 f"{row}: {expected[row].as_py()!r} != {actual[row].as_py()!r}")
+    print("Validation successful: tables are equal.")
 
 def generate_sample_values(column_names_and_types):
     sample_data = []
@@ -0,0 +1,216 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Optional
+
+from part_1_2.config.config import CONFIG
+
+
+class PeakRssSampler:
+    """
+    Samples the resident set size of this process in a background thread and keeps
+    the maximum, so the peak of a single stage can be measured. Falls back to the
+    process-lifetime peak where /proc is not available. Stages running concurrently
+    share the process, so their peaks include each other.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss():
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # ru_maxrss is in KiB on Linux and in bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+        return False
+
+
+@dataclass
+class StageRecord:
+    """
+    Cost of one pipeline stage for one table. ``rows`` and ``bytes`` are filled in by
+    the instrumented code. ``object_key`` is the S3 object (or common prefix of the
+    objects) a transfer stage read or wrote; records are grouped by ``table`` only.
+    """
+    stage: str
+    table: str
+    object_key: Optional[str] = None
+    started_at: float = 0.0
+    seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    peak_memory_bytes: int = 0
+    error: Optional[str] = None
+
+
+class _DisabledRecord:
+    """Accepts and ignores metric updates while instrumentation is disabled."""
+
+    def __getattr__(self, name):
+        return 0
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_DISABLED_RECORD = _DisabledRecord()
+
+
+@contextmanager
+def _disabled_stage():
+    yield _DISABLED_RECORD
+
+
+@dataclass
+class Instrumentation:
+    """
+    Records wall time, rows, bytes and peak memory per pipeline stage and table.
+
+    Disabled by default (enable with PIPELINE_METRICS=1 or ``enable()``); a disabled
+    ``stage`` block only costs a flag check. Records can be exported as a JSON
+    timeline, in the Prometheus text format and as Allure attachments.
+    """
+    enabled: bool = False
+    records: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def stage(self, stage, table, object_key=None):
+        """
+        Measure a ``with`` block as one stage of the given table::
+
+            with instrumentation.stage("copy", table_name) as record:
+                record.rows = copied_rows
+        """
+        if not self.enabled:
+            return _disabled_stage()
+        return self._measured_stage(stage, table, object_key)
+
+    @contextmanager
+    def _measured_stage(self, stage, table, object_key):
+        record = StageRecord(stage, table, object_key, started_at=time.time())
+        sampler = PeakRssSampler()
+        start = time.perf_counter()
+        try:
+            with sampler:
+                yield record
+        except Exception as error:
+            record.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.peak_memory_bytes = sampler.peak
+            self._add(record)
+
+    def record(self, stage, table, seconds, rows=0, size_bytes=0, object_key=None):
+        """
+        Add a stage measured elsewhere, e.g. time spent in network calls of a streaming operation.
+        """
+        if self.enabled:
+            self._add(StageRecord(stage, table, object_key, time.time() - seconds, seconds, rows, size_bytes))
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self, since=0):
+        with self._lock:
+            return list(self.records[since:])
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def to_json_timeline(self, records=None):
+        records = self.snapshot() if records is None else records
+        return json.dumps([asdict(record) for record in sorted(records, key=lambda r: r.started_at)], indent=2)
+
+    def to_prometheus(self, records=None):
+        """
+        Totals per stage and table in the Prometheus text exposition format.
+        """
+        records = self.snapshot() if records is None else records
+        totals = {}
+        for record in records:
+            total = totals.setdefault((record.stage, record.table), {"seconds": 0.0, "rows": 0, "bytes": 0,
+                                                                       "peak": 0, "runs": 0, "errors": 0})
+            total["seconds"] += record.seconds
+            total["rows"] += record.rows
+            total["bytes"] += record.bytes
+            total["peak"] = max(total["peak"], record.peak_memory_bytes)
+            total["runs"] += 1
+            total["errors"] += record.error is not None
+
+        metrics = [
+            ("pipeline_stage_duration_seconds_total", "counter", "Wall time spent in the stage.", "seconds"),
+            ("pipeline_stage_rows_total", "counter", "Rows processed by the stage.", "rows"),
+            ("pipeline_stage_bytes_total", "counter", "Bytes processed by the stage.", "bytes"),
+            ("pipeline_stage_peak_memory_bytes", "gauge", "Peak resident memory during the stage.", "peak"),
+            ("pipeline_stage_runs_total", "counter", "Number of times the stage ran.", "runs"),
+            ("pipeline_stage_errors_total", "counter", "Number of times the stage failed.", "errors"),
+        ]
+        lines = []
+        for name, metric_type, description, key in metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (stage, table), total in sorted(totals.items()):
+                lines.append(f'{name}{{stage="{_escape_label(stage)}",table="{_escape_label(table)}"}} {total[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, directory, records=None):
+        """
+        Write ``timeline.json`` and ``metrics.prom`` to the directory.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "timeline.json").write_text(self.to_json_timeline(records))
+        (directory / "metrics.prom").write_text(self.to_prometheus(records))
+
+    def attach_to_allure(self, records=None, name="Pipeline stage metrics"):
+        records = self.snapshot() if records is None else records
+        if not records:
+            return
+        import allure
+        allure.attach(self.to_json_timeline(records), name=f"{name} (timeline)",
+                      attachment_type=allure.attachment_type.JSON)
+        allure.attach(self.to_prometheus(records), name=f"{name} (Prometheus)",
+                      attachment_type=allure.attachment_type.TEXT)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+instrumentation = Instrumentation(enabled=CONFIG['metrics']['enabled'])
@@ -0,0 +1,422 @@
+import abc
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MAX_PART_NUMBER = 10_000
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+class NoSuchUpload(ClientError):
+    pass
+
+
+def _client_error(error_class, code, message, operation, status):
+    return error_class({"Error": {"Code": code, "Message": message},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+def _md5_etag(body):
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def _multipart_etag(part_etags):
+    """ETag of a multipart object: MD5 of the binary part MD5s, and the number of parts."""
+    digests = b"".join(bytes.fromhex(etag.strip('"')) for etag in part_etags)
+    return f'"{hashlib.md5(digests).hexdigest()}-{len(part_etags)}"'
+
+
+def _body_bytes(body):
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode()
+    if hasattr(body, "read"):
+        return body.read()
+    return bytes(body)
+
+
+class _ListObjectsPaginator:
+    def __init__(self, store):
+        self.store = store
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self.store.list_objects_v2(**kwargs, **({"ContinuationToken": token} if token else {}))
+            yield page
+            if not page["IsTruncated"]:
+                return
+            token = page["NextContinuationToken"]
+
+
+class ObjectStore(abc.ABC):
+    """
+    In-process implementation of the S3 client calls used by the pipeline: HEAD, ranged GET,
+    PUT, DELETE, listing and multipart uploads. Responses, ETags (the MD5 of the content, or
+    the MD5 of the part MD5s for multipart objects) and errors have the shape boto3 returns,
+    so S3Client and aws_utils work on it unchanged. Buckets exist implicitly. Subclasses
+    decide where objects and uploaded parts are kept.
+    """
+
+    exceptions = SimpleNamespace(ClientError=ClientError, NoSuchKey=NoSuchKey, NoSuchUpload=NoSuchUpload)
+
+    def __init__(self):
+        self._uploads = {}  # Upload id -> bucket, key, metadata and the ETag of every uploaded part
+        self._lock = threading.Lock()
+
+    # Storage of subclasses
+
+    @abc.abstractmethod
+    def _stat(self, bucket, key):
+        """Size, ETag, metadata and modification time of an object, or None if it does not exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _open(self, bucket, key):
+        """The info of _stat and a binary file object over the content, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write(self, bucket, key, chunks, info):
+        """Store an object from an iterable of byte strings, replacing it atomically."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _remove(self, bucket, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _keys(self, bucket, prefix):
+        """Sorted keys of the objects under a prefix."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write_part(self, upload_id, part_number, body):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _read_part(self, upload_id, part_number):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _remove_parts(self, upload_id):
+        raise NotImplementedError
+
+    # S3 client calls
+
+    @staticmethod
+    def _info(body_size, etag, metadata):
+        return {"size": body_size, "etag": etag, "metadata": dict(metadata or {}),
+                "modified": datetime.now(timezone.utc).timestamp()}
+
+    @staticmethod
+    def _response(info):
+        return {"ContentLength": info["size"], "ETag": info["etag"], "Metadata": dict(info["metadata"]),
+                "LastModified": datetime.fromtimestamp(info["modified"], timezone.utc)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        info = self._stat(Bucket, Key)
+        if info is None:
+            raise _client_error(ClientError, "404", "Not Found", "HeadObject", 404)
+        return self._response(info)
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        """
+        The object content as ``Body``, or the bytes of a ``bytes=start-end``, ``bytes=start-``
+        or suffix ``bytes=-length`` range with ``ContentRange`` set, like S3.
+        """
+        opened = self._open(Bucket, Key)
+        if opened is None:
+            raise _client_error(NoSuchKey, "NoSuchKey", "The specified key does not exist.", "GetObject", 404)
+        info, source = opened
+        with source:
+            size = info["size"]
+            start, end = 0, size - 1
+            if Range is not None:
+                match = RANGE_PATTERN.match(Range)
+                if match is None or not any(match.groups()):
+                    raise ValueError(f"Unsupported range: {Range}")
+                first, last = match.groups()
+                if not first:
+                    start = max(size - int(last), 0)
+                else:
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                if start >= size or start > end or (not first and int(last) == 0):
+                    raise _client_error(ClientError, "InvalidRange", "The requested range is not satisfiable",
+                                        "GetObject", 416)
+            source.seek(start)
+            body = source.read(end - start + 1)
+
+        response = self._response(info)
+        response.update(Body=io.BytesIO(body), ContentLength=len(body))
+        if Range is not None:
+            response["ContentRange"] = f"bytes {start}-{end}/{size}"
+        return response
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, **kwargs):
+        body = _body_bytes(Body)
+        etag = _md5_etag(body)
+        self._write(Bucket, Key, [body], self._info(len(body), etag, Metadata))
+        return {"ETag": etag}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._remove(Bucket, Key)  # Deleting a missing key succeeds, as in S3
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for obj in Delete["Objects"]:
+            self._remove(Bucket, obj["Key"])
+        return {} if Delete.get("Quiet") else {"Deleted": [{"Key": obj["Key"]} for obj in Delete["Objects"]]}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        after = ContinuationToken or StartAfter or ""
+        keys = [key for key in self._keys(Bucket, Prefix) if key > after]
+        contents = []
+        for key in keys[:MaxKeys]:
+            info = self._stat(Bucket, key)
+            if info is not None:
+                response = self._response(info)
+                contents.append({"Key": key, "Size": info["size"], "ETag": info["etag"],
+                                 "LastModified": response["LastModified"]})
+        page = {"Name": Bucket, "Prefix": Prefix, "KeyCount": len(contents), "MaxKeys": MaxKeys,
+                "IsTruncated": len(keys) > MaxKeys}
+        if contents:
+            page["Contents"] = contents
+        if page["IsTruncated"]:
+            page["NextContinuationToken"] = keys[MaxKeys - 1]
+        return page
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"No paginator for {operation_name}")
+        return _ListObjectsPaginator(self)
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"bucket": Bucket, "key": Key, "metadata": dict(Metadata or {}), "parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, upload_id, operation):
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise _client_error(NoSuchUpload, "NoSuchUpload", "The specified upload does not exist.", operation, 404)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        upload = self._upload(UploadId, "UploadPart")
+        if not 1 <= PartNumber <= MAX_PART_NUMBER:
+            raise _client_error(ClientError, "InvalidArgument", f"Part number must be between 1 and "
+                                f"{MAX_PART_NUMBER}", "UploadPart", 400)
+        body = _body_bytes(Body)
+        etag = _md5_etag(body)
+        self._write_part(UploadId, PartNumber, body)
+        with self._lock:
+            upload["parts"][PartNumber] = (etag, len(body))
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        """
+        Assemble the listed parts into the object. Like S3, the parts must be listed in ascending
+        order with the ETags returned by upload_part, and all but the last must be at least 5 MiB.
+        """
+        upload = self._upload(UploadId, "CompleteMultipartUpload")
+        parts = MultipartUpload["Parts"]
+        numbers = [part["PartNumber"] for part in parts]
+        if not parts or numbers != sorted(set(numbers)):
+            raise _client_error(ClientError, "InvalidPartOrder", "The list of parts was not in ascending order.",
+                                "CompleteMultipartUpload", 400)
+        for index, part in enumerate(parts):
+            uploaded = upload["parts"].get(part["PartNumber"])
+            if uploaded is None or uploaded[0] != part["ETag"]:
+                raise _client_error(ClientError, "InvalidPart", f"Part {part['PartNumber']} was not uploaded "
+                                    f"with ETag {part['ETag']}", "CompleteMultipartUpload", 400)
+            if index < len(parts) - 1 and uploaded[1] < MIN_PART_SIZE:
+                raise _client_error(ClientError, "EntityTooSmall", "Your proposed upload is smaller than the "
+                                    "minimum allowed object size.", "CompleteMultipartUpload", 400)
+
+        etag = _multipart_etag([part["ETag"] for part in parts])
+        size = sum(upload["parts"][number][1] for number in numbers)
+        chunks = (self._read_part(UploadId, number) for number in numbers)
+        self._write(Bucket, Key, chunks, self._info(size, etag, upload["metadata"]))
+        self._forget_upload(UploadId)
+        return {"Bucket": Bucket, "Key": Key, "ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._upload(UploadId, "AbortMultipartUpload")
+        self._forget_upload(UploadId)
+        return {}
+
+    def _forget_upload(self, upload_id):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        self._remove_parts(upload_id)
+
+
+class MemoryObjectStore(ObjectStore):
+    """
+    Object store keeping objects and parts in memory. Its content lives as long as the process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._objects = {}
+        self._parts = {}
+
+    def _stat(self, bucket, key):
+        stored = self._objects.get((bucket, key))
+        return stored and stored[1]
+
+    def _open(self, bucket, key):
+        stored = self._objects.get((bucket, key))
+        return stored and (stored[1], io.BytesIO(stored[0]))
+
+    def _write(self, bucket, key, chunks, info):
+        body = b"".join(chunks)
+        with self._lock:
+            self._objects[(bucket, key)] = (body, info)
+
+    def _remove(self, bucket, key):
+        with self._lock:
+            self._objects.pop((bucket, key), None)
+
+    def _keys(self, bucket, prefix):
+        with self._lock:
+            return sorted(key for stored_bucket, key in self._objects if stored_bucket == bucket
+                          and key.startswith(prefix))
+
+    def _write_part(self, upload_id, part_number, body):
+        with self._lock:
+            self._parts[(upload_id, part_number)] = body
+
+    def _read_part(self, upload_id, part_number):
+        return self._parts[(upload_id, part_number)]
+
+    def _remove_parts(self, upload_id):
+        with self._lock:
+            for part in [part for part in self._parts if part[0] == upload_id]:
+                del self._parts[part]
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Object store on the local file system. An object is a plain file at ``<root>/<bucket>/<key>``,
+    so exported Parquet files can be opened directly; its ETag and user metadata are kept in
+    ``<root>/.metadata/<bucket>/<key>.json``. Uploaded parts are spooled to ``<root>/.uploads``
+    and objects are replaced atomically when the upload completes.
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, *parts):
+        path = os.path.abspath(os.path.join(self.root, *parts))
+        if not path.startswith(self.root + os.sep) or any(part in ("", ".", "..") for part in parts[-1].split("/")):
+            raise ValueError(f"Object key not supported by the local object store: {parts[-1]!r}")
+        return path
+
+    def _data_path(self, bucket, key):
+        return self._path(bucket, key)
+
+    def _metadata_path(self, bucket, key):
+        return self._path(".metadata", bucket, key) + ".json"
+
+    def _stat(self, bucket, key):
+        try:
+            with open(self._metadata_path(bucket, key)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _open(self, bucket, key):
+        with self._lock:  # The info and the opened file belong to the same version of the object
+            info = self._stat(bucket, key)
+            if info is None:
+                return None
+            return info, open(self._data_path(bucket, key), "rb")
+
+    def _write(self, bucket, key, chunks, info):
+        data_path, metadata_path = self._data_path(bucket, key), self._metadata_path(bucket, key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(data_path), prefix=".upload-", delete=False) as file:
+            try:
+                for chunk in chunks:
+                    file.write(chunk)
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(metadata_path), delete=False) as metadata_file:
+            json.dump(info, metadata_file)
+        with self._lock:
+            os.replace(file.name, data_path)
+            os.replace(metadata_file.name, metadata_path)
+
+    def _remove(self, bucket, key):
+        with self._lock:
+            for path in (self._metadata_path(bucket, key), self._data_path(bucket, key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _keys(self, bucket, prefix):
+        # Object keys are the metadata files, which are only written for complete objects
+        directory = os.path.join(self.root, ".metadata", bucket)
+        keys = []
+        for parent, _, files in os.walk(directory):
+            relative = os.path.relpath(parent, directory).replace(os.sep, "/")
+            for name in files:
+                key = name[:-len(".json")] if relative == "." else f"{relative}/{name[:-len('.json')]}"
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def _part_path(self, upload_id, part_number):
+        return os.path.join(self.root, ".uploads", upload_id, str(part_number))
+
+    def _write_part(self, upload_id, part_number, body):
+        path = self._part_path(upload_id, part_number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+
+    def _read_part(self, upload_id, part_number):
+        with open(self._part_path(upload_id, part_number), "rb") as file:
+            return file.read()
+
+    def _remove_parts(self, upload_id):
+        shutil.rmtree(os.path.join(self.root, ".uploads", upload_id), ignore_errors=True)
+
+
+def open_object_store(backend, root=None):
+    """
+    The in-process object store of a backend name: ``memory``, or ``local`` below ``root``.
+    """
+    if backend == "memory":
+        return MemoryObjectStore()
+    if backend == "local":
+        if not root:
+            raise ValueError("The local object store needs a root directory (S3_LOCAL_ROOT)")
+        return LocalObjectStore(root)
+    raise ValueError(f"Unknown object store backend: '{backend}'")
@@ -0,0 +1,157 @@
+import struct
+from decimal import Decimal
+
+import numpy as np
+import pyarrow as pa
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)  # Signature, flags, header extension length
+COPY_TRAILER = struct.pack(">h", -1)
+POSTGRES_EPOCH_DAYS = 10_957  # 2000-01-01 in days since 1970-01-01
+
+# information_schema data types and the big-endian layout of their binary COPY representation
+FIXED_WIDTH_TYPES = {
+    "smallint": ">i2",
+    "integer": ">i4",
+    "bigint": ">i8",
+    "real": ">f4",
+    "double precision": ">f8",
+    "boolean": ">u1",
+    "date": ">i4",  # Days since 2000-01-01
+    "time without time zone": ">i8",  # Microseconds since midnight
+}
+TEXT_TYPES = {"character varying", "character", "text"}
+
+
+def encode_numeric(value: Decimal) -> bytes:
+    """
+    Binary representation of a NUMERIC: digit count, weight, sign and display scale,
+    followed by the base-10000 digits.
+    """
+    if value.is_nan():
+        return struct.pack(">hhHH", 0, 0, 0xC000, 0)
+    sign, digits, exponent = value.as_tuple()
+    number = "".join(map(str, digits))
+    if exponent >= 0:
+        integer_part, fraction_part = number + "0" * exponent, ""
+    else:
+        point = len(number) + exponent
+        integer_part, fraction_part = (number[:point], number[point:]) if point > 0 else ("", "0" * -point + number)
+    integer_part = integer_part.lstrip("0")
+    integer_part = "0" * (-len(integer_part) % 4) + integer_part
+    fraction_part += "0" * (-len(fraction_part) % 4)
+
+    digits_text = integer_part + fraction_part
+    groups = [int(digits_text[i:i + 4]) for i in range(0, len(digits_text), 4)]
+    weight = len(integer_part) // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+    header = struct.pack(">hhHH", len(groups), weight, 0x4000 if sign else 0, max(-exponent, 0))
+    return header + struct.pack(f">{len(groups)}H", *groups)
+
+
+def _encode_column(values: pa.Array, data_type: str):
+    """
+    Binary COPY payloads of one column.
+
+    :return: Tuple of the field lengths (-1 for NULL) and the concatenated payloads of the non-NULL fields.
+    """
+    valid = np.ones(len(values), dtype=bool) if values.null_count == 0 else \
+        values.is_valid().to_numpy(zero_copy_only=False)
+
+    if data_type in FIXED_WIDTH_TYPES:
+        layout = np.dtype(FIXED_WIDTH_TYPES[data_type])
+        if data_type == "date":
+            numbers = values.cast(pa.int32()).fill_null(0).to_numpy() - POSTGRES_EPOCH_DAYS
+        elif data_type == "time without time zone":
+            numbers = values.cast(pa.time64("us")).cast(pa.int64()).fill_null(0).to_numpy()
+        else:
+            numbers = values.fill_null(False if data_type == "boolean" else 0).to_numpy(zero_copy_only=False)
+        payload = numbers[valid].astype(layout).view(np.uint8)
+        return np.where(valid, layout.itemsize, -1).astype(np.int32), payload
+
+    if data_type == "numeric":
+        encoded = [encode_numeric(Decimal(value)) if value is not None else b"" for value in values.to_pylist()]
+        lengths = np.array([len(field) for field in encoded], dtype=np.int32)
+        lengths[~valid] = -1
+        return lengths, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    if data_type in TEXT_TYPES:
+        strings = values.cast(pa.string())
+        if strings.null_count:
+            strings = strings.fill_null("")  # NULL slots may hold bytes, zero them out of the data buffer
+        offsets = np.frombuffer(strings.buffers()[1], dtype=np.int32)[strings.offset:strings.offset + len(strings) + 1]
+        data = np.frombuffer(strings.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]]
+        lengths = np.diff(offsets).astype(np.int32)
+        lengths[~valid] = -1
+        return lengths, data
+
+    raise ValueError(f"Binary COPY does not support the column type '{data_type}'")
+
+
+def encode_rows(columns, data_types) -> bytes:
+    """
+    Encode equally long Arrow arrays as binary COPY tuples. Every tuple is a field count followed by
+    length-prefixed fields; the buffer is assembled with array operations, not row by row.
+
+    :param columns: Arrow arrays, one per table column.
+    :param data_types: information_schema data type of each column.
+    """
+    encoded = [_encode_column(values, data_type) for values, data_type in zip(columns, data_types)]
+    num_rows = len(columns[0]) if columns else 0
+    if num_rows == 0:
+        return b""
+
+    field_sizes = [np.maximum(lengths, 0).astype(np.int64) for lengths, _ in encoded]
+    row_sizes = 2 + sum(4 + sizes for sizes in field_sizes)
+    row_starts = np.concatenate(([0], np.cumsum(row_sizes)[:-1]))
+    out = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+
+    field_count = np.array([len(columns)], dtype=">i2").view(np.uint8)
+    out[row_starts] = field_count[0]
+    out[row_starts + 1] = field_count[1]
+    positions = row_starts + 2
+    for (lengths, payload), sizes in zip(encoded, field_sizes):
+        out[positions[:, None] + np.arange(4)] = lengths.astype(">i4").view(np.uint8).reshape(-1, 4)
+        if payload.size:
+            # Byte i of field j goes to the field's payload start plus i minus the field's payload offset
+            payload_offsets = np.cumsum(sizes) - sizes
+            out[np.repeat(positions + 4 - payload_offsets, sizes) + np.arange(payload.size)] = payload
+        positions = positions + 4 + sizes
+    return out.tobytes()
+
+
+class BinaryCopyStream:
+    """
+    File-like stream of a binary COPY: the header, the tuples of each record batch as it
+    is read, and the trailer. ``copy_expert`` reads it in small pieces, so only one encoded
+    batch is held in memory at a time.
+    """
+
+    def __init__(self, batches, data_types):
+        self._chunks = self._generate(batches, data_types)
+        self._buffer = memoryview(b"")
+        self.rows = 0
+        self.bytes = 0
+
+    def _generate(self, batches, data_types):
+        yield COPY_HEADER
+        for batch in batches:
+            self.rows += batch.num_rows
+            yield encode_rows(batch.columns, data_types)
+        yield COPY_TRAILER
+
+    def read(self, size=-1):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self.bytes += len(chunk)
+            self._buffer = memoryview(chunk)
+        size = len(self._buffer) if size is None or size < 0 else size
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data.tobytes()
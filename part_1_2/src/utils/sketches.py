@@ -0,0 +1,87 @@
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+HLL_PRECISION = 12  # 4096 registers, about 1.6% standard error
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of significant bits of each unsigned 64 bit value, 0 for 0."""
+    values = values.astype(np.uint64)
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= np.uint64(1 << shift)
+        lengths[wide] += shift
+        values = np.where(wide, values >> np.uint64(shift), values)
+    return lengths + (values > 0)
+
+
+def hash_values(array) -> np.ndarray:
+    """
+    64 bit hashes of the non-null values of an Arrow array. Equal values get equal hashes;
+    types without a plain NumPy representation are hashed by their text form.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    array = array.drop_null()
+    if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_boolean(array.type)
+            or pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        array = pc.cast(array, pa.string())
+    return pd.util.hash_array(array.to_numpy(zero_copy_only=False))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch. The top ``precision`` bits of a 64 bit hash pick a
+    register, which keeps the highest position of the first 1 bit in the remaining bits.
+    Sketches of the same precision merge by taking the register-wise maximum.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add_hashes(self, hashes: np.ndarray):
+        hashes = hashes.astype(np.uint64)
+        remaining_bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        ranks = remaining_bits + 1 - bit_length(hashes & np.uint64((1 << remaining_bits) - 1))
+        np.maximum.at(self.registers, buckets, ranks.astype(np.uint8))
+
+    def add_array(self, array):
+        self.add_hashes(hash_values(array))
+
+    def set_registers(self, buckets, ranks):
+        """Merge registers given as (bucket, rank) pairs, e.g. computed in SQL."""
+        np.maximum.at(self.registers, np.asarray(buckets, dtype=np.int64), np.asarray(ranks, dtype=np.uint8))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty:
+            return m * math.log(m / empty)  # Linear counting is more accurate for small cardinalities
+        return float(raw)
+
+    def to_base64(self):
+        return base64.b64encode(self.registers.tobytes()).decode()
+
+    @classmethod
+    def from_base64(cls, text, precision=HLL_PRECISION):
+        registers = np.frombuffer(base64.b64decode(text), dtype=np.uint8).copy()
+        if len(registers) != 1 << precision:
+            raise ValueError(f"Expected {1 << precision} registers, got {len(registers)}")
+        return cls(precision, registers)
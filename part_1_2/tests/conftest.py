@@ -1,18 +1,124 @@
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
 import pytest
-import boto3
-from part_1_2.src.utils.db_utils import get_db_connection
+from psycopg2 import sql
+
+from part_1_2.config.config import CONFIG
+from part_1_2.src.ingestion import ingest_csv_file
+from part_1_2.src.s3_client import S3Client
+from part_1_2.src.utils.aws_utils import get_s3_client, delete_prefix
+from part_1_2.src.utils.db_utils import get_connection_pool, close_connection_pool, get_db_connection
+from part_1_2.src.utils.file_utils import get_csv_file_paths
+from part_1_2.src.utils.instrumentation import instrumentation
+
+TESTS_DATA = Path(__file__).resolve().parent / 'tests_data'
+TABLE_NAMES = [csv_path.stem for csv_path in get_csv_file_paths(TESTS_DATA)]
+# Shared by all xdist workers of one run (they inherit the controller's environment)
+RUN_ID = os.environ.setdefault('TEST_RUN_ID', uuid.uuid4().hex[:8])
+
+
+@dataclass
+class ExportedTable:
+    """A test data table loaded into the worker's schema and exported to its S3 prefix."""
+    name: str
+    csv_path: Path
+    rows: int
+    object_key: str
+
+
+def pytest_collection_modifyitems(items):
+    # With --dist loadgroup all tests of one table run on the same worker, so each table is loaded once
+    for item in items:
+        table_name = getattr(item, 'callspec', None) and item.callspec.params.get('exported_table')
+        if table_name:
+            item.add_marker(pytest.mark.xdist_group(table_name))
+
+
+@pytest.fixture(scope='session')
+def worker_id():
+    """Fixture for the xdist worker name, 'main' when the tests are not distributed."""
+    return os.getenv('PYTEST_XDIST_WORKER', 'main')
 
-@pytest.fixture(scope='function')
-def db_connection():
-    """Fixture for setting up and tearing down database connection."""
-    connection = get_db_connection()
-    yield connection  # This will provide the connection to the test function
-    connection.close()  # Automatically closes the connection after the test
-    print("Database connection closed.")
+
+@pytest.fixture(scope='session')
+def test_namespace(worker_id):
+    """
+    Fixture for a PostgreSQL schema and an S3 key prefix owned by this worker, so workers
+    and concurrent runs never share tables or objects. Both are removed after the session
+    unless KEEP_TEST_DATA is set.
+    """
+    name = re.sub(r'[^a-z0-9_]', '_', f"test_{RUN_ID}_{worker_id}".lower())
+    prefix = f"test-runs/{RUN_ID}/{worker_id}"
+
+    conn = get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(name)))
+    conn.commit()
+    CONFIG['database']['schema'] = name  # Every pooled connection uses the schema as its search_path
+
+    yield name, prefix
+
+    if not os.getenv('KEEP_TEST_DATA'):
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP SCHEMA {} CASCADE").format(sql.Identifier(name)))
+        conn.commit()
+        delete_prefix(get_s3_client(), CONFIG['aws']['bucket_name'], prefix)
+    conn.close()
+    print(f"Test namespace '{name}' ('{prefix}') closed.")
+
+@pytest.fixture(scope='session')
+def db_pool(test_namespace):
+    """Fixture for the database connection pool shared by the whole test session."""
+    pool = get_connection_pool()
+    yield pool
+    close_connection_pool()  # Closes all pooled connections at the end of the session
+    print("Database connection pool closed.")
 
 @pytest.fixture(scope='function')
+def db_connection(db_pool):
+    """Fixture borrowing a pooled database connection for one test."""
+    with db_pool.connection() as connection:
+        yield connection  # This will provide the connection to the test function
+    # The connection is returned to the pool (and rolled back if needed) after the test
+
+@pytest.fixture(scope='session')
 def s3_client():
-    """Fixture for setting up and tearing down the S3 client."""
-    s3 = boto3.client('s3')  # Initialize the S3 client
-    yield s3  # This will provide the S3 client to the test function
+    """Fixture for the S3 client shared by the whole test session (an in-process store with S3_BACKEND)."""
+    return get_s3_client()
+
+@pytest.fixture(scope='session')
+def s3(s3_client, test_namespace):
+    """Fixture for the S3Client writing below the worker's key prefix."""
+    return S3Client(s3_client, CONFIG["aws"]["bucket_name"], prefix=test_namespace[1])
+
+@pytest.fixture(scope='session', params=TABLE_NAMES)
+def exported_table(request, db_pool, s3):
+    """
+    Fixture loading one test data table and exporting it to S3, once per worker.
+    Every test using it is parametrized per table and runs after the load and export.
+    """
+    csv_path = TESTS_DATA / f"{request.param}.csv"
+    load_result = ingest_csv_file(db_pool, csv_path, clear_table=True)
+    with db_pool.connection() as connection:
+        object_key = s3.upload_parquet(load_result.table_name, connection)
+    return ExportedTable(load_result.table_name, csv_path, load_result.rows, object_key)
+
+@pytest.fixture(scope='session', autouse=True)
+def pipeline_metrics_report(worker_id):
+    """Fixture writing the stage metrics of the session to the metrics directory when enabled."""
+    yield
+    if instrumentation.enabled:
+        directory = Path(CONFIG['metrics']['directory'])
+        instrumentation.write_reports(directory if worker_id == 'main' else directory / worker_id)
 
+@pytest.fixture(autouse=True)
+def pipeline_metrics():
+    """Fixture attaching the stage metrics recorded during a test to its Allure report."""
+    first_record = len(instrumentation.records)
+    yield
+    if instrumentation.enabled:
+        instrumentation.attach_to_allure(instrumentation.snapshot(first_record))
@@ -0,0 +1,20 @@
+from pathlib import Path
+import allure
+import pytest
+
+from part_1_2.benchmarks.synthetic_data import TABLE_GENERATORS, write_synthetic_csv
+from part_1_2.src.type_inference import ColumnTypeInferrer
+
+TESTS_DATA = Path(__file__).resolve().parent / 'tests_data'
+
+
+@pytest.mark.parametrize("table_shape", list(TABLE_GENERATORS))
+@allure.title("Test synthetic benchmark data has the shape of the test data")
+def test_synthetic_data_matches_test_data(tmp_path, table_shape):
+    csv_path = write_synthetic_csv(table_shape, 2_500, tmp_path / f"{table_shape}.csv", chunk_rows=1_000)
+
+    synthetic = ColumnTypeInferrer().infer(csv_path)
+    expected = ColumnTypeInferrer().infer(TESTS_DATA / f"{table_shape}.csv")
+
+    assert synthetic.rows_scanned == 2_500
+    assert synthetic.column_types == expected.column_types
@@ -0,0 +1,181 @@
+import datetime
+import struct
+from decimal import Decimal
+from pathlib import Path
+
+import allure
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from part_1_2.src import data_loader
+from part_1_2.src.arrow_csv import parse_dates, parse_times, read_csv_batches
+from part_1_2.src.data_loader import DataLoader
+from part_1_2.src.schema_catalog import SchemaCatalog
+from part_1_2.src.utils.pg_binary import COPY_HEADER, encode_numeric
+
+TESTS_DATA = Path(__file__).resolve().parent / 'tests_data'
+ADMISSIONS_SCHEMA = [
+    ("patient_id", "integer"), ("hospitalization_case_number", "integer"), ("admission_date", "date"),
+    ("admission_time", "time without time zone"), ("release_date", "date"),
+    ("release_time", "time without time zone"), ("department", "character varying"),
+    ("room_number", "character varying"),
+]
+
+
+def decode_numeric(field):
+    ndigits, weight, sign, dscale = struct.unpack_from(">hhHH", field)
+    digits = struct.unpack_from(f">{ndigits}H", field, 8)
+    value = sum((Decimal(digit) * Decimal(10000) ** (weight - i) for i, digit in enumerate(digits)), Decimal(0))
+    return (-value if sign else value).quantize(Decimal(1).scaleb(-dscale))
+
+
+def decode_copy(data, data_types):
+    """Rows of a binary COPY stream, decoded like the server would."""
+    assert data.startswith(COPY_HEADER)
+    position, rows = len(COPY_HEADER), []
+    while True:
+        (field_count,) = struct.unpack_from(">h", data, position)
+        position += 2
+        if field_count == -1:
+            assert position == len(data)
+            return rows
+        assert field_count == len(data_types)
+        row = []
+        for data_type in data_types:
+            (length,) = struct.unpack_from(">i", data, position)
+            field, position = data[position + 4:position + 4 + max(length, 0)], position + 4 + max(length, 0)
+            if length == -1:
+                row.append(None)
+            elif data_type == "integer":
+                row.append(struct.unpack(">i", field)[0])
+            elif data_type == "date":
+                row.append(datetime.date(2000, 1, 1) + datetime.timedelta(days=struct.unpack(">i", field)[0]))
+            elif data_type == "time without time zone":
+                row.append(datetime.timedelta(microseconds=struct.unpack(">q", field)[0]))
+            elif data_type == "numeric":
+                row.append(decode_numeric(field))
+            else:
+                row.append(field.decode())
+        rows.append(row)
+
+
+class FakeCopyConnection:
+    """Answers the catalog query with a fixed schema and keeps the stream of COPY statements."""
+
+    def __init__(self, table_name, schema):
+        self.catalog_rows = [(table_name, name, data_type) for name, data_type in schema]
+        self.copies = []
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            rowcount = -1
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query):
+                pass
+
+            def fetchall(self):
+                return list(connection.catalog_rows)
+
+            def copy_expert(self, query, file, size=8192):
+                chunks = iter(lambda: file.read(size), b"")
+                connection.copies.append((query, b"".join(chunks)))
+                self.rowcount = file.rows
+
+        return Cursor()
+
+    def commit(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        (["3/20/2022", "2018-10-21", None], [datetime.date(2022, 3, 20), datetime.date(2018, 10, 21), None]),
+        (["2/29/2024", "12/31/1999"], [datetime.date(2024, 2, 29), datetime.date(1999, 12, 31)]),
+    ],
+)
+@allure.title("Test vectorized date parsing of ISO and M/D/YYYY dates")
+def test_parse_dates(values, expected):
+    assert parse_dates(pa.array(values, pa.string())).to_pylist() == expected
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        (["5:20:00 AM", "5:58:00 PM", "12:04:00 PM", "12:30 am"],
+         [datetime.time(5, 20), datetime.time(17, 58), datetime.time(12, 4), datetime.time(0, 30)]),
+        (["16:08", "01:02:03.25", None], [datetime.time(16, 8), datetime.time(1, 2, 3, 250_000), None]),
+    ],
+)
+@allure.title("Test vectorized parsing of 24 and 12 hour times")
+def test_parse_times(values, expected):
+    assert parse_times(pa.array(values, pa.string())).to_pylist() == expected
+
+
+@pytest.mark.parametrize("parse, value", [(parse_dates, "2/30/2022"), (parse_dates, "March 1"),
+                                          (parse_times, "13:00:00 PM"), (parse_times, "24:00")])
+@allure.title("Test values that are not dates or times are rejected")
+def test_parse_rejects_invalid_values(parse, value):
+    with pytest.raises(ValueError, match=value):
+        parse(pa.array([value]))
+
+
+@pytest.mark.parametrize("value", ["0", "1.5", "-1234567.890", "1e3", "0.00012", "+.5", "99999999999999999999"])
+@allure.title("Test NUMERIC values round trip through the binary representation")
+def test_encode_numeric(value):
+    assert decode_numeric(encode_numeric(Decimal(value))) == Decimal(value)
+
+
+@allure.title("Test quoted multi-line values and empty lines are read like a CSV COPY reads them")
+def test_read_csv_batches_multiline(tmp_path):
+    notes = tmp_path / "notes.csv"
+    notes.write_text("id,note\n" + "".join(f'{index},"first line\nsecond line {index}"\n' for index in range(100)))
+    single = tmp_path / "single.csv"
+    single.write_text('note\n""\n\nNULL\ntext\n')
+
+    rows = [row for batch in read_csv_batches(notes, ["id", "note"], block_size=64) for row in batch.to_pylist()]
+    assert rows[99] == {"id": "99", "note": "first line\nsecond line 99"} and len(rows) == 100
+    values = [value for batch in read_csv_batches(single, ["note"]) for value in batch.column(0).to_pylist()]
+    assert values == ["", "", None, "text"]
+
+
+@allure.title("Test a CSV is loaded with a typed binary COPY in small record batches")
+def test_load_csv_binary(monkeypatch):
+    connection = FakeCopyConnection("admissions", ADMISSIONS_SCHEMA)
+    monkeypatch.setattr(data_loader, "get_schema_catalog", SchemaCatalog)
+
+    with allure.step("Load the admissions CSV"):
+        result = DataLoader(connection).load_csv_binary(TESTS_DATA / 'admissions.csv', block_size=1024)
+        assert result.rows == 100
+
+    with allure.step("Verify the decoded rows match the CSV"):
+        _, data = connection.copies[0]
+        rows = decode_copy(data, [data_type for _, data_type in ADMISSIONS_SCHEMA])
+        csv = pd.read_csv(TESTS_DATA / 'admissions.csv', dtype=str, keep_default_na=False)
+        assert len(rows) == len(csv) == 100
+        first = rows[0]
+        assert first[:4] == [7792223, 727851, datetime.date(2022, 3, 20), datetime.timedelta(hours=5, minutes=20)]
+        assert first[4:6] == [None, None]
+        assert [row[6] for row in rows] == list(csv["department"])
+        assert [row[0] for row in rows] == [int(value) for value in csv["patient_id"]]
+        expected_nulls = (csv["release_date"] == "NULL").sum()
+        assert sum(row[4] is None for row in rows) == expected_nulls
+
+
+@allure.title("Test columns the table does not have are rejected")
+def test_load_csv_binary_unknown_column(monkeypatch):
+    connection = FakeCopyConnection("admissions", ADMISSIONS_SCHEMA[:-1])
+    monkeypatch.setattr(data_loader, "get_schema_catalog", SchemaCatalog)
+
+    with pytest.raises(ValueError, match="room_number"):
+        DataLoader(connection).load_csv_binary(TESTS_DATA / 'admissions.csv')
+    assert connection.copies == []
@@ -0,0 +1,92 @@
+import allure
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from part_1_2.src.utils.db_utils import ConnectionPool
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection so the pool logic can be tested without a server."""
+
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.broken = False
+        self.info = self
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query):
+                if connection.broken:
+                    raise psycopg2.OperationalError("server closed the connection")
+
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnectionPool(ConnectionPool):
+    def _connect(self):
+        return FakeConnection()
+
+
+@allure.title("Test pooled connections are reused and rolled back on return")
+def test_connections_are_reused():
+    pool = FakeConnectionPool(min_size=1, max_size=2)
+
+    with pool.connection() as first:
+        first.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    with pool.connection() as second:
+        assert second is first
+        assert second.rollbacks == 1
+
+
+@allure.title("Test the pool size limit")
+def test_pool_size_limit():
+    pool = FakeConnectionPool(min_size=0, max_size=2, timeout=0.01)
+    connections = [pool.getconn(), pool.getconn()]
+
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+    pool.putconn(connections.pop())
+    assert pool.getconn() is not None
+
+
+@allure.title("Test broken idle connections are replaced by the health check")
+def test_broken_connection_is_replaced():
+    pool = FakeConnectionPool(min_size=1, max_size=1, health_check_interval=0)
+    with pool.connection() as connection:
+        connection.broken = True
+
+    with pool.connection() as replacement:
+        assert replacement is not connection
+    assert connection.closed
+
+
+@allure.title("Test closing the pool closes idle and returned connections")
+def test_closeall():
+    pool = FakeConnectionPool(min_size=2, max_size=2)
+    borrowed = pool.getconn()
+    pool.closeall()
+    pool.putconn(borrowed)
+
+    assert borrowed.closed
+    with pytest.raises(PoolError):
+        pool.getconn()
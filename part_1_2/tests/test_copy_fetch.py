@@ -0,0 +1,135 @@
+import datetime
+import itertools
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+import allure
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from part_1_2.src.utils import db_utils
+from part_1_2.src.utils.db_utils import fetch_query_batches, fetch_table_arrow, validate_data
+
+Column = namedtuple("Column", "name type_code precision scale")
+COLUMNS = [Column("patient_id", 23, None, None), Column("name", 1043, None, None),
+           Column("admission_date", 1082, None, None), Column("admission_time", 1083, None, None),
+           Column("billing_amount", 1700, 10, 2), Column("is_active", 16, None, None)]
+
+
+class FakeCopyOutConnection:
+    """Describes a fixed result and sends its CSV rows through copy_expert one row at a time, like psycopg2."""
+
+    def __init__(self, csv_rows, columns=COLUMNS, fail_after=None):
+        self.csv_rows = csv_rows
+        self.columns = columns
+        self.fail_after = fail_after
+        self.statements = []
+        self.rows_sent = 0
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            description = None
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def mogrify(self, query, params=None):
+                return (query if isinstance(query, str) else "SELECT * FROM patient_information").encode()
+
+            def execute(self, query):
+                connection.statements.append(query)
+                self.description = connection.columns
+
+            def copy_expert(self, query, file, size=8192):
+                connection.statements.append(query)
+                for row in connection.csv_rows:
+                    if connection.rows_sent == connection.fail_after:
+                        raise RuntimeError("connection lost")
+                    file.write(row.encode())
+                    connection.rows_sent += 1
+
+        return Cursor()
+
+
+@allure.title("Test query results are parsed from a CSV COPY straight into typed Arrow columns")
+def test_fetch_query_batches():
+    rows = ['1,Ann,2024-03-20,05:20:00,1.50,t\n', '2,"",,16:08:00.5,,f\n', '3,,2024-01-02,,12.00,\n']
+    connection = FakeCopyOutConnection(rows)
+
+    table = fetch_table_arrow(connection, "patient_information")
+
+    assert table.schema.types == [pa.int64(), pa.string(), pa.date32(), pa.time64("us"), pa.decimal128(10, 2),
+                                  pa.bool_()]
+    assert table.to_pylist()[1] == {"patient_id": 2, "name": "", "admission_date": None,
+                                    "admission_time": datetime.time(16, 8, 0, 500000), "billing_amount": None,
+                                    "is_active": False}
+    assert table.column("name").to_pylist() == ["Ann", "", None]
+    assert table.column("billing_amount").to_pylist()[2] == Decimal("12.00")
+    assert connection.statements[-1].startswith("COPY (SELECT * FROM \"patient_information\"") \
+        or connection.statements[-1].startswith("COPY (SELECT * FROM patient_information")
+
+
+@allure.title("Test a NULL in a one-column result, an empty line in the COPY output, is kept")
+def test_single_nullable_column():
+    connection = FakeCopyOutConnection(['""\n', '\n', 'abc\n'], columns=[Column("name", 1043, None, None)])
+
+    table = fetch_table_arrow(connection, "patient_information", columns=["name"])
+
+    assert table.column("name").to_pylist() == ["", None, "abc"]
+
+
+@allure.title("Test quoted values with newlines are parsed across block boundaries")
+def test_newlines_in_values(monkeypatch):
+    monkeypatch.setattr(db_utils, "COPY_BLOCK_SIZE", 64)
+    rows = [f'{index},"line one\nline two {index}",,,,\n' for index in range(200)]
+
+    _, batches = fetch_query_batches(FakeCopyOutConnection(rows), "SELECT * FROM t")
+
+    names = [name for batch in batches for name in batch.column(1).to_pylist()]
+    assert names == [f"line one\nline two {index}" for index in range(200)]
+
+
+@allure.title("Test batches have the requested number of rows and an empty result has none")
+def test_batch_sizes():
+    rows = [f"{index},name {index},,,,\n" for index in range(2500)]
+    schema, batches = fetch_query_batches(FakeCopyOutConnection(rows), "SELECT * FROM t", batch_size=1000)
+
+    assert [batch.num_rows for batch in batches] == [1000, 1000, 500]
+    assert schema.names[0] == "patient_id"
+    empty_schema, empty = fetch_query_batches(FakeCopyOutConnection([]), "SELECT * FROM t")
+    assert list(empty) == [] and len(empty_schema) == len(COLUMNS)
+
+
+@allure.title("Test COPY errors surface in the reader and closing early stops the COPY")
+def test_copy_errors_and_cancel():
+    rows = [f"{index},name,,,,\n" for index in range(100)]
+    _, batches = fetch_query_batches(FakeCopyOutConnection(rows, fail_after=10), "SELECT * FROM t")
+    with pytest.raises(RuntimeError, match="connection lost"):
+        list(batches)
+
+    connection = FakeCopyOutConnection(itertools.repeat("1,name,,,,\n"))  # A COPY that only ends when cancelled
+    _, batches = fetch_query_batches(connection, "SELECT * FROM t", batch_size=10)
+    assert next(batches).num_rows == 10
+    batches.close()
+    rows_sent = connection.rows_sent
+    time.sleep(0.05)
+    assert connection.rows_sent == rows_sent
+
+
+@allure.title("Test tables are compared column by column with Arrow kernels")
+def test_validate_data():
+    table = pa.table({"id": pa.array([1, 2, None], pa.int64()), "value": [1.5, float("nan"), None]})
+
+    validate_data(table, pa.table({"id": pa.array([1, 2, None], pa.int32()), "value": [1.5, float("nan"), None]}))
+    validate_data(table.drop_columns(["value"]), table.drop_columns(["value"]).to_pandas())
+    with pytest.raises(AssertionError, match="1 values of 'value' differ, first in row 0"):
+        validate_data(table, pa.table({"id": [1, 2, None], "value": [2.5, float("nan"), None]}))
+    with pytest.raises(AssertionError, match="3 rows != 2 rows"):
+        validate_data(table, pd.DataFrame({"id": [1, 2], "value": [1.5, 2.0]}))
@@ -1,52 +1,195 @@
-from pathlib import Path
+from datetime import date
+from decimal import Decimal
+
 import allure
+import psycopg2
 import pytest
-from part_1_2.config.config import CONFIG
-from part_1_2.src.s3_client import S3Client
-from part_1_2.src.utils.aws_utils import download_parquet
-from part_1_2.src.utils.db_utils import fetch_table_data, insert_data, validate_data, update_data, \
-    delete_data, fetch_table_schema, generate_sample_values
-from part_1_2.src.utils.file_utils import get_csv_file_paths
-
-@pytest.mark.run(order=4)
+from psycopg2 import sql
+from part_1_2.src.change_tracking import ChangeTracker
+from part_1_2.src.data_diff import create_partition_index, partition_index_name, partition_sql, validate_table
+from part_1_2.src.schema_catalog import get_schema_catalog
+from part_1_2.src.utils.db_utils import insert_data, update_data, delete_data, fetch_table_schema, \
+    generate_sample_values, insert_rows, update_rows, delete_rows
+
+NUM_PARTITIONS = 16
+BULK_COLUMNS = ["id", "name", "amount", "day"]
+BULK_ROWS = [(1, "Ann", Decimal("1.50"), date(2024, 1, 2)), (2, "", None, None),
+             (3, 'quote ", comma', Decimal("12.00"), date(2023, 12, 31)), (4, None, Decimal("0.00"), date(2024, 2, 29))]
+
+def export_and_validate_changes(s3, db_connection, tracker, table_name):
+    """
+    Re-export and validate only the partitions touched since the last check.
+    """
+    touched = tracker.touched_partitions(table_name)
+    key_columns = tracker.key_columns_for(db_connection, table_name)
+    s3.upload_parquet_partitions(table_name, db_connection, key_columns, NUM_PARTITIONS, partitions=touched)
+    validate_table(db_connection, table_name, s3.open_partitions(table_name, touched), key_columns,
+                   NUM_PARTITIONS, partitions=touched)
+    tracker.clear(table_name)
+
+@pytest.fixture
+def crud_table(exported_table, db_connection):
+    """
+    Fixture for a private copy of the loaded table, so the changes made here do not
+    affect the other tests of the table.
+    """
+    table_name = f"{exported_table.name}_crud"
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {copy}; CREATE TABLE {copy} (LIKE {table})").format(
+            copy=sql.Identifier(table_name), table=sql.Identifier(exported_table.name)
+        ))
+        cur.execute(sql.SQL("SELECT * FROM {}").format(sql.Identifier(exported_table.name)))
+        column_names = [column.name for column in cur.description]
+        rows = cur.fetchall()
+    db_connection.commit()
+    get_schema_catalog().invalidate(table_name)
+    insert_rows(db_connection, table_name, column_names, rows, method='copy')
+    yield table_name
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(table_name)))
+    db_connection.commit()
+    get_schema_catalog().invalidate(table_name)
+
 @allure.title("Test CRUD Operations: Insert, Read, Update, Delete")
-def test_crud_operations(db_connection, s3_client):
-    bucket_name = CONFIG["aws"]["bucket_name"]
-    s3 = S3Client(s3_client, bucket_name)
-
-    directory_path = Path(__file__).resolve().parent / 'tests_data'
-    for csv_path in get_csv_file_paths(directory_path):
-        table_name = csv_path.stem
-        parquet_key = f"output/{table_name}.parquet"
-
-        # Fetch column names and schema
-        db_schema = fetch_table_schema(db_connection, table_name)  # Example: [('col1', 'integer'), ('col2', 'varchar')]
-        column_names = [col[0] for col in db_schema]  # Extract column names
-
-        # Create (Insert)
-        sample_values = generate_sample_values(db_schema)
-        insert_data(db_connection, table_name, column_names, sample_values)
-
-        # Read
-        db_data = fetch_table_data(db_connection, table_name)
-        s3.upload_parquet(table_name, db_connection) # Regenerate and upload the Parquet file to S3
-        parquet_data = download_parquet(s3_client, bucket_name, parquet_key)
-        validate_data(db_data, parquet_data)
-
-        # Update
-        update_data(db_connection, table_name, 'patient_id', 123, "patient_id = 7168386")
-
-        # Read and Validate Again
-        db_data = fetch_table_data(db_connection, table_name)
-        s3.upload_parquet(table_name, db_connection)  # Regenerate and upload the Parquet file to S3
-        parquet_data = download_parquet(s3_client, bucket_name, parquet_key)
-        validate_data(db_data, parquet_data)
-
-        # Delete
-        delete_data(db_connection, table_name, "patient_id = 123")
-
-        # Final Validation
-        db_data = fetch_table_data(db_connection, table_name)
-        s3.upload_parquet(table_name, db_connection)  # Regenerate and upload the Parquet file to S3
-        parquet_data = download_parquet(s3_client, bucket_name, parquet_key)
-        validate_data(db_data, parquet_data)
\ No newline at end of file
+def test_crud_operations(crud_table, db_connection, s3):
+    tracker = ChangeTracker(num_partitions=NUM_PARTITIONS)
+    table_name = crud_table
+
+    # Fetch column names and schema
+    db_schema = fetch_table_schema(db_connection, table_name)  # Example: [('col1', 'integer'), ('col2', 'varchar')]
+    column_names = [col[0] for col in db_schema]  # Extract column names
+
+    # Export every partition once, later checks only cover the partitions a change touched
+    key_columns = tracker.key_columns_for(db_connection, table_name)
+    s3.upload_parquet_partitions(table_name, db_connection, key_columns, NUM_PARTITIONS)
+
+    # Create (Insert)
+    sample_values = generate_sample_values(db_schema)
+    insert_data(db_connection, table_name, column_names, sample_values, tracker=tracker)
+
+    # Read
+    export_and_validate_changes(s3, db_connection, tracker, table_name)
+
+    # Update
+    update_data(db_connection, table_name, 'patient_id', 123, "patient_id = 7168386", tracker=tracker)
+
+    # Read and Validate Again
+    export_and_validate_changes(s3, db_connection, tracker, table_name)
+
+    # Delete
+    delete_data(db_connection, table_name, "patient_id = 123", tracker=tracker)
+
+    # Final Validation
+    export_and_validate_changes(s3, db_connection, tracker, table_name)
+
+@pytest.fixture
+def bulk_table(db_connection):
+    """
+    Fixture for an empty table keyed by ``id``, for the bulk DML helpers.
+    """
+    table_name = "bulk_dml"
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {table}; CREATE TABLE {table} "
+                            "(id integer PRIMARY KEY, name text, amount numeric(10, 2), day date)").format(
+            table=sql.Identifier(table_name)
+        ))
+    db_connection.commit()
+    get_schema_catalog().invalidate(table_name)
+    yield table_name
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(table_name)))
+    db_connection.commit()
+    get_schema_catalog().invalidate(table_name)
+
+def fetch_rows(db_connection, table_name):
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("SELECT * FROM {} ORDER BY id").format(sql.Identifier(table_name)))
+        return cur.fetchall()
+
+def partitions_of(db_connection, tracker, table_name, ids):
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("SELECT DISTINCT {} FROM {} WHERE id = ANY(%s)").format(
+            tracker.partition_sql(db_connection, table_name), sql.Identifier(table_name)
+        ), (list(ids),))
+        return {row[0] for row in cur.fetchall()}
+
+@allure.title("Test every insert method writes the rows, NULLs and empty strings intact, across pages")
+@pytest.mark.parametrize("method", ["values", "copy", "prepared"])
+def test_insert_rows(bulk_table, db_connection, method):
+    inserted = insert_rows(db_connection, bulk_table, BULK_COLUMNS, iter(BULK_ROWS), page_size=3, method=method)
+
+    assert inserted == len(BULK_ROWS)
+    assert fetch_rows(db_connection, bulk_table) == BULK_ROWS
+
+@allure.title("Test keyed updates and deletes, with and without a change tracker")
+def test_update_and_delete_rows(bulk_table, db_connection):
+    tracker = ChangeTracker({bulk_table: ["id"]}, num_partitions=NUM_PARTITIONS)
+
+    with allure.step("Insert with the tracker, which records the partitions of every row"):
+        insert_rows(db_connection, bulk_table, BULK_COLUMNS, BULK_ROWS, tracker=tracker)
+        assert tracker.touched_partitions(bulk_table) == partitions_of(db_connection, tracker, bulk_table, [1, 2, 3, 4])
+        tracker.clear(bulk_table)
+
+    with allure.step("Update by key; a key that does not exist changes nothing"):
+        updated = update_rows(db_connection, bulk_table, ["id"], ["name", "amount"],
+                              [(2, "Bob", Decimal("3.25")), (3, None, None), (99, "missing", None)], tracker=tracker)
+        assert updated == 2
+        assert tracker.touched_partitions(bulk_table) == partitions_of(db_connection, tracker, bulk_table, [2, 3])
+        assert update_rows(db_connection, bulk_table, ["id"], ["day"], [(4, date(2025, 1, 1))]) == 1
+        assert fetch_rows(db_connection, bulk_table)[1:] == [(2, "Bob", Decimal("3.25"), None),
+                                                             (3, None, None, date(2023, 12, 31)),
+                                                             (4, None, Decimal("0.00"), date(2025, 1, 1))]
+        tracker.clear(bulk_table)
+
+    with allure.step("Delete by key"):
+        expected = partitions_of(db_connection, tracker, bulk_table, [1, 3])
+        assert delete_rows(db_connection, bulk_table, ["id"], [(1,), (3,), (42,)], tracker=tracker) == 2
+        assert tracker.touched_partitions(bulk_table) == expected
+        assert delete_rows(db_connection, bulk_table, ["id"], [(4,)]) == 1
+        assert [row[0] for row in fetch_rows(db_connection, bulk_table)] == [2]
+
+@allure.title("Test a failing bulk statement rolls back the whole transaction")
+@pytest.mark.parametrize("method", ["values", "copy", "prepared"])
+def test_bulk_dml_rollback(bulk_table, db_connection, method):
+    insert_rows(db_connection, bulk_table, BULK_COLUMNS, BULK_ROWS[:1])
+
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        # The first page is inserted before the second one fails
+        insert_rows(db_connection, bulk_table, BULK_COLUMNS, [BULK_ROWS[1], BULK_ROWS[0]], page_size=1, method=method)
+    with pytest.raises(psycopg2.errors.InvalidDatetimeFormat):
+        update_rows(db_connection, bulk_table, ["id"], ["name", "day"], [(1, "Changed", date(2024, 5, 5)),
+                                                                         (1, "Changed", "not a date")], page_size=1)
+    with pytest.raises(ValueError, match="Unknown insert method"):
+        insert_rows(db_connection, bulk_table, BULK_COLUMNS, BULK_ROWS[1:], method="bulk")
+
+    assert fetch_rows(db_connection, bulk_table) == BULK_ROWS[:1]
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_prepared_statements")
+        assert cur.fetchone() == (0,)  # Prepared inserts are deallocated after the rollback as well
+
+@allure.title("Test the partition expression is indexed and the index selects partitions")
+def test_partition_index(bulk_table, db_connection):
+    insert_rows(db_connection, bulk_table, BULK_COLUMNS, BULK_ROWS)
+
+    with db_connection.cursor() as cur:
+        cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(bulk_table)))  # Opens a transaction
+
+    assert create_partition_index(bulk_table, ["id"], NUM_PARTITIONS)
+    assert create_partition_index(bulk_table, ["id"], NUM_PARTITIONS)  # Already there
+    assert db_connection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                    (partition_index_name(bulk_table, ["id"], NUM_PARTITIONS),))
+        assert cur.fetchone() == (True,)
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (bulk_table,))
+        assert partition_index_name(bulk_table, ["id"], NUM_PARTITIONS) in {row[0] for row in cur.fetchall()}
+        cur.execute("SET enable_seqscan = off")
+        cur.execute(sql.SQL("EXPLAIN SELECT * FROM {} WHERE {} = ANY(%s)").format(
+            sql.Identifier(bulk_table), partition_sql(["id"], NUM_PARTITIONS)
+        ), ([1, 2],))
+        assert "partition" in "\n".join(row[0] for row in cur.fetchall())
+        cur.execute("RESET enable_seqscan")
+
+    # The text form of a date depends on DateStyle, so it cannot be indexed
+    assert not create_partition_index(bulk_table, ["day"], NUM_PARTITIONS)
+    assert fetch_rows(db_connection, bulk_table) == BULK_ROWS
@@ -0,0 +1,134 @@
+import datetime
+from decimal import Decimal
+import allure
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from part_1_2.src.data_diff import TableDiff, canonical_text, DiffResult, RowDiff, _iter_parquet_rows, partition_of
+
+
+class FakeCatalogConnection:
+    """Answers the column and primary key lookups of TableDiff for a table of three columns."""
+
+    def __init__(self, primary_key):
+        self.primary_key = primary_key
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            description = None
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query, params=None):
+                self.rows = [(column,) for column in connection.primary_key] if params else []
+                self.description = [type("Column", (), {"name": name}) for name in ("test_id", "patient_id", "result")]
+
+            def fetchall(self):
+                return self.rows
+
+        return Cursor()
+
+
+@pytest.mark.parametrize(
+    "array, expected_text",
+    [
+        (pa.array([7168386, None]), ["7168386", "\\N"]),
+        (pa.array(["Dr. Mia Patel", ""]), ["Dr. Mia Patel", ""]),
+        (pa.array([datetime.date(2022, 3, 20)]), ["2022-03-20"]),
+        (pa.array([datetime.time(5, 20), datetime.time(16, 8, 0, 500000)], pa.time64('us')), ["05:20:00", "16:08:00.5"]),
+        (pa.array([Decimal("1.50")], pa.decimal128(5, 2)), ["1.50"]),
+        (pa.array([1.0, 0.25, None]), ["1", "0.25", "\\N"]),
+        (pa.array([True, False]), ["t", "f"]),
+    ],
+)
+@allure.title("Test Parquet values are rendered like PostgreSQL text output")
+def test_canonical_text(array, expected_text):
+    assert canonical_text(array) == expected_text
+
+
+@allure.title("Test rows are keyed by the primary key by default, and by all columns with a warning without one")
+def test_default_key_columns():
+    assert TableDiff(FakeCatalogConnection(["test_id"]), "lab_tests").key_columns == ["test_id"]
+    assert TableDiff(FakeCatalogConnection(["test_id"]), "lab_tests", ["patient_id"]).key_columns == ["patient_id"]
+    with pytest.warns(UserWarning, match="'lab_tests' has no primary key"):
+        assert TableDiff(FakeCatalogConnection([]), "lab_tests").key_columns == ["test_id", "patient_id", "result"]
+
+
+@allure.title("Test rows are matched between both sides as a multiset")
+def test_unmatched_rows():
+    db_rows = [(1, "a"), (1, "a"), (2, "b")]
+    parquet_rows = [(1, "a"), (3, "c")]
+
+    only_db, only_parquet = TableDiff._unmatched(db_rows, parquet_rows)
+
+    assert only_db == ["a", "b"]
+    assert only_parquet == ["c"]
+
+
+@allure.title("Test diff result summary")
+def test_diff_result_summary():
+    result = DiffResult("lab_tests", partitions_checked=64)
+    assert result.is_equal
+    assert "no differences" in str(result)
+
+    result.differing_partitions.append(3)
+    result.missing.append(RowDiff(("24117",), db_row={"test_id": "24117"}))
+    assert not result.is_equal
+    assert str(result) == "'lab_tests': 1 missing, 0 extra and 0 changed rows in 1 of 64 partitions"
+
+
+@allure.title("Test a truncated diff result says so")
+def test_truncated_diff_result_summary():
+    result = DiffResult("lab_tests", partitions_checked=64, differing_partitions=[3], truncated=True)
+    result.changed.append(RowDiff(("24117",), {"result": "1"}, {"result": "2"}))
+    assert str(result).endswith("(stopped after the first 1 differing rows)")
+
+
+@allure.title("Test differing partitions are grouped and large ones split by a finer partitioning")
+def test_drill_down_groups():
+    groups = TableDiff.drill_down_groups({1: 40, 2: 50, 5: 30, 7: 250}, num_partitions=8, max_group_rows=100)
+
+    assert groups == [([1, 2], 8), ([7], 24), ([15], 24), ([23], 24), ([5], 8)]
+    with allure.step("Verify the finer partitions of a partition cover exactly its keys"):
+        for key in map(str, range(1000)):
+            assert (partition_of(key, 24) in (7, 15, 23)) == (partition_of(key, 8) == 7)
+
+
+def write_parquet(path, results):
+    pq.write_table(pa.table({"test_id": [str(i) for i in range(len(results))], "patient_id": ["P1"] * len(results),
+                             "result": results}), path)
+    return pq.ParquetFile(path)
+
+
+@allure.title("Test the drill-down finds every difference in bounded groups and stops at max_rows")
+@pytest.mark.parametrize("max_rows, expected_changed", [(1000, 30), (10, 10)])
+def test_bounded_drill_down(tmp_path, monkeypatch, max_rows, expected_changed):
+    db_file = write_parquet(tmp_path / "db.parquet", [str(i) for i in range(300)])
+    export = write_parquet(tmp_path / "export.parquet", [str(i + (i % 10 == 0)) for i in range(300)])
+    diff = TableDiff(FakeCatalogConnection(["test_id"]), "lab_tests", num_partitions=4, batch_size=50,
+                     drill_down_rows=20, max_rows=max_rows)
+    groups = []
+
+    def db_rows(partitions, num_partitions):
+        groups.append((sorted(partitions), num_partitions))
+        return ((key, row_hash, values) for part, key, row_hash, values
+                in _iter_parquet_rows(db_file, diff.columns, diff.key_columns, num_partitions, diff.batch_size)
+                if part in partitions)
+
+    monkeypatch.setattr(diff, "db_digests", lambda partitions: diff.parquet_digests([db_file], partitions))
+    monkeypatch.setattr(diff, "_db_rows", db_rows)
+
+    result = diff.diff([export])
+
+    assert len(result.changed) == expected_changed and not result.missing and not result.extra
+    assert result.truncated == (max_rows < 30)
+    assert all(len(partitions) == 1 and num_partitions > 4 for partitions, num_partitions in groups)
+    if not result.truncated:
+        assert sorted(int(row.key[0]) for row in result.changed) == list(range(0, 300, 10))
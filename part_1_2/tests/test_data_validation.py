@@ -1,27 +1,46 @@
-from pathlib import Path
 import allure
-import pandas as pd
-import pytest
-from part_1_2.config.config import CONFIG
-from part_1_2.src.utils.aws_utils import download_parquet
-from part_1_2.src.utils.db_utils import fetch_table_data
-from part_1_2.src.utils.file_utils import get_csv_file_paths
-
-@pytest.mark.run(order=2)
+from part_1_2.src.data_diff import validate_table
+from part_1_2.src.utils.aws_utils import open_parquet
+
 @allure.title("Test Data Consistency Between DB and S3")
-def test_data_consistency(db_connection, s3_client):
-    bucket_name = CONFIG["aws"]["bucket_name"]
+def test_data_consistency(exported_table, db_connection, s3):
+    table_name = exported_table.name
+
+    with allure.step(f"Opening Parquet data from S3 for table '{table_name}'"):
+        parquet_file = open_parquet(s3.s3_client, s3.bucket_name, exported_table.object_key)
+
+    with allure.step(f"Verifying consistency between DB and Parquet data for table '{table_name}'"):
+        validate_table(db_connection, table_name, parquet_file)
+
+@allure.title("Test Statistics-Based Fast Validation Between DB and S3")
+def test_fast_validation(exported_table, db_connection, s3):
+    with allure.step(f"Comparing table statistics with the Parquet footer of '{exported_table.name}'"):
+        result = s3.validate_stats(exported_table.name, db_connection)
+
+    assert result.mismatches == [], result.mismatches
+    assert result.diff is None
+
+# Partition column and date granularity of the partitioned export of each table
+DATASET_PARTITIONING = {
+    "admissions": ("department", None),
+    "lab_tests": ("order_date", "month"),
+    "patient_information": ("blood_type", None),
+}
+
+@allure.title("Test Partitioned Export and Partition-Pruned Validation")
+def test_partitioned_dataset_consistency(exported_table, db_connection, s3):
+    table_name = exported_table.name
+    partition_column, granularity = DATASET_PARTITIONING[table_name]
 
-    directory_path = Path(__file__).resolve().parent / 'tests_data'
-    for csv_path in get_csv_file_paths(directory_path):
-        table_name = csv_path.stem
-        parquet_key = f"output/{table_name}.parquet"
+    with allure.step(f"Exporting '{table_name}' partitioned by '{partition_column}'"):
+        manifest = s3.upload_parquet_dataset(table_name, db_connection, partition_column, granularity)
+        assert manifest["rows"] == exported_table.rows
 
-        with allure.step(f"Fetching data from DB for table '{table_name}'"):
-            db_data = fetch_table_data(db_connection, table_name)
+    selected = [entry["value"] for entry in manifest["partitions"][:2]]
+    selected_rows = sum(entry["rows"] for entry in manifest["partitions"][:2])
 
-        with allure.step(f"Downloading Parquet data from S3 for table '{table_name}'"):
-            parquet_data = download_parquet(s3_client, bucket_name, parquet_key)
+    with allure.step(f"Validating only the partitions {selected}"):
+        s3.validate_dataset(db_connection, manifest, partitions=selected)
 
-        with allure.step(f"Verifying consistency between DB and Parquet data for table '{table_name}'"):
-            pd.testing.assert_frame_equal(db_data, parquet_data, check_dtype=False)
\ No newline at end of file
+    with allure.step(f"Downloading only the partitions {selected}"):
+        assert len(s3.download_dataset(manifest, partitions=selected)) == selected_rows
@@ -0,0 +1,55 @@
+import json
+import allure
+import pytest
+
+from part_1_2.src.utils.instrumentation import Instrumentation
+
+
+@allure.title("Test a stage records wall time, rows, bytes and peak memory")
+def test_stage_is_recorded():
+    metrics = Instrumentation(enabled=True)
+    with metrics.stage("copy", "admissions") as record:
+        record.rows, record.bytes = 100, 4096
+
+    [record] = metrics.records
+    assert (record.stage, record.table, record.rows, record.bytes) == ("copy", "admissions", 100, 4096)
+    assert record.seconds > 0
+    assert record.peak_memory_bytes > 0
+    assert record.error is None
+
+
+@allure.title("Test a failing stage is recorded with its error")
+def test_failed_stage_is_recorded():
+    metrics = Instrumentation(enabled=True)
+    with pytest.raises(ValueError):
+        with metrics.stage("validation", "lab_tests"):
+            raise ValueError("boom")
+
+    assert metrics.records[0].error == "ValueError: boom"
+
+
+@allure.title("Test disabled instrumentation records nothing")
+def test_disabled_stage_is_a_no_op():
+    metrics = Instrumentation(enabled=False)
+    with metrics.stage("export", "admissions") as record:
+        record.rows += 10
+    metrics.record("upload", "output/admissions.parquet", 1.0)
+
+    assert metrics.records == []
+
+
+@allure.title("Test the JSON timeline and the Prometheus text output")
+def test_reports():
+    metrics = Instrumentation(enabled=True)
+    metrics.record("copy", "admissions", 2.0, rows=100, size_bytes=1000)
+    metrics.record("copy", "admissions", 1.0, rows=50, size_bytes=500)
+    metrics.record("export", 'lab "tests"', 0.5, rows=10)
+
+    timeline = json.loads(metrics.to_json_timeline())
+    assert [entry["stage"] for entry in timeline] == ["copy", "copy", "export"]
+
+    prometheus = metrics.to_prometheus()
+    assert 'pipeline_stage_duration_seconds_total{stage="copy",table="admissions"} 3.0' in prometheus
+    assert 'pipeline_stage_rows_total{stage="copy",table="admissions"} 150' in prometheus
+    assert 'pipeline_stage_runs_total{stage="export",table="lab \\"tests\\""} 1' in prometheus
+    assert "# TYPE pipeline_stage_peak_memory_bytes gauge" in prometheus
@@ -0,0 +1,184 @@
+import hashlib
+import io
+import os
+
+import allure
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from botocore.exceptions import ClientError
+
+from part_1_2.config.config import CONFIG
+from part_1_2.src.s3_client import S3Client, UploadResult
+from part_1_2.src.utils.aws_utils import MIN_PART_SIZE, S3MultipartWriter, clear_s3_clients, delete_prefix, \
+    download_parquet, download_parquet_files, get_s3_client, head_object, read_parquet_schema
+from part_1_2.src.utils.instrumentation import instrumentation
+from part_1_2.src.utils.object_store import LocalObjectStore, MemoryObjectStore, ObjectStore
+from part_1_2.tests.test_copy_fetch import FakeCopyOutConnection
+
+
+@pytest.fixture(params=["memory", "local"])
+def store(request, tmp_path):
+    """Fixture for an empty in-process object store of each backend."""
+    return MemoryObjectStore() if request.param == "memory" else LocalObjectStore(tmp_path / "objects")
+
+
+@allure.title("Test objects are written, read back with ranges and deleted like in S3")
+def test_put_get_and_ranges(store):
+    body = bytes(range(256)) * 4
+    etag = store.put_object(Bucket="bucket", Key="output/data.bin", Body=body, Metadata={"kind": "test"})["ETag"]
+
+    assert etag == f'"{hashlib.md5(body).hexdigest()}"'
+    assert store.get_object(Bucket="bucket", Key="output/data.bin")["Body"].read() == body
+
+    response = store.get_object(Bucket="bucket", Key="output/data.bin", Range="bytes=10-19")
+    assert response["Body"].read() == body[10:20]
+    assert response["ContentRange"] == f"bytes 10-19/{len(body)}"
+    suffix = store.get_object(Bucket="bucket", Key="output/data.bin", Range="bytes=-100")
+    assert suffix["Body"].read() == body[-100:]
+    assert store.get_object(Bucket="bucket", Key="output/data.bin", Range="bytes=-5000")["Body"].read() == body
+    with pytest.raises(ClientError) as error:
+        store.get_object(Bucket="bucket", Key="output/data.bin", Range=f"bytes={len(body)}-")
+    assert error.value.response["Error"]["Code"] == "InvalidRange"
+
+    head = store.head_object(Bucket="bucket", Key="output/data.bin")
+    assert (head["ContentLength"], head["ETag"], head["Metadata"]) == (len(body), etag, {"kind": "test"})
+
+    store.delete_object(Bucket="bucket", Key="output/data.bin")
+    store.delete_object(Bucket="bucket", Key="output/data.bin")
+    assert head_object(store, "bucket", "output/data.bin") is None
+    with pytest.raises(store.exceptions.NoSuchKey):
+        store.get_object(Bucket="bucket", Key="output/data.bin")
+
+
+@allure.title("Test multipart uploads check their parts and get the S3 multipart ETag")
+def test_multipart_upload(store):
+    data = os.urandom(2 * MIN_PART_SIZE + 1000)
+    with S3MultipartWriter(store, "bucket", "output/table.parquet", part_size=MIN_PART_SIZE,
+                           max_concurrency=2, metadata={"source-digest": "abc"}) as sink:
+        sink.write(data)
+
+    head = store.head_object(Bucket="bucket", Key="output/table.parquet")
+    assert head["ETag"] == sink.etag
+    assert head["ContentLength"] == len(data)
+    assert head["Metadata"] == {"source-digest": "abc"}
+    assert store.get_object(Bucket="bucket", Key="output/table.parquet")["Body"].read() == data
+
+    upload_id = store.create_multipart_upload(Bucket="bucket", Key="small")["UploadId"]
+    parts = [{"PartNumber": number, "ETag": store.upload_part(Bucket="bucket", Key="small", UploadId=upload_id,
+                                                              PartNumber=number, Body=b"x")["ETag"]}
+             for number in (1, 2)]
+    with pytest.raises(ClientError) as error:
+        store.complete_multipart_upload(Bucket="bucket", Key="small", UploadId=upload_id,
+                                        MultipartUpload={"Parts": parts})
+    assert error.value.response["Error"]["Code"] == "EntityTooSmall"
+    store.abort_multipart_upload(Bucket="bucket", Key="small", UploadId=upload_id)
+    assert head_object(store, "bucket", "small") is None
+    with pytest.raises(store.exceptions.NoSuchUpload):
+        store.upload_part(Bucket="bucket", Key="small", UploadId=upload_id, PartNumber=3, Body=b"x")
+
+
+@allure.title("Test an aborted writer leaves no object behind")
+def test_aborted_upload(store):
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(store, "bucket", "output/partial.parquet") as sink:
+            sink.write(b"half of a file")
+            raise RuntimeError("export failed")
+    assert head_object(store, "bucket", "output/partial.parquet") is None
+
+
+@allure.title("Test listing pages through keys in order and delete_prefix removes them")
+def test_list_and_delete_prefix(store):
+    for index in range(5):
+        store.put_object(Bucket="bucket", Key=f"run/part-{index}.parquet", Body=b"data")
+    store.put_object(Bucket="bucket", Key="other/file", Body=b"data")
+
+    pages = list(store.get_paginator("list_objects_v2").paginate(Bucket="bucket", Prefix="run/", MaxKeys=2))
+    assert [len(page["Contents"]) for page in pages] == [2, 2, 1]
+    assert [obj["Key"] for page in pages for obj in page["Contents"]] == \
+        [f"run/part-{index}.parquet" for index in range(5)]
+
+    assert delete_prefix(store, "bucket", "run/") == 5
+    assert store.list_objects_v2(Bucket="bucket", Prefix="run/")["KeyCount"] == 0
+    assert head_object(store, "bucket", "other/file") is not None
+
+
+@allure.title("Test Parquet exports are read and validated through the object store")
+def test_parquet_round_trip(store):
+    frame = pd.DataFrame({"patient_id": range(1000), "result": [f"value {i}" for i in range(1000)]})
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), buffer, row_group_size=100)
+    with S3MultipartWriter(store, "bucket", "output/lab_tests.parquet") as sink:
+        sink.write(buffer.getvalue())
+
+    assert download_parquet(store, "bucket", "output/lab_tests.parquet", as_pandas=True).equals(frame)
+    ranged = download_parquet(store, "bucket", "output/lab_tests.parquet", filters=[("patient_id", "<", 10)],
+                              ranged=True)
+    assert ranged.to_pandas().equals(frame[frame.patient_id < 10])
+    assert read_parquet_schema(store, "bucket", "output/lab_tests.parquet").names == ["patient_id", "result"]
+
+    client = S3Client(store, "bucket")
+    client.uploads[sink.object_key] = UploadResult("lab_tests", sink.object_key, sink.tell(), sink.etag)
+    assert client.validate_upload(sink.object_key)
+    client.uploads[sink.object_key] = UploadResult("lab_tests", sink.object_key, sink.tell(), '"stale"')
+    assert not client.validate_upload(sink.object_key)
+    assert not client.validate_upload("output/missing.parquet")
+    assert client.read_manifest("lab_tests", "date") is None
+
+
+@allure.title("Test an upload that does not skip unchanged tables reads the table only once")
+def test_upload_without_skip(store, monkeypatch):
+    monkeypatch.setattr(S3Client, "source_digest", staticmethod(lambda *args: pytest.fail("Digest computed")))
+    connection = FakeCopyOutConnection(['1,Ann,2024-03-20,05:20:00,1.50,t\n', '2,Bob,,,,f\n'])
+
+    object_key = S3Client(store, "bucket").upload_parquet("patient_information", connection, skip_unchanged=False)
+
+    assert download_parquet(store, "bucket", object_key).num_rows == 2
+    assert store.head_object(Bucket="bucket", Key=object_key)["Metadata"] == {}
+    assert [statement.startswith("COPY") for statement in connection.statements].count(True) == 1
+
+
+@allure.title("Test the S3 backend setting selects a shared in-process store")
+def test_backend_selection(monkeypatch, tmp_path):
+    monkeypatch.setitem(CONFIG["aws"], "backend", "local")
+    monkeypatch.setitem(CONFIG["aws"], "local_root", str(tmp_path))
+    clear_s3_clients()
+    try:
+        client = get_s3_client()
+        assert isinstance(client, LocalObjectStore) and client is get_s3_client()
+        client.put_object(Bucket="bucket", Key="output/a.txt", Body=b"local")
+        assert (tmp_path / "bucket" / "output" / "a.txt").read_bytes() == b"local"
+    finally:
+        clear_s3_clients()
+
+
+@allure.title("Test the base store cannot be used without every storage hook")
+def test_storage_hooks_are_abstract():
+    class NoParts(ObjectStore):
+        _stat = _open = _write = _remove = _keys = MemoryObjectStore._stat
+
+    with pytest.raises(TypeError, match="abstract"):
+        ObjectStore()
+    with pytest.raises(TypeError, match="_write_part"):
+        NoParts()
+
+
+@allure.title("Test transfer stages are labelled with the table and record the object key separately")
+def test_transfer_stage_labels(store, monkeypatch):
+    monkeypatch.setattr(instrumentation, "enabled", True)
+    monkeypatch.setattr(instrumentation, "records", [])
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({"patient_id": [1, 2]}), buffer)
+    keys = [f"output/lab_tests/bucket={partition}/data.parquet" for partition in (1, 12)]
+    for key in keys:
+        with S3MultipartWriter(store, "bucket", key, table_name="lab_tests") as sink:
+            sink.write(buffer.getvalue())
+
+    download_parquet(store, "bucket", keys[0], table_name="lab_tests")
+    assert download_parquet_files(store, "bucket", keys, table_name="lab_tests").num_rows == 4
+
+    labels = [(record.stage, record.table, record.object_key) for record in instrumentation.records]
+    assert labels == [("upload", "lab_tests", keys[0]), ("upload", "lab_tests", keys[1]),
+                      ("download", "lab_tests", keys[0]), ("download", "lab_tests", "output/lab_tests")]
+    assert 'pipeline_stage_runs_total{stage="upload",table="lab_tests"} 2' in instrumentation.to_prometheus()
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import allure
+import pytest
+
+from part_1_2.src import pipeline as pipeline_module
+from part_1_2.src.pipeline import BLOCKED, DONE, FAILED, SKIPPED, CheckpointManifest, Job, JobResult, Pipeline, \
+    build_dag, run_dag
+
+
+@allure.title("Test the DAG chains the stages of each table and keeps tables independent")
+def test_build_dag(tmp_path):
+    paths = [tmp_path / "patients.csv", tmp_path / "lab_tests.csv"]
+
+    dag = build_dag(paths, stages=["validate", "load"])
+
+    load, validate = Job("lab_tests", "load", paths[1]), Job("lab_tests", "validate", paths[1])
+    assert list(dag)[:2] == [load, validate]
+    assert dag[load] == [] and dag[validate] == [load]
+    assert set(build_dag(paths, table_names={"patients"})) == {Job("patients", stage, paths[0])
+                                                                for stage in ("load", "export", "validate")}
+
+
+@allure.title("Test jobs run concurrently in dependency order and a failure blocks only its table")
+def test_run_dag(tmp_path):
+    dag = build_dag([tmp_path / f"table_{index}.csv" for index in range(3)])
+    finished, running, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def run_job(job):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+            finished.append(job)
+        if job.table_name == "table_1" and job.stage == "export":
+            return JobResult(job, FAILED, detail="upload failed")
+        return JobResult(job, DONE)
+
+    results = run_dag(dag, run_job, max_workers=3)
+
+    assert peak[0] > 1
+    for job, upstream in dag.items():
+        for before in upstream:
+            if job in finished:
+                assert finished.index(before) < finished.index(job)
+    statuses = {(job.table_name, job.stage): result.status for job, result in results.items()}
+    assert statuses[("table_1", "validate")] == BLOCKED
+    assert statuses[("table_0", "validate")] == statuses[("table_2", "validate")] == DONE
+
+
+@allure.title("Test the checkpoint survives a restart and caches file checksums")
+def test_checkpoint_manifest(tmp_path):
+    csv_path = tmp_path / "patients.csv"
+    csv_path.write_text("id,name\n1,Ann\n")
+    checkpoint = CheckpointManifest(tmp_path / "checkpoint.json")
+
+    first = checkpoint.file_checksum(csv_path)
+    checkpoint.complete("patients", "load", "input", "1:42", 0.5)
+
+    reopened = CheckpointManifest(tmp_path / "checkpoint.json")
+    assert reopened.get("patients", "load")["output"] == "1:42"
+    assert reopened.get("patients", "export") is None
+    assert reopened.file_checksum(csv_path) == first
+    csv_path.write_text("id,name\n1,Ann\n2,Bob\n")
+    assert reopened.file_checksum(csv_path) != first
+
+
+class FakeDatabase:
+    """Table digests and load calls standing in for PostgreSQL in Pipeline._load."""
+
+    def __init__(self):
+        self.digests = {}
+        self.loads = []
+
+    def ingest(self, pool, csv_path, clear_table=False, null_token="NULL"):
+        self.loads.append(csv_path.stem)
+        self.digests[csv_path.stem] = f"{len(csv_path.read_text().splitlines()) - 1}:{hash(csv_path.read_text())}"
+
+
+@allure.title("Test a rerun skips loads whose file and table are unchanged")
+def test_load_is_skipped_when_unchanged(tmp_path, monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(pipeline_module, "ingest_csv_file", database.ingest)
+    monkeypatch.setattr(Pipeline, "_table_digest", lambda self, table_name: database.digests.get(table_name))
+    csv_path = tmp_path / "patients.csv"
+    csv_path.write_text("id,name\n1,Ann\n")
+    dag = build_dag([csv_path], stages=["load"])
+
+    def run(**kwargs):
+        pipeline = Pipeline(None, None, CheckpointManifest(tmp_path / "checkpoint.json"), **kwargs)
+        return [result.status for result in pipeline.run(dag).values()]
+
+    assert run() == [DONE]
+    assert run() == [SKIPPED]
+    database.digests["patients"] = "0:0"  # Table emptied since the last run
+    assert run() == [DONE]
+    csv_path.write_text("id,name\n1,Ann\n2,Bob\n")
+    assert run() == [DONE]
+    assert run(force=True) == [DONE]
+    assert database.loads == ["patients"] * 4
+
+
+@allure.title("Test a failing stage is reported with its error")
+def test_failed_job(tmp_path):
+    pipeline = Pipeline(None, None, CheckpointManifest(tmp_path / "checkpoint.json"))
+
+    result = pipeline.run_job(Job("missing", "load", tmp_path / "missing.csv"))
+
+    assert result.status == FAILED
+    assert result.detail.startswith("FileNotFoundError")
+    with pytest.raises(KeyError):
+        pipeline.checkpoint.data["tables"]["missing"]
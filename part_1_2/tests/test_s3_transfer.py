@@ -0,0 +1,159 @@
+import hashlib
+import io
+import threading
+import time
+import allure
+import pytest
+from botocore.exceptions import ClientError
+
+from part_1_2.src.s3_client import S3Client, UploadResult
+from part_1_2.src.utils.aws_utils import MIN_PART_SIZE, S3MultipartWriter, S3RangeReader
+from part_1_2.src.utils.object_store import MemoryObjectStore
+
+
+class CountingStore(MemoryObjectStore):
+    """In-process object store recording the GET ranges and HEAD requests it serves."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def get_object(self, **kwargs):
+        self.requests.append(("GET", kwargs.get("Range")))
+        return super().get_object(**kwargs)
+
+    def head_object(self, **kwargs):
+        self.requests.append(("HEAD", None))
+        return super().head_object(**kwargs)
+
+
+class FakeS3:
+    """In-memory stand-in for the multipart upload and HEAD calls of an S3 client."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, Metadata):
+        self.requests.append("create_multipart_upload")
+        self.uploads[Key] = {"parts": {}, "metadata": Metadata}
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.requests.append("upload_part")
+            self.uploads[UploadId]["parts"][PartNumber] = Body
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.requests.append("complete_multipart_upload")
+        upload = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(upload["parts"])
+        bodies = [upload["parts"][number] for number in numbers]
+        etag = hashlib.md5(b"".join(hashlib.md5(body).digest() for body in bodies)).hexdigest()
+        self.objects[Key] = {"Body": b"".join(bodies), "ETag": f'"{etag}-{len(bodies)}"',
+                             "Metadata": upload["metadata"]}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.requests.append("abort_multipart_upload")
+        self.uploads.pop(UploadId, None)
+
+    def head_object(self, Bucket, Key):
+        self.requests.append("head_object")
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        stored = self.objects[Key]
+        return {"ContentLength": len(stored["Body"]), "ETag": stored["ETag"], "Metadata": stored["Metadata"]}
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+@allure.title("Test multipart uploads keep part order and predict the S3 ETag")
+def test_multipart_writer(max_concurrency):
+    s3 = FakeS3()
+    data = bytes(range(256)) * (3 * MIN_PART_SIZE // 256 + 1000)
+
+    with S3MultipartWriter(s3, "bucket", "output/table.parquet", part_size=MIN_PART_SIZE,
+                           max_concurrency=max_concurrency, metadata={"source-digest": "abc"}) as sink:
+        for start in range(0, len(data), 1_000_000):
+            sink.write(data[start:start + 1_000_000])
+
+    stored = s3.objects["output/table.parquet"]
+    assert stored["Body"] == data
+    assert stored["ETag"] == sink.etag
+    assert stored["Metadata"] == {"source-digest": "abc"}
+    assert sink.sha256 == hashlib.sha256(data).hexdigest()
+    assert s3.requests.count("upload_part") == 4
+
+
+class SlowS3(FakeS3):
+    """FakeS3 taking a fixed time for every part upload."""
+
+    def upload_part(self, **kwargs):
+        time.sleep(0.1)
+        return super().upload_part(**kwargs)
+
+
+@allure.title("Test concurrent part uploads are timed as wall time, not as the sum of the parts")
+def test_multipart_writer_upload_time():
+    with S3MultipartWriter(SlowS3(), "bucket", "output/table.parquet", part_size=MIN_PART_SIZE,
+                           max_concurrency=4) as sink:
+        sink.write(bytes(4 * MIN_PART_SIZE))
+
+    assert 0.1 <= sink._upload_seconds < 0.3
+
+
+@allure.title("Test upload validation is a single HEAD request checking size and ETag")
+def test_validate_upload_with_head():
+    s3 = FakeS3()
+    client = S3Client(s3, "bucket")
+    with S3MultipartWriter(s3, "bucket", "output/lab_tests.parquet") as sink:
+        sink.write(b"parquet bytes")
+    client.uploads[sink.object_key] = UploadResult("lab_tests", sink.object_key, sink.tell(), sink.etag)
+    s3.requests.clear()
+
+    assert client.validate_upload("output/lab_tests.parquet")
+    assert s3.requests == ["head_object"]
+    assert not client.validate_upload("output/admissions.parquet")
+
+    s3.objects["output/lab_tests.parquet"]["Body"] = b"truncated"
+    assert not client.validate_upload("output/lab_tests.parquet")
+
+
+@allure.title("Test the range reader serves the tail from one request and fetches other ranges on demand")
+def test_range_reader():
+    store = CountingStore()
+    body = bytes(range(256)) * 40
+    store.put_object(Bucket="bucket", Key="data.bin", Body=body)
+
+    reader = S3RangeReader(store, "bucket", "data.bin", tail_size=1000)
+    assert reader.size == len(body)
+    reader.seek(-100, io.SEEK_END)
+    assert reader.read() == body[-100:]
+    assert store.requests == [("GET", "bytes=-1000")]
+
+    reader.seek(10)
+    assert reader.read(20) == body[10:30] and reader.tell() == 30
+    assert store.requests[-1] == ("GET", "bytes=10-29")
+    reader.seek(5, io.SEEK_CUR)
+    assert reader.read(10_000) == body[35:10_035]
+    assert reader.read() == body[10_035:]
+    assert reader.read() == b""
+
+    small = S3RangeReader(store, "bucket", "data.bin", tail_size=len(body) * 2)
+    assert (small.size, small.read()) == (len(body), body)
+
+
+@allure.title("Test the range reader opens an empty object and still fails on a missing one")
+def test_range_reader_empty_object():
+    store = CountingStore()
+    store.put_object(Bucket="bucket", Key="empty.bin", Body=b"")
+
+    reader = S3RangeReader(store, "bucket", "empty.bin")
+
+    assert (reader.size, reader.read(), reader.read(10)) == (0, b"", b"")
+    assert store.requests == [("GET", "bytes=-65536"), ("HEAD", None)]
+    with pytest.raises(store.exceptions.NoSuchKey):
+        S3RangeReader(store, "bucket", "missing.bin")
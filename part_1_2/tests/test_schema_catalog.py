@@ -0,0 +1,65 @@
+import allure
+import pyarrow as pa
+
+from part_1_2.src.schema_catalog import SchemaCatalog
+from part_1_2.src.utils.aws_utils import parquet_dtypes
+
+
+class FakeCatalogConnection:
+    """Answers the catalog query from a fixed list of rows and counts the queries."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query):
+                connection.queries += 1
+
+            def fetchall(self):
+                return list(connection.rows)
+
+        return Cursor()
+
+
+@allure.title("Test all table schemas are loaded with one catalog query and cached")
+def test_catalog_is_loaded_once():
+    connection = FakeCatalogConnection([
+        ("admissions", "patient_id", "integer"),
+        ("admissions", "admission_date", "date"),
+        ("lab_tests", "test_id", "integer"),
+    ])
+    catalog = SchemaCatalog()
+
+    assert catalog.table_schema("admissions", connection) == [("patient_id", "integer"), ("admission_date", "date")]
+    assert catalog.column_names("lab_tests", connection) == ["test_id"]
+    assert catalog.table_names(connection) == ["admissions", "lab_tests"]
+    assert connection.queries == 1
+
+
+@allure.title("Test invalidation reloads the catalog after DDL")
+def test_catalog_invalidation():
+    connection = FakeCatalogConnection([("lab_tests", "test_id", "integer")])
+    catalog = SchemaCatalog()
+    catalog.table_schema("lab_tests", connection)
+
+    connection.rows.append(("lab_tests", "test_name", "character varying"))
+    catalog.invalidate("lab_tests")
+
+    assert catalog.column_names("lab_tests", connection) == ["test_id", "test_name"]
+    assert connection.queries == 2
+
+
+@allure.title("Test pandas dtypes are derived from a Parquet schema without data")
+def test_parquet_dtypes():
+    schema = pa.schema([("patient_id", pa.int64()), ("admission_date", pa.date32())])
+    assert parquet_dtypes(schema) == {"patient_id": "int64", "admission_date": "object"}
@@ -0,0 +1,111 @@
+import hashlib
+import io
+
+import allure
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from part_1_2.src import table_stats
+from part_1_2.src.data_diff import DiffResult, RowDiff
+from part_1_2.src.table_stats import ColumnSketches, compare_stats, fast_validate_table, parquet_stats
+from part_1_2.src.utils.sketches import HLL_PRECISION, HyperLogLog
+
+
+def write_parquet(table, row_group_size=2):
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, table.schema) as writer:
+        sketches = ColumnSketches(table.schema)
+        for batch in table.to_batches(max_chunksize=row_group_size):
+            writer.write_batch(batch)
+            sketches.update(batch)
+        sketches.add_to(writer)
+    return pq.ParquetFile(io.BytesIO(sink.getvalue()))
+
+
+def md5_sketch(texts):
+    """The registers stats_query computes in PostgreSQL from md5 of the text form of each value."""
+    sketch = HyperLogLog()
+    remaining_bits = 64 - HLL_PRECISION
+    for text in texts:
+        value = int(hashlib.md5(text.encode()).hexdigest()[:16], 16)
+        rank = remaining_bits + 1 - (value & ((1 << remaining_bits) - 1)).bit_length()
+        sketch.set_registers([value >> remaining_bits], [rank])
+    return sketch
+
+
+TABLE = pa.table({
+    "id": pa.array([1, 2, 3, 4, 5], pa.int64()),
+    "name": pa.array(["b", "Zed", None, "a", "é"]),
+    "score": pa.array([1.5, None, None, float("nan"), 0.0]),
+})
+
+
+@allure.title("Test table statistics are read from the Parquet footers only")
+def test_parquet_stats():
+    stats = parquet_stats([write_parquet(TABLE.slice(0, 3)), write_parquet(TABLE.slice(3))])
+
+    assert stats.rows == 5
+    assert stats.columns["id"].null_count == 0
+    assert (stats.columns["id"].min, stats.columns["id"].max) == ("1", "5")
+    # Text is ordered by bytes across row groups and files, like COLLATE "C"
+    assert (stats.columns["name"].min, stats.columns["name"].max) == ("Zed", "é")
+    assert stats.columns["name"].null_count == 1
+    assert stats.columns["score"].null_count == 2
+    assert round(stats.columns["name"].sketch.estimate()) == 4
+
+
+@allure.title("Test distinct counts from different hashes agree within the comparison tolerance")
+def test_sketches_of_both_sides_agree():
+    values = np.random.default_rng(7).integers(0, 50_000, 100_000)
+    parquet_side = HyperLogLog()
+    parquet_side.add_array(pa.array(values))
+    db_side = md5_sketch(str(value) for value in values)
+    exact = len(np.unique(values))
+
+    for sketch in (parquet_side, db_side):
+        assert abs(sketch.estimate() - exact) < 4 * sketch.relative_error * exact
+
+    db = table_stats.TableStats(rows=1, columns={"v": table_stats.ColumnStats(0, sketch=db_side)})
+    parquet = table_stats.TableStats(rows=1, columns={"v": table_stats.ColumnStats(0, sketch=parquet_side)})
+    assert compare_stats(db, parquet) == []
+
+
+@allure.title("Test differing statistics are reported")
+def test_compare_stats_mismatches():
+    parquet = parquet_stats(write_parquet(TABLE))
+    db = parquet_stats(write_parquet(pa.table({
+        "id": pa.array([1, 2, 3, 4, 6], pa.int64()),
+        "name": pa.array(["b", "Zed", None, None, "é"]),
+        "score": TABLE["score"],
+    })))
+    db.columns["name"].sketch = md5_sketch(["b", "Zed", "é", "c", "d", "e", "f", "g"])
+
+    assert compare_stats(db, parquet) == [
+        "id max: 6 in the table, 5 in Parquet",
+        "name nulls: 2 in the table, 1 in Parquet",
+        "name distinct: ~8 in the table, ~4 in Parquet",
+    ]
+
+
+@pytest.mark.parametrize("diff_is_equal", [True, False])
+@allure.title("Test a statistics mismatch escalates to the full comparison")
+def test_fast_validation_escalates(mocker, diff_is_equal):
+    parquet_file = write_parquet(TABLE)
+    db = parquet_stats(parquet_file)
+    db.rows = 6
+    mocker.patch.object(table_stats, "fetch_table_schema", return_value=[("id", "bigint"), ("name", "text")])
+    mocker.patch.object(table_stats, "db_stats", return_value=db)
+    diff = DiffResult("t", partitions_checked=64)
+    if not diff_is_equal:
+        diff.missing.append(RowDiff(key=("6",), db_row={"id": "6"}))
+    diff_table = mocker.patch.object(table_stats, "diff_table", return_value=diff)
+
+    if diff_is_equal:
+        result = fast_validate_table(None, "t", parquet_file)
+        assert result.mismatches == ["rows: 6 in the table, 5 in Parquet"] and result.is_valid
+    else:
+        with pytest.raises(AssertionError, match="1 missing"):
+            fast_validate_table(None, "t", parquet_file)
+    diff_table.assert_called_once()
@@ -0,0 +1,92 @@
+from pathlib import Path
+import allure
+import pandas as pd
+import pytest
+
+from part_1_2.src.table_creation import TableCreator
+from part_1_2.src.type_inference import ColumnTypeInferrer, widen, INT, BIGINT, NUMERIC, DATE, TIME, STRING, UNKNOWN
+
+TESTS_DATA = Path(__file__).resolve().parent / 'tests_data'
+
+
+@allure.title("Test column type inference on the test data files")
+def test_infer_test_data_types():
+    result = ColumnTypeInferrer().infer(TESTS_DATA / 'admissions.csv')
+
+    with allure.step("Verify inferred types"):
+        assert dict(result.column_types) == {
+            'patient_id': 'INT',
+            'hospitalization_case_number': 'INT',
+            'admission_date': 'DATE',
+            'admission_time': 'TIME',
+            'release_date': 'DATE',
+            'release_time': 'TIME',
+            'department': 'VARCHAR(255)',
+            'room_number': 'VARCHAR(255)',
+        }
+
+    with allure.step("Verify inference report"):
+        assert result.rows_scanned == 100
+        assert result.elapsed_seconds >= 0
+        assert not result.sampled
+
+
+@pytest.mark.parametrize(
+    "values, expected_type",
+    [
+        (["1", "-20", "+300"], INT),
+        (["1", "3000000000"], BIGINT),
+        (["1", "99999999999999999999"], NUMERIC),
+        (["1.5", "2", "1e3"], NUMERIC),
+        (["3/20/2022", "2018-10-21"], DATE),
+        (["2/30/2022"], STRING),
+        (["5:20:00 AM", "16:08", "12:04:00 PM"], TIME),
+        (["13:00:00 PM"], STRING),
+        (["305A", "1"], STRING),
+    ],
+)
+@allure.title("Test classification of a single column")
+def test_classify(values, expected_type):
+    assert ColumnTypeInferrer.classify(pd.Series(values)) == expected_type
+
+
+@pytest.mark.parametrize(
+    "current, new, expected_type",
+    [
+        (UNKNOWN, INT, INT),
+        (INT, BIGINT, BIGINT),
+        (NUMERIC, INT, NUMERIC),
+        (DATE, DATE, DATE),
+        (DATE, TIME, STRING),
+        (INT, DATE, STRING),
+    ],
+)
+@allure.title("Test type widening")
+def test_widen(current, new, expected_type):
+    assert widen(current, new) == expected_type
+
+
+@allure.title("Test type widening across chunks, NULL tokens and sampling")
+def test_infer_chunks_and_sample(tmp_path):
+    csv_path = tmp_path / 'sample.csv'
+    rows = ["id,amount,note,empty"] + [f"{i},{i},NULL,NULL" for i in range(10)] + ["3000000000,1.5,x" + "y" * 300 + ",NULL"]
+    csv_path.write_text("\n".join(rows) + "\n")
+
+    result = ColumnTypeInferrer(chunk_size=3).infer(csv_path)
+    assert result.column_types == [('id', 'BIGINT'), ('amount', 'NUMERIC'), ('note', 'TEXT'), ('empty', 'VARCHAR(255)')]
+    assert result.rows_scanned == 11
+
+    sampled = ColumnTypeInferrer(sample_rows=5, chunk_size=3).infer(csv_path)
+    assert sampled.column_types[0] == ('id', 'INT')
+    assert sampled.rows_scanned == 5
+    assert sampled.sampled
+
+
+@pytest.mark.parametrize(
+    "value, is_date, is_float",
+    [("3/20/2022", True, False), ("2018-10-21", True, False), ("2022-02-30", False, False), ("1.5", False, True), ("NULL", False, False)],
+)
+@allure.title("Test value helpers of the table creator")
+def test_table_creator_value_helpers(value, is_date, is_float):
+    assert TableCreator.is_date(value) is is_date
+    assert TableCreator.is_float(value) is is_float
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from part_3.src.auth import create_access_token, token_cache, verify_token
+
+
+async def per_request_seconds(credentials):
+    start = time.perf_counter()
+    for credential in credentials:
+        await verify_token(credential)
+    return (time.perf_counter() - start) / len(credentials)
+
+
+def bench_verification(iterations):
+    """
+    Cost of verify_token per request for new tokens (signature and expiry checked)
+    and for a token already in the verified-token cache.
+
+    :return: Dict of case to seconds per request.
+    """
+    tokens = [create_access_token("doctor", subject=f"user-{i}") for i in range(iterations)]
+    credentials = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=token) for token in tokens]
+    token_cache.clear()
+    try:
+        uncached = asyncio.run(per_request_seconds(credentials))
+        cached = asyncio.run(per_request_seconds(credentials[:1] * iterations))
+    finally:
+        token_cache.clear()
+    return {"uncached": uncached, "cached": cached}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the per-request cost of token verification.")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    results = bench_verification(args.iterations)
+    for case, seconds in results.items():
+        print(f"{case:<10} {seconds * 1e6:9.2f} us/request")
+    print(f"Cache speedup: {results['uncached'] / results['cached']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+from part_1_2.src.utils.db_utils import get_db_connection
+from part_3.src.app import create_app
+from part_3.src.auth import ROLES, create_access_token
+from part_3.src.models import MOCK_DB_RESPONSE, MOCK_PATIENT_RECORD
+from part_3.src.repository import InMemoryPatientRepository, PostgresPatientRepository
+
+DEFAULT_THRESHOLDS = Path(__file__).resolve().parent / "load_thresholds.json"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "load_baseline.json"  # In-process results of test_load.py
+DEFAULT_MIX = {"records": 8, "revalidate": 1, "missing": 1}
+
+# Request kinds: how each is sent and the status it must get
+REQUEST_KINDS = {
+    "records": 200,  # Known patient
+    "revalidate": 304,  # Known patient with the ETag of an earlier response
+    "missing": 404,  # Unknown patient
+    "invalid": 400,  # Malformed patient ID
+    "unauthorized": 401,  # Token with a bad signature
+}
+
+
+@dataclass
+class LatencySummary:
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+@dataclass
+class LoadResult:
+    target: str
+    concurrency: int
+    duration_seconds: float
+    requests: int
+    errors: int
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    by_kind: dict = field(default_factory=dict)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies_ns, errors):
+    values = sorted(value / 1e6 for value in latencies_ns)
+    return LatencySummary(len(values), errors, percentile(values, 0.50), percentile(values, 0.95),
+                          percentile(values, 0.99), values[-1] if values else 0.0)
+
+
+def parse_mix(text):
+    """Parse ``records=8,missing=1`` into a dict of request kind to weight."""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"Unknown request kind '{kind}', expected one of {list(REQUEST_KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+async def run_load(client, patient_id, target="in-process", concurrency=10, requests=1000, duration=None,
+                   mix=None, roles=ROLES, seed=0):
+    """
+    Send ``requests`` requests (or as many as fit in ``duration`` seconds) from ``concurrency``
+    concurrent workers, picking request kinds by the weights in ``mix`` and tokens by ``roles``.
+    Latency is measured per request with a nanosecond monotonic clock.
+
+    :param client: httpx.AsyncClient for the app or server under test.
+    :return: LoadResult.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    tokens = [create_access_token(role, expires_in=24 * 3600) for role in roles]
+    url = f"/patients/{patient_id}/records"
+    etag = (await client.get(url, headers={"Authorization": f"Bearer {tokens[0]}"})).headers.get("ETag")
+
+    def build_request(kind):
+        headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+        if kind == "revalidate":
+            return url, {**headers, "If-None-Match": etag}
+        if kind == "missing":
+            return "/patients/0/records", headers
+        if kind == "invalid":
+            return "/patients/'%20OR%201=1/records", headers
+        if kind == "unauthorized":
+            return url, {"Authorization": f"Bearer {tokens[0][:-4]}AAAA"}
+        return url, headers
+
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        nonlocal issued
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+                kind = kinds[issued % len(kinds)]
+            elif issued >= len(kinds):
+                return
+            else:
+                kind = kinds[issued]
+            issued += 1
+            path, headers = build_request(kind)
+            start = time.perf_counter_ns()
+            try:
+                response = await client.get(path, headers=headers)
+                ok = response.status_code == REQUEST_KINDS[kind]
+            except httpx.HTTPError:
+                ok = False
+            latencies[kind].append(time.perf_counter_ns() - start)
+            errors[kind] += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    overall = summarize([value for values in latencies.values() for value in values], sum(errors.values()))
+    return LoadResult(
+        target=target,
+        concurrency=concurrency,
+        duration_seconds=elapsed,
+        requests=overall.requests,
+        errors=overall.errors,
+        requests_per_second=overall.requests / elapsed if elapsed else 0.0,
+        p50_ms=overall.p50_ms,
+        p95_ms=overall.p95_ms,
+        p99_ms=overall.p99_ms,
+        max_ms=overall.max_ms,
+        by_kind={kind: asdict(summarize(values, errors[kind])) for kind, values in sorted(latencies.items())},
+    )
+
+
+def check_load_thresholds(result, thresholds, baseline=None, max_regression=None):
+    """
+    Compare a LoadResult with absolute thresholds and, when given, with a baseline result.
+
+    :return: List of human readable violations.
+    """
+    violations = []
+    if result.errors > thresholds.get("max_errors", 0):
+        violations.append(f"{result.errors} requests got an unexpected status")
+    if "min_requests_per_second" in thresholds and result.requests_per_second < thresholds["min_requests_per_second"]:
+        violations.append(f"{result.requests_per_second:,.0f} requests/s < {thresholds['min_requests_per_second']:,}")
+    for name in ("p50_ms", "p95_ms", "p99_ms"):
+        limit = thresholds.get(f"max_{name}")
+        if limit is not None and getattr(result, name) > limit:
+            violations.append(f"{name} {getattr(result, name):.2f} > {limit}")
+
+    if baseline and max_regression is not None:
+        if result.requests_per_second < baseline["requests_per_second"] * (1 - max_regression):
+            violations.append(f"{result.requests_per_second:,.0f} requests/s is more than {max_regression:.0%} below "
+                              f"the baseline {baseline['requests_per_second']:,.0f}")
+        if result.p99_ms > baseline["p99_ms"] * (1 + max_regression):
+            violations.append(f"p99 {result.p99_ms:.2f} ms is more than {max_regression:.0%} above the baseline "
+                              f"{baseline['p99_ms']:.2f} ms")
+    return violations
+
+
+def load_thresholds(path=DEFAULT_THRESHOLDS, target="in-process"):
+    """Thresholds of a target: the in-process app, or any server (``--serve`` or ``--url``)."""
+    thresholds = json.loads(Path(path).read_text())
+    return thresholds["in-process" if target == "in-process" else "server"]
+
+
+def attach_to_allure(result, violations=()):
+    import allure
+    allure.attach(json.dumps(asdict(result), indent=2), name=f"Load test ({result.target})",
+                  attachment_type=allure.attachment_type.JSON)
+    if violations:
+        allure.attach("\n".join(violations), name="Load test violations", attachment_type=allure.attachment_type.TEXT)
+
+
+class UvicornServer:
+    """Runs an app with uvicorn on a free local port in a background thread."""
+
+    def __init__(self, app, host="127.0.0.1"):
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://{host}:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._error = None
+
+    def _run(self):
+        try:
+            self.server.run()
+        except BaseException as error:  # uvicorn raises SystemExit when the lifespan startup fails
+            self._error = error
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                # uvicorn logged the cause, e.g. the lifespan startup failed or the port is taken
+                raise RuntimeError(f"uvicorn did not start on {self.url}") from self._error
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *args):
+        self.server.should_exit = True
+        self._thread.join()
+        return False
+
+
+def default_patient_id(repository_kind):
+    """A patient the app knows: the mock patient, or the first patient in the database."""
+    if repository_kind == "memory":
+        return MOCK_PATIENT_RECORD["patient"]["id"]
+    connection = get_db_connection()
+    try:
+        with connection.cursor() as cur:
+            cur.execute("SELECT min(patient_id)::text FROM patient_information")
+            patient_id = cur.fetchone()[0]
+    finally:
+        connection.close()
+    if patient_id is None:
+        raise RuntimeError("patient_information has no patients to load test with")
+    return patient_id
+
+
+def build_app(repository_kind):
+    if repository_kind == "memory":
+        return create_app(InMemoryPatientRepository(MOCK_DB_RESPONSE))
+    return create_app(PostgresPatientRepository())
+
+
+async def run_target(args):
+    kwargs = dict(concurrency=args.concurrency, requests=args.requests, duration=args.duration,
+                  mix=parse_mix(args.mix), roles=args.roles)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    patient_id = args.patient_id or default_patient_id(args.repository)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits) as client:
+            return await run_load(client, patient_id, target=args.url, **kwargs)
+
+    app = build_app(args.repository)
+    if args.serve:
+        with UvicornServer(app) as server:
+            async with httpx.AsyncClient(base_url=server.url, limits=limits) as client:
+                return await run_load(client, patient_id, target="uvicorn", **kwargs)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_load(client, patient_id, target="in-process", **kwargs)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the patient records API.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+    target.add_argument("--serve", action="store_true", help="Start the app with uvicorn on a local port")
+    parser.add_argument("--repository", choices=["memory", "postgres"], default="memory",
+                        help="Patient data of the in-process or --serve app, or that the --url server reads")
+    parser.add_argument("--patient-id", help="Known patient to request; by default the mock patient, or with "
+                                             "--repository postgres the lowest patient ID in the database")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5_000, help="Requests to send (the mix is cycled with --duration)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed request count")
+    parser.add_argument("--mix", default=",".join(f"{kind}={weight}" for kind, weight in DEFAULT_MIX.items()),
+                        help=f"Weights of the request kinds {list(REQUEST_KINDS)}")
+    parser.add_argument("--roles", nargs="+", default=list(ROLES), choices=list(ROLES))
+    parser.add_argument("--output", default="load_results.json")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS))
+    parser.add_argument("--baseline", help="Previous results file to compare throughput and p99 against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    if args.url and not os.getenv("JWT_SECRET_KEY"):
+        # Tokens are signed in this process, so the server must verify them with the same key
+        parser.error("--url needs JWT_SECRET_KEY set to the key of the server under test")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run_target(args))
+    thresholds = load_thresholds(args.thresholds, result.target)
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    violations = check_load_thresholds(result, thresholds, baseline, args.max_regression)
+
+    print(f"{result.target}: {result.requests} requests in {result.duration_seconds:.2f}s "
+          f"({result.requests_per_second:,.0f} requests/s), p50 {result.p50_ms:.2f} ms, "
+          f"p95 {result.p95_ms:.2f} ms, p99 {result.p99_ms:.2f} ms, {result.errors} errors")
+    Path(args.output).write_text(json.dumps(asdict(result), indent=2))
+    print(f"Results written to {args.output}")
+    for violation in violations:
+        print(f"THRESHOLD VIOLATION: {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
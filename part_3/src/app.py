@@ -1,27 +1,153 @@
 # src/app.py
-from fastapi import FastAPI, HTTPException, Depends
+import os
+from contextlib import asynccontextmanager
+
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from part_1_2.src.utils.db_utils import add_write_listener, remove_write_listener
 from .auth import verify_token
-from .models import MOCK_PATIENT_RECORD
+from .pagination import NDJSON_MEDIA_TYPE, InvalidCursor, decode_cursor, ndjson_records, rows_to_page
+from .repository import DatabaseError, PATIENT_TABLES, PostgresPatientRepository, rows_to_patient_record
+from .response_cache import ResponseCache, etag_matches
+
+CACHE_CONTROL = "private, no-cache"  # Clients may keep the response but must revalidate it with If-None-Match
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", 500))
+
+
+class BatchRecordsRequest(BaseModel):
+    patientIds: list[str] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+def is_valid_patient_id(patient_id):
+    return not any(char in patient_id for char in "';\\/")
+
+
+def create_app(repository=None, response_cache=None):
+    """
+    :param repository: Source of the patient rows, PostgresPatientRepository by default.
+    :param response_cache: Cache of serialized patient records, sized by API_RESPONSE_CACHE_SIZE
+                           entries and API_RESPONSE_CACHE_TTL seconds by default.
+    """
+    repository = repository or PostgresPatientRepository()
+    response_cache = response_cache or ResponseCache(
+        maxsize=int(os.getenv("API_RESPONSE_CACHE_SIZE", 1024)),
+        ttl=float(os.getenv("API_RESPONSE_CACHE_TTL", 30))
+    )
+
+    def invalidate_patient_data(table_name):
+        if table_name in PATIENT_TABLES:
+            response_cache.clear()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Registered only while the app runs, so apps that are dropped or shut down are not kept alive
+        add_write_listener(invalidate_patient_data)
+        try:
+            await repository.open()
+            yield
+        finally:
+            try:
+                await repository.close()
+            finally:
+                remove_write_listener(invalidate_patient_data)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.repository = repository
+    app.state.response_cache = response_cache
 
-def create_app():
-    app = FastAPI()
+    async def read_body(patient_id, cursor, limit):
+        """Serialized patient record, or one page of it when paginated; None if there is no such patient."""
+        try:
+            if limit is None:
+                patient_record = rows_to_patient_record(await repository.fetch_patient_rows(patient_id))
+            else:
+                after = decode_cursor(cursor) if cursor else None
+                rows = await repository.fetch_patient_page(patient_id, after, limit + 1)
+                patient_record = rows_to_page(rows, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        except DatabaseError:
+            raise HTTPException(status_code=500, detail="Database error")
+        return None if patient_record is None else orjson.dumps(patient_record)
+
+    async def stream_records(patient_id):
+        rows = repository.iter_patient_rows(patient_id)
+        try:
+            first_row = await anext(rows, None)
+        except DatabaseError:
+            raise HTTPException(status_code=500, detail="Database error")
+        if first_row is None:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        return StreamingResponse(ndjson_records(first_row, rows), media_type=NDJSON_MEDIA_TYPE)
 
     @app.get("/patients/{patient_id}/records")
     async def get_patient_records(
             patient_id: str,
-            token: str = Depends(verify_token)
+            claims: dict = Depends(verify_token),
+            if_none_match: str = Header(None),
+            accept: str = Header(None),
+            cursor: str = Query(None, description="nextCursor of the previous page"),
+            limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Records per page")
     ):
-        if patient_id == "error":
-            raise HTTPException(status_code=500, detail="Database error")
-
-        if any(char in patient_id for char in "';\\/"):
+        if not is_valid_patient_id(patient_id):
             raise HTTPException(status_code=400, detail="Invalid patient ID format")
 
-        if patient_id != MOCK_PATIENT_RECORD["patient"]["id"]:
-            raise HTTPException(status_code=404, detail="Patient not found")
+        if accept and NDJSON_MEDIA_TYPE in accept:
+            return await stream_records(patient_id)
 
-        if patient_id == "error":
-            raise HTTPException(status_code=500, detail="Database error")
-        return MOCK_PATIENT_RECORD
+        if cursor is not None and limit is None:
+            limit = DEFAULT_PAGE_SIZE
+        cache_key = patient_id if limit is None else f"{patient_id}?cursor={cursor or ''}&limit={limit}"
+        cached = response_cache.get(cache_key)
+        if cached is None:
+            generation = response_cache.generation
+            body = await read_body(patient_id, cursor, limit)
+            if body is None:
+                raise HTTPException(status_code=404, detail="Patient not found")
+            cached = response_cache.put(cache_key, body, generation)
+
+        headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(if_none_match, cached.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(cached.body, media_type="application/json", headers=headers)
+
+    @app.post("/patients/records/batch")
+    async def get_patients_records(request: BatchRecordsRequest, claims: dict = Depends(verify_token)):
+        """
+        Records of several patients, fetched with one query for those not in the response cache.
+        Results are keyed by patient ID, each with the status the single-patient endpoint would
+        return and either the ``record`` or an error ``detail``.
+        """
+        results = dict.fromkeys(request.patientIds)
+        to_fetch = []
+        for patient_id in results:
+            if not is_valid_patient_id(patient_id):
+                results[patient_id] = {"status": 400, "detail": "Invalid patient ID format"}
+            elif (cached := response_cache.get(patient_id)) is not None:
+                results[patient_id] = {"status": 200, "record": orjson.loads(cached.body)}
+            else:
+                to_fetch.append(patient_id)
+
+        if to_fetch:
+            generation = response_cache.generation
+            try:
+                rows_by_patient = await repository.fetch_patients_rows(to_fetch)
+            except DatabaseError:
+                rows_by_patient = None
+            for patient_id in to_fetch:
+                if rows_by_patient is None:
+                    results[patient_id] = {"status": 500, "detail": "Database error"}
+                elif (patient_record := rows_to_patient_record(rows_by_patient.get(patient_id))) is None:
+                    results[patient_id] = {"status": 404, "detail": "Patient not found"}
+                else:
+                    response_cache.put(patient_id, orjson.dumps(patient_record), generation)
+                    results[patient_id] = {"status": 200, "record": patient_record}
+
+        return Response(orjson.dumps({"results": results}), media_type="application/json")
 
-    return app
\ No newline at end of file
+    return app
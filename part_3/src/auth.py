@@ -1,16 +1,94 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .models import VALID_TOKENS
+from jose import JWTError, jwt
+
+ALGORITHM = "HS256"
+ROLES = ("doctor", "nurse", "admin")
+# Without JWT_SECRET_KEY, tokens are only valid within this process
+SECRET_KEY = os.getenv("JWT_SECRET_KEY") or secrets.token_urlsafe(32)
 
 security = HTTPBearer()
 
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified token claims. An entry expires at the token's ``exp``,
+    so a token is never accepted from the cache after it would fail verification.
+    """
+
+    def __init__(self, maxsize=10_000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is None:
+                return None
+            if claims["exp"] <= self.clock():
+                del self._claims[token]
+                return None
+            self._claims.move_to_end(token)
+            return claims
+
+    def put(self, token, claims):
+        with self._lock:
+            self._claims[token] = claims
+            self._claims.move_to_end(token)
+            while len(self._claims) > self.maxsize:
+                self._claims.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+    def __len__(self):
+        return len(self._claims)
+
+
+token_cache = TokenCache()
+
+
+def create_access_token(role, subject=None, expires_in=3600):
+    """Create a signed token for a role, valid for ``expires_in`` seconds."""
+    if role not in ROLES:
+        raise ValueError(f"Unknown role '{role}', expected one of {ROLES}")
+    now = int(time.time())
+    claims = {"sub": subject or role, "role": role, "iat": now, "exp": now + expires_in}
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token(token):
+    """
+    Verify the signature and expiry of a token and return its claims.
+    Raises JWTError if the token is invalid, expired or has no known role.
+    """
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require_exp": True})
+    if claims.get("role") not in ROLES:
+        raise JWTError("Token has no valid role")
+    return claims
+
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """Verify JWT token and user role"""
     token = credentials.credentials
-    if token not in VALID_TOKENS.values():
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid authentication token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return token
\ No newline at end of file
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            claims = decode_token(token)
+        except JWTError:
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid authentication token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        token_cache.put(token, claims)
+    return claims
@@ -1,3 +1,5 @@
+from .auth import create_access_token
+
 MOCK_PATIENT_RECORD = {
     "patient": {
         "id": "P12345",
@@ -21,8 +23,9 @@ MOCK_DB_RESPONSE = [
     )
 ]
 
+# Signed test tokens, one per role
 VALID_TOKENS = {
-    "valid_doctor": "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.doctor",
-    "valid_nurse": "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.nurse",
-    "valid_admin": "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.admin"
-}
\ No newline at end of file
+    "valid_doctor": create_access_token("doctor", expires_in=24 * 3600),
+    "valid_nurse": create_access_token("nurse", expires_in=24 * 3600),
+    "valid_admin": create_access_token("admin", expires_in=24 * 3600)
+}
@@ -0,0 +1,82 @@
+import base64
+import binascii
+from datetime import date as Date
+
+import orjson
+
+from .repository import rows_to_patient_record
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_BYTES = 64 * 1024  # Records are sent in chunks of about this size
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not issued by this API."""
+
+
+def encode_cursor(record):
+    """Opaque cursor pointing after a record of the response body: its (id, date) keyset."""
+    return base64.urlsafe_b64encode(orjson.dumps([record["id"], record["date"]])).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    """
+    :return: The (record id, date) keyset of a cursor made by encode_cursor, with the date in ISO format.
+    :raises InvalidCursor: If the cursor is malformed or its date is not a valid date.
+    """
+    try:
+        record_id, date = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if date is not None:
+            date = Date.fromisoformat(date).isoformat()
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(record_id, str):
+        raise InvalidCursor(cursor)
+    return record_id, date
+
+
+def rows_to_page(rows, limit):
+    """
+    Map the rows of one page, fetched with ``limit + 1`` records to detect a following page, to the
+    response body with ``nextCursor`` set to the cursor of the next page, or None on the last page.
+    """
+    page = rows_to_patient_record(rows)
+    if page is None:
+        return None
+    has_next = len(page["records"]) > limit
+    page["records"] = page["records"][:limit]
+    page["nextCursor"] = encode_cursor(page["records"][-1]) if has_next else None
+    return page
+
+
+async def ndjson_records(first_row, rows):
+    """
+    Serialize a patient's rows as NDJSON: a ``{"patient": ...}`` line, then one line per record.
+    Lines are sent in chunks of about STREAM_CHUNK_BYTES as the rows arrive, so the memory held
+    does not grow with the number of records.
+
+    :param first_row: First row, already read to tell whether the patient exists.
+    :param rows: Async iterator of the remaining rows.
+    """
+    patient_id, name, date_of_birth = first_row[:3]
+    chunk = bytearray(orjson.dumps({"patient": {"id": patient_id, "name": name, "dateOfBirth": date_of_birth}}))
+    chunk += b"\n"
+
+    async def with_first_row():
+        try:
+            yield first_row
+            async for row in rows:
+                yield row
+        finally:
+            await rows.aclose()  # Releases the database connection if the client goes away
+
+    async for _, _, _, record_id, date, record_type, result in with_first_row():
+        if record_id is None:
+            continue
+        chunk += orjson.dumps({"id": record_id, "date": date, "type": record_type, "result": result})
+        chunk += b"\n"
+        if len(chunk) >= STREAM_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
@@ -0,0 +1,267 @@
+import asyncio
+from datetime import date
+
+import asyncpg
+
+from part_1_2.config.config import CONFIG
+
+# A patient's lab tests and admissions loaded by part_1_2, as (record id, date, type, result)
+PATIENT_RECORDS_UNION = """
+    SELECT 'T' || t.test_id AS record_id, t.order_date AS record_date, t.test_name AS record_type,
+           NULL::text AS result
+    FROM lab_tests t
+    WHERE t.patient_id = p.patient_id
+    UNION ALL
+    SELECT 'A' || a.hospitalization_case_number, a.admission_date, 'Admission: ' || a.department,
+           CASE WHEN a.release_date IS NULL THEN 'Admitted' ELSE 'Released' END
+    FROM admissions a
+    WHERE a.patient_id = p.patient_id
+"""
+
+# One round trip per request: the patient joined with their records, newest record first.
+# Each row is (patient id, name, date of birth, record id, date, type, result).
+PATIENT_RECORDS_QUERY = f"""
+SELECT p.patient_id::text, p.first_name || ' ' || p.last_name, p.date_of_birth::text,
+       r.record_id, r.record_date::text, r.record_type, r.result
+FROM patient_information p
+LEFT JOIN LATERAL ({PATIENT_RECORDS_UNION}) r ON true
+WHERE p.patient_id = $1::bigint
+ORDER BY r.record_date DESC NULLS LAST, r.record_id
+"""
+
+# One page of PATIENT_RECORDS_QUERY: at most $4 records after the keyset cursor ($2 record id, $3 date)
+# in the same order. The patient row is returned even when no records are left.
+PATIENT_RECORDS_PAGE_QUERY = f"""
+SELECT p.patient_id::text, p.first_name || ' ' || p.last_name, p.date_of_birth::text,
+       r.record_id, r.record_date::text, r.record_type, r.result
+FROM patient_information p
+LEFT JOIN LATERAL (
+    SELECT * FROM ({PATIENT_RECORDS_UNION}) u
+    WHERE $2::text IS NULL
+       OR ($3::date IS NULL AND u.record_date IS NULL AND u.record_id > $2)
+       OR ($3::date IS NOT NULL
+           AND (u.record_date IS NULL OR u.record_date < $3 OR (u.record_date = $3 AND u.record_id > $2)))
+    ORDER BY u.record_date DESC NULLS LAST, u.record_id
+    LIMIT $4
+) r ON true
+WHERE p.patient_id = $1::bigint
+ORDER BY r.record_date DESC NULLS LAST, r.record_id
+"""
+
+# PATIENT_RECORDS_QUERY for a set of patients ($1, a bigint array) in one round trip, grouped by patient
+PATIENTS_RECORDS_BATCH_QUERY = f"""
+SELECT p.patient_id::text, p.first_name || ' ' || p.last_name, p.date_of_birth::text,
+       r.record_id, r.record_date::text, r.record_type, r.result
+FROM patient_information p
+LEFT JOIN LATERAL ({PATIENT_RECORDS_UNION}) r ON true
+WHERE p.patient_id = ANY($1::bigint[])
+ORDER BY p.patient_id, r.record_date DESC NULLS LAST, r.record_id
+"""
+
+# Tables PATIENT_RECORDS_QUERY reads; writes to them invalidate cached responses
+PATIENT_TABLES = ("patient_information", "lab_tests", "admissions")
+
+# Indexes backing the patient_id lookups of PATIENT_RECORDS_QUERY
+PATIENT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS patient_information_patient_id_idx ON patient_information (patient_id)",
+    "CREATE INDEX IF NOT EXISTS lab_tests_patient_id_idx ON lab_tests (patient_id, order_date)",
+    "CREATE INDEX IF NOT EXISTS admissions_patient_id_idx ON admissions (patient_id, admission_date)",
+]
+
+
+# Largest patient ID; IDs are passed as bigint, the widest integer type patient_id can have
+MAX_PATIENT_ID = 2 ** 63 - 1
+
+
+class DatabaseError(Exception):
+    """The patient records could not be read."""
+
+
+def parse_patient_id(patient_id):
+    """
+    The integer value of a patient ID, or None if no patient can have it: patient_id is an
+    integer column, so only ASCII digits within the bigint range can match a row.
+    """
+    if not (patient_id.isascii() and patient_id.isdigit()):
+        return None
+    value = int(patient_id)
+    return value if value <= MAX_PATIENT_ID else None
+
+
+def record_sort_key(row):
+    """Position of a PATIENT_RECORDS_QUERY row in its order: date descending with NULLs last, then ID."""
+    _, _, _, record_id, record_date, _, _ = row
+    # ISO dates compare as strings; negating each character code reverses their order
+    return record_date is None, tuple(-ord(char) for char in record_date or ""), record_id or ""
+
+
+def is_after_cursor(row, after):
+    """Whether a row comes after the keyset cursor ``after`` = (record id, date) in record_sort_key order."""
+    if after is None:
+        return True
+    after_id, after_date = after
+    _, _, _, record_id, record_date, _, _ = row
+    if after_date is None:
+        return record_date is None and record_id > after_id
+    return record_date is None or record_date < after_date or (record_date == after_date and record_id > after_id)
+
+
+def rows_to_patient_record(rows):
+    """
+    Map the rows of PATIENT_RECORDS_QUERY to the response body, or None if there are no rows.
+    A patient without records has a single row whose record columns are NULL.
+    """
+    if not rows:
+        return None
+    patient_id, name, date_of_birth = rows[0][:3]
+    return {
+        "patient": {"id": patient_id, "name": name, "dateOfBirth": date_of_birth},
+        "records": [
+            {"id": record_id, "date": date, "type": record_type, "result": result}
+            for _, _, _, record_id, date, record_type, result in rows
+            if record_id is not None
+        ],
+    }
+
+
+class PostgresPatientRepository:
+    """
+    Reads patient records with an asyncpg connection pool, which is opened on first use
+    (or at application startup) and keeps prepared statements per connection.
+    """
+
+    def __init__(self, min_size=None, max_size=None, create_indexes=True):
+        self.min_size = min_size or CONFIG['database']['pool_min_size']
+        self.max_size = max_size or CONFIG['database']['pool_max_size']
+        self.create_indexes = create_indexes
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        async with self._lock:
+            if self._pool is None:
+                schema = CONFIG['database'].get('schema')
+                self._pool = await asyncpg.create_pool(
+                    host=CONFIG['database']['host'],
+                    database=CONFIG['database']['dbname'],
+                    user=CONFIG['database']['user'],
+                    password=CONFIG['database']['password'],
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    server_settings={'search_path': schema} if schema else None,
+                )
+                if self.create_indexes:
+                    async with self._pool.acquire() as connection:
+                        for statement in PATIENT_INDEXES:
+                            await connection.execute(statement)
+        return self._pool
+
+    async def close(self):
+        async with self._lock:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
+
+    async def fetch_patient_rows(self, patient_id):
+        if (value := parse_patient_id(patient_id)) is None:
+            return []
+        pool = self._pool or await self.open()
+        try:
+            return [tuple(row) for row in await pool.fetch(PATIENT_RECORDS_QUERY, value)]
+        except (asyncpg.PostgresError, OSError) as error:
+            raise DatabaseError(str(error)) from error
+
+    async def fetch_patients_rows(self, patient_ids):
+        """
+        Rows of PATIENT_RECORDS_QUERY for several patients with a single query.
+
+        :return: Dict of patient ID to its rows; patients that do not exist, including IDs
+            no patient can have, are left out.
+        """
+        requested = {}  # Integer ID to the IDs as requested, e.g. "17" and "017"
+        for patient_id in patient_ids:
+            if (value := parse_patient_id(patient_id)) is not None:
+                requested.setdefault(value, set()).add(patient_id)
+        if not requested:
+            return {}
+        pool = self._pool or await self.open()
+        try:
+            rows = await pool.fetch(PATIENTS_RECORDS_BATCH_QUERY, sorted(requested))
+        except (asyncpg.PostgresError, OSError) as error:
+            raise DatabaseError(str(error)) from error
+        rows_by_patient = {}
+        for row in rows:
+            for patient_id in requested[int(row[0])]:
+                rows_by_patient.setdefault(patient_id, []).append(tuple(row))
+        return rows_by_patient
+
+    async def fetch_patient_page(self, patient_id, after=None, limit=100):
+        """
+        Rows of at most ``limit`` records following the keyset cursor ``after`` = (record id, date),
+        in PATIENT_RECORDS_QUERY order.
+        """
+        if (value := parse_patient_id(patient_id)) is None:
+            return []
+        pool = self._pool or await self.open()
+        after_id, after_date = after or (None, None)
+        try:
+            return [tuple(row) for row in await pool.fetch(
+                PATIENT_RECORDS_PAGE_QUERY, value, after_id,
+                date.fromisoformat(after_date) if after_date else None, limit
+            )]
+        except (asyncpg.PostgresError, OSError) as error:
+            raise DatabaseError(str(error)) from error
+
+    async def iter_patient_rows(self, patient_id, prefetch=500):
+        """
+        Yield the rows of PATIENT_RECORDS_QUERY through a server-side cursor, holding at most
+        ``prefetch`` rows in memory at a time.
+        """
+        if (value := parse_patient_id(patient_id)) is None:
+            return
+        pool = self._pool or await self.open()
+        try:
+            async with pool.acquire() as connection, connection.transaction():
+                async for row in connection.cursor(PATIENT_RECORDS_QUERY, value, prefetch=prefetch):
+                    yield tuple(row)
+        except (asyncpg.PostgresError, OSError) as error:
+            raise DatabaseError(str(error)) from error
+
+
+class InMemoryPatientRepository:
+    """
+    Serves fixed rows in the PATIENT_RECORDS_QUERY format and order, e.g. for API tests without a database.
+    Reading one of ``failing_ids`` raises a DatabaseError.
+    """
+
+    def __init__(self, rows, failing_ids=()):
+        self.rows = list(rows)
+        self.failing_ids = set(failing_ids)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def fetch_patient_rows(self, patient_id):
+        if patient_id in self.failing_ids:
+            raise DatabaseError(f"Simulated failure for patient '{patient_id}'")
+        return sorted((row for row in self.rows if row[0] == patient_id), key=record_sort_key)
+
+    async def fetch_patients_rows(self, patient_ids):
+        rows_by_patient = {}
+        for patient_id in dict.fromkeys(patient_ids):
+            rows = await self.fetch_patient_rows(patient_id)
+            if rows:
+                rows_by_patient[patient_id] = rows
+        return rows_by_patient
+
+    async def fetch_patient_page(self, patient_id, after=None, limit=100):
+        rows = await self.fetch_patient_rows(patient_id)
+        records = [row for row in rows if row[3] is not None and is_after_cursor(row, after)][:limit]
+        return records or [row[:3] + (None,) * 4 for row in rows[:1]]
+
+    async def iter_patient_rows(self, patient_id, prefetch=500):
+        for row in await self.fetch_patient_rows(patient_id):
+            yield row
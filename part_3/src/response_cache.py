@@ -0,0 +1,97 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+def strong_etag(body):
+    """Strong ETag of a response body: equal ETags mean byte-identical bodies."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an ``If-None-Match`` header matches the ETag. The header may list several
+    ETags or be ``*``; weak validators compare by their opaque tag, as RFC 9110 requires.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of serialized responses, bounded by entry count and total body
+    size. Entries expire ``ttl`` seconds after they were stored.
+
+    ``generation`` changes on every invalidation. A caller reading the data to cache takes it
+    before the read and passes it to ``put``, which then drops a body that an invalidation
+    during the read made stale.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=64 * 1024 * 1024, ttl=30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= self.clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, generation=None):
+        """
+        Store a body and return its entry. It is not stored if it is larger than ``max_bytes``
+        or the cache was invalidated since ``generation`` was taken.
+        """
+        entry = CachedResponse(body, strong_etag(body), self.clock() + self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,13 +1,16 @@
 import pytest
 from fastapi.testclient import TestClient
 from part_3.src.app import create_app
-from part_3.src.models import VALID_TOKENS
+from part_3.src.models import MOCK_DB_RESPONSE, VALID_TOKENS
+from part_3.src.repository import InMemoryPatientRepository
 
 
 @pytest.fixture
 def api_client():
-    app = create_app()
-    return TestClient(app)
+    # The rows a database would return for the mock patient; "error" simulates a database failure
+    app = create_app(InMemoryPatientRepository(MOCK_DB_RESPONSE, failing_ids=("error",)))
+    with TestClient(app) as client:  # Runs the lifespan, which registers the cache invalidation
+        yield client
 
 @pytest.fixture
 def valid_headers():
@@ -0,0 +1,60 @@
+import allure
+import pytest
+from jose import jwt
+
+from part_3.src import auth
+from part_3.src.auth import TokenCache, create_access_token, decode_token, token_cache
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        create_access_token("doctor", expires_in=-10),  # Expired
+        jwt.encode({"role": "doctor", "exp": 4102444800}, "another-secret", algorithm=auth.ALGORITHM),  # Wrong key
+        jwt.encode({"role": "visitor", "exp": 4102444800}, auth.SECRET_KEY, algorithm=auth.ALGORITHM),  # Unknown role
+        jwt.encode({"role": "doctor"}, auth.SECRET_KEY, algorithm=auth.ALGORITHM),  # No expiry
+    ],
+    ids=["expired", "wrong_signature", "unknown_role", "no_expiry"],
+)
+@allure.title("Test tokens failing JWT validation are rejected")
+def test_invalid_tokens_are_rejected(api_client, token):
+    response = api_client.get("/patients/P12345/records", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid authentication token"
+
+
+@allure.title("Test a token's signature is verified once and then served from the cache")
+def test_verified_token_is_cached(api_client, mocker):
+    token = create_access_token("nurse")
+    token_cache.clear()
+    decode = mocker.spy(auth, "decode_token")
+
+    for _ in range(3):
+        response = api_client.get("/patients/P12345/records", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+
+    assert decode.call_count == 1
+
+
+@allure.title("Test cached claims expire at the token's exp and the cache is bounded")
+def test_token_cache_expiry_and_size():
+    now = [1000.0]
+    cache = TokenCache(maxsize=2, clock=lambda: now[0])
+    cache.put("a", {"exp": 1010})
+    cache.put("b", {"exp": 1100})
+
+    assert cache.get("a") == {"exp": 1010}
+    now[0] = 1010.0
+    assert cache.get("a") is None
+
+    cache.put("c", {"exp": 1100})
+    cache.put("d", {"exp": 1100})
+    assert cache.get("b") is None  # Least recently used
+    assert len(cache) == 2
+
+
+@allure.title("Test role claims of the issued tokens")
+@pytest.mark.parametrize("role", auth.ROLES)
+def test_role_claim(role):
+    assert decode_token(create_access_token(role))["role"] == role
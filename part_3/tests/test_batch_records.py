@@ -0,0 +1,58 @@
+import allure
+import pytest
+
+from part_3.src.models import MOCK_PATIENT_RECORD
+
+BATCH_URL = "/patients/records/batch"
+
+
+@pytest.fixture
+def batch_spy(api_client, mocker):
+    return mocker.spy(api_client.app.state.repository, "fetch_patients_rows")
+
+
+@allure.title("Test the batch endpoint returns every patient's result keyed by ID with one lookup")
+def test_batch_records(api_client, valid_headers, batch_spy):
+    with allure.step("Request a found, a missing and an invalid patient ID"):
+        response = api_client.post(BATCH_URL, headers=valid_headers,
+                                   json={"patientIds": ["P12345", "11", "' OR 1=1", "P12345"]})
+
+    with allure.step("Verify the per-ID statuses"):
+        assert response.status_code == 200
+        assert response.json()["results"] == {
+            "P12345": {"status": 200, "record": MOCK_PATIENT_RECORD},
+            "11": {"status": 404, "detail": "Patient not found"},
+            "' OR 1=1": {"status": 400, "detail": "Invalid patient ID format"},
+        }
+    batch_spy.assert_called_once_with(["P12345", "11"])
+
+    with allure.step("Cached patients are not looked up again"):
+        api_client.post(BATCH_URL, headers=valid_headers, json={"patientIds": ["P12345"]})
+        assert batch_spy.call_count == 1
+        single = api_client.get("/patients/P12345/records", headers=valid_headers)
+        assert single.json() == MOCK_PATIENT_RECORD
+
+
+@allure.title("Test a database failure is reported per ID")
+def test_batch_records_database_error(api_client, valid_headers):
+    response = api_client.post(BATCH_URL, headers=valid_headers, json={"patientIds": ["error", "' OR 1=1"]})
+
+    assert response.status_code == 200
+    assert response.json()["results"] == {
+        "error": {"status": 500, "detail": "Database error"},
+        "' OR 1=1": {"status": 400, "detail": "Invalid patient ID format"},
+    }
+
+
+@pytest.mark.parametrize(
+    "headers, body, expected_status",
+    [
+        ({}, {"patientIds": ["P12345"]}, 401),  # No token
+        (None, {"patientIds": []}, 422),  # Empty batch
+        (None, {"patientIds": ["1"] * 501}, 422),  # Over API_MAX_BATCH_SIZE
+    ],
+)
+@allure.title("Test the batch endpoint requires a token and a bounded list of IDs")
+def test_batch_records_rejected(api_client, valid_headers, headers, body, expected_status):
+    response = api_client.post(BATCH_URL, headers=valid_headers if headers is None else headers, json=body)
+    assert response.status_code == expected_status
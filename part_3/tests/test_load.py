@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+
+import allure
+import httpx
+import pytest
+
+from part_3.benchmarks.load_test import DEFAULT_BASELINE, UvicornServer, attach_to_allure, build_app, \
+    check_load_thresholds, default_patient_id, load_thresholds, parse_args, run_load
+from part_3.src.app import create_app
+from part_3.src.models import MOCK_PATIENT_RECORD
+from part_3.src.repository import InMemoryPatientRepository
+
+
+async def run_in_process(**kwargs):
+    app = build_app("memory")
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_load(client, MOCK_PATIENT_RECORD["patient"]["id"], **kwargs)
+
+
+LOAD_MIX = {"records": 6, "revalidate": 2, "missing": 1, "invalid": 1, "unauthorized": 1}
+
+
+@pytest.fixture(scope="module")
+def load_result():
+    """Results of driving the app in-process with concurrent requests of every kind and role."""
+    return asyncio.run(run_in_process(concurrency=16, requests=1_000, mix=LOAD_MIX))
+
+
+@allure.title("Test every request gets its expected status under concurrent load")
+def test_concurrent_load(load_result):
+    attach_to_allure(load_result)
+    assert load_result.requests == 1_000
+    assert set(load_result.by_kind) == set(LOAD_MIX)
+    assert load_result.errors == 0
+
+
+@pytest.mark.performance
+@pytest.mark.skipif(not os.getenv("LOAD_TEST_PERFORMANCE"), reason="Timing checks run with LOAD_TEST_PERFORMANCE=1")
+@allure.title("Test API throughput and latency percentiles against the thresholds and the baseline")
+def test_load_performance(load_result):
+    """
+    Fail when throughput or latency percentiles miss the stored thresholds, or regress more than
+    LOAD_TEST_MAX_REGRESSION against the committed baseline (or the results file in LOAD_TEST_BASELINE).
+    """
+    baseline = json.loads(open(os.getenv("LOAD_TEST_BASELINE", DEFAULT_BASELINE)).read())
+    violations = check_load_thresholds(load_result, load_thresholds(), baseline,
+                                       float(os.getenv("LOAD_TEST_MAX_REGRESSION", 0.25)))
+    attach_to_allure(load_result, violations)
+    assert not violations, violations
+
+
+class FailingRepository(InMemoryPatientRepository):
+    async def open(self):
+        raise ConnectionRefusedError("database is down")
+
+
+@allure.title("Test the uvicorn runner fails instead of waiting when the server cannot start")
+def test_server_startup_failure():
+    server = UvicornServer(create_app(FailingRepository([])))
+    with pytest.raises(RuntimeError, match="did not start"):
+        server.__enter__()
+
+
+@allure.title("Test --url needs the server's JWT key and the default patient follows the repository")
+def test_load_test_arguments(monkeypatch):
+    monkeypatch.delenv("JWT_SECRET_KEY", raising=False)
+    with pytest.raises(SystemExit):
+        parse_args(["--url", "http://127.0.0.1:8000"])
+    monkeypatch.setenv("JWT_SECRET_KEY", "shared")
+    assert parse_args(["--url", "http://127.0.0.1:8000"]).patient_id is None
+
+    assert default_patient_id("memory") == MOCK_PATIENT_RECORD["patient"]["id"]
@@ -2,7 +2,8 @@ import pytest
 import allure
 import time
 
-from part_3.src.models import VALID_TOKENS
+from part_3.src.models import MOCK_DB_RESPONSE, MOCK_PATIENT_RECORD, VALID_TOKENS
+from part_3.src.repository import rows_to_patient_record
 
 VALID_PATIENT_ID = "P12345"
 VALID_PATIENT_NAME = "John Doe"
@@ -102,4 +103,14 @@ def test_response_data_structure(api_client, valid_headers):
         patient = data["patient"]
         assert patient["id"] == VALID_PATIENT_ID, "Incorrect patient ID"
         assert patient["name"] == VALID_PATIENT_NAME, "Incorrect patient name"
-        assert patient["dateOfBirth"] == VALID_PATIENT_DOB, "Incorrect patient date of birth"
\ No newline at end of file
+        assert patient["dateOfBirth"] == VALID_PATIENT_DOB, "Incorrect patient date of birth"
+
+@allure.title("Test database rows are mapped to the patient records response")
+def test_rows_to_patient_record():
+    with allure.step("Map the joined patient and record rows"):
+        assert rows_to_patient_record(MOCK_DB_RESPONSE) == MOCK_PATIENT_RECORD
+
+    with allure.step("Map a patient without records and a missing patient"):
+        patient_only = [MOCK_DB_RESPONSE[0][:3] + (None, None, None, None)]
+        assert rows_to_patient_record(patient_only)["records"] == []
+        assert rows_to_patient_record([]) is None
@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+
+import allure
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from part_3.src.app import create_app
+from part_3.src.pagination import encode_cursor, decode_cursor, InvalidCursor
+from part_3.src.repository import InMemoryPatientRepository
+
+PATIENT = ("P1", "Jane Roe", "1975-05-05")
+# 249 records, three per day and stored oldest first, plus one without a date. Pages of 40
+# end in the middle of a day, so the cursor's (date, id) tie-break decides where the next one starts.
+HISTORY = [PATIENT + (f"T{i:03d}", (date(2024, 3, 1) - timedelta(days=i // 3)).isoformat(), "Blood Test", None)
+           for i in reversed(range(249))] + [PATIENT + ("T999", None, "Blood Test", None)]
+RECORDS_URL = "/patients/P1/records"
+
+
+@pytest.fixture
+def history_client():
+    return TestClient(create_app(InMemoryPatientRepository(HISTORY)))
+
+
+@allure.title("Test cursor pagination walks the whole history in order without gaps or duplicates")
+def test_cursor_pagination(history_client, valid_headers):
+    full = history_client.get(RECORDS_URL, headers=valid_headers).json()["records"]
+    records, cursor, pages = [], None, 0
+    while True:
+        with allure.step(f"Fetch page {pages + 1}"):
+            params = {"limit": 40, **({"cursor": cursor} if cursor else {})}
+            response = history_client.get(RECORDS_URL, headers=valid_headers, params=params)
+            assert response.status_code == 200
+            page = response.json()
+        assert page["patient"]["name"] == "Jane Roe"
+        assert len(page["records"]) <= 40
+        records += page["records"]
+        pages += 1
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+
+    assert pages == 7
+    assert [record["id"] for record in records] == [record["id"] for record in full]
+    dated = [(record["date"], record["id"]) for record in records[:-1]]
+    assert dated == sorted(dated, key=lambda key: (-date.fromisoformat(key[0]).toordinal(), key[1]))
+    assert records[-1]["date"] is None
+    assert len({record["id"] for record in records}) == len(HISTORY)
+
+
+@allure.title("Test the NDJSON mode streams the patient line and then one line per record")
+def test_ndjson_stream(history_client, valid_headers):
+    headers = {**valid_headers, "Accept": "application/x-ndjson"}
+    with history_client.stream("GET", RECORDS_URL, headers=headers) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [orjson.loads(line) for line in response.iter_lines()]
+
+    assert lines[0] == {"patient": {"id": "P1", "name": "Jane Roe", "dateOfBirth": "1975-05-05"}}
+    full = history_client.get(RECORDS_URL, headers=valid_headers).json()["records"]
+    assert lines[1:] == full
+
+    missing = history_client.get("/patients/P2/records", headers=headers)
+    assert missing.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "params, expected_status",
+    [({"cursor": "not-a-cursor"}, 400), ({"cursor": encode_cursor({"id": "T1", "date": "garbage"})}, 400),
+     ({"limit": 0}, 422), ({"limit": 100_000}, 422)],
+)
+@allure.title("Test invalid cursors and page sizes are rejected")
+def test_invalid_page_parameters(history_client, valid_headers, params, expected_status):
+    response = history_client.get(RECORDS_URL, headers=valid_headers, params=params)
+    assert response.status_code == expected_status
+
+
+@allure.title("Test cursors round trip their keyset")
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor({"id": "A7", "date": "2024-01-02"})) == ("A7", "2024-01-02")
+    assert decode_cursor(encode_cursor({"id": "T1", "date": None})) == ("T1", None)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("W10")  # "[]"
+    for bad_date in ("garbage", "2024-02-30", 20240102):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(encode_cursor({"id": "T1", "date": bad_date}))
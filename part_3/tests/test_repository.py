@@ -0,0 +1,108 @@
+import asyncio
+import re
+
+import allure
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+
+from part_3.src.app import create_app
+from part_3.src.repository import PostgresPatientRepository
+
+INTEGER_RANGES = {"integer": 2 ** 31, "bigint": 2 ** 63}
+PATIENT_ROWS = [("17", "Ann Levi", "1980-01-01", "T2", "2024-02-01", "Blood Test", None),
+                ("17", "Ann Levi", "1980-01-01", "A9", "2024-01-15", "Admission: Cardiology", "Released"),
+                ("23", "Dan Cohen", "1975-06-30", None, None, None, None)]
+
+
+class FakePool:
+    """
+    Answers the patient queries with PATIENT_ROWS for an int4 patient_id column. Like asyncpg,
+    a query argument is encoded as the type of its cast, or of the column without one, and an
+    argument out of that range fails before anything is sent.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def _rows(self, query, args):
+        cast = re.search(r"\$1::(\w+)", query)
+        limit = INTEGER_RANGES[cast.group(1) if cast else "integer"]
+        patient_ids = args[0] if isinstance(args[0], list) else [args[0]]
+        if any(not -limit <= patient_id < limit for patient_id in patient_ids):
+            raise asyncpg.DataError(f"invalid input for query argument $1: {args[0]} (value out of range)")
+        self.queries.append((query, args))
+        return [row for row in PATIENT_ROWS if int(row[0]) in patient_ids]
+
+    async def fetch(self, query, *args):
+        return self._rows(query, args)
+
+    def acquire(self):
+        pool = self
+
+        class Connection:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            def transaction(self):
+                return self
+
+            async def cursor(self, query, *args, prefetch=None):
+                for row in pool._rows(query, args):
+                    yield row
+
+        return Connection()
+
+
+@pytest.fixture
+def repository():
+    repository = PostgresPatientRepository(create_indexes=False)
+    repository._pool = FakePool()
+    return repository
+
+
+async def read_all(repository, patient_id):
+    return (await repository.fetch_patient_rows(patient_id),
+            await repository.fetch_patient_page(patient_id, limit=10),
+            [row async for row in repository.iter_patient_rows(patient_id)])
+
+
+@allure.title("Test IDs no integer patient_id can match return no rows without a query")
+@pytest.mark.parametrize("patient_id", ["²", "١٢", "P12345", "99999999999999999999"])
+def test_unmatchable_patient_ids(repository, patient_id):
+    assert asyncio.run(read_all(repository, patient_id)) == ([], [], [])
+    assert repository._pool.queries == []
+
+
+@allure.title("Test an ID beyond the int4 range is looked up as bigint and not found")
+def test_large_patient_id(repository):
+    assert asyncio.run(read_all(repository, "99999999999")) == ([], [], [])
+    assert len(repository._pool.queries) == 3
+
+
+@allure.title("Test a valid ID is read by every lookup")
+def test_patient_rows(repository):
+    rows, page, streamed = asyncio.run(read_all(repository, "017"))
+
+    assert rows == streamed == PATIENT_ROWS[:2]
+    assert page == rows
+
+
+@allure.title("Test a batch with unmatchable IDs still returns the patients of the valid ones")
+def test_batch_with_bad_ids(repository, valid_headers):
+    patient_ids = ["17", "²", "99999999999", "99999999999999999999", "23", "017", "P12345"]
+
+    rows_by_patient = asyncio.run(repository.fetch_patients_rows(patient_ids))
+
+    assert rows_by_patient == {"17": PATIENT_ROWS[:2], "017": PATIENT_ROWS[:2], "23": PATIENT_ROWS[2:]}
+    assert repository._pool.queries[0][1] == ([17, 23, 99999999999],)
+
+    with allure.step("Verify the endpoint reports each bad ID as not found"):
+        response = TestClient(create_app(repository)).post(
+            "/patients/records/batch", headers=valid_headers, json={"patientIds": patient_ids})
+        statuses = {patient_id: result["status"] for patient_id, result in response.json()["results"].items()}
+        assert statuses == {"17": 200, "²": 404, "99999999999": 404, "99999999999999999999": 404, "23": 200,
+                            "017": 200, "P12345": 404}
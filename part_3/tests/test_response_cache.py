@@ -0,0 +1,135 @@
+import allure
+import pytest
+from fastapi.testclient import TestClient
+
+from part_1_2.src.utils import db_utils
+from part_1_2.src.utils.db_utils import insert_data
+from part_3.src.app import create_app
+from part_3.src.models import MOCK_DB_RESPONSE, MOCK_PATIENT_RECORD
+from part_3.src.repository import InMemoryPatientRepository
+from part_3.src.response_cache import ResponseCache, etag_matches
+
+RECORDS_URL = f"/patients/{MOCK_PATIENT_RECORD['patient']['id']}/records"
+
+
+class FakeWriteConnection:
+    """Accepts the statements of the CRUD helpers without a database."""
+
+    def cursor(self):
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query, params=None):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def fetch_spy(api_client, mocker):
+    return mocker.spy(api_client.app.state.repository, "fetch_patient_rows")
+
+
+@allure.title("Test repeated polling is served from the cache and revalidated with 304")
+def test_etag_and_not_modified(api_client, valid_headers, fetch_spy):
+    with allure.step("First request queries the repository and returns a strong ETag"):
+        first = api_client.get(RECORDS_URL, headers=valid_headers)
+        assert first.status_code == 200
+        assert first.json() == MOCK_PATIENT_RECORD
+        etag = first.headers["ETag"]
+        assert etag.startswith('"') and not etag.startswith("W/")
+
+    with allure.step("A request with the ETag in If-None-Match gets 304 without a body"):
+        second = api_client.get(RECORDS_URL, headers={**valid_headers, "If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+
+    with allure.step("A request without If-None-Match gets the cached body"):
+        third = api_client.get(RECORDS_URL, headers=valid_headers)
+        assert third.status_code == 200
+        assert third.content == first.content
+
+    assert fetch_spy.call_count == 1
+
+
+@allure.title("Test writes through the db_utils CRUD helpers invalidate cached patient records")
+def test_crud_write_invalidates_cache(api_client, valid_headers, fetch_spy):
+    etag = api_client.get(RECORDS_URL, headers=valid_headers).headers["ETag"]
+
+    insert_data(FakeWriteConnection(), "lab_tests", ["test_id"], [1])
+    response = api_client.get(RECORDS_URL, headers={**valid_headers, "If-None-Match": etag})
+
+    assert fetch_spy.call_count == 2
+    assert response.status_code == 304  # Same data, so the same ETag
+
+
+class WritingRepository(InMemoryPatientRepository):
+    """Reads the rows as they were before a write that commits while the read is in flight."""
+
+    async def fetch_patient_rows(self, patient_id):
+        rows = await super().fetch_patient_rows(patient_id)
+        insert_data(FakeWriteConnection(), "lab_tests", ["test_id"], [1])
+        return rows
+
+
+@allure.title("Test a body read before a concurrent write is returned but not cached")
+def test_stale_body_is_not_cached(valid_headers, mocker):
+    repository = WritingRepository(MOCK_DB_RESPONSE)
+    fetch_spy = mocker.spy(repository, "fetch_patient_rows")
+    with TestClient(create_app(repository)) as client:
+        assert client.get(RECORDS_URL, headers=valid_headers).json() == MOCK_PATIENT_RECORD
+        assert len(client.app.state.response_cache) == 0
+        client.get(RECORDS_URL, headers=valid_headers)
+    assert fetch_spy.call_count == 2
+
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.invalidate("other")
+    cache.put("a", b"stale", generation)
+    cache.put("b", b"fresh", cache.generation)
+    assert cache.get("a") is None and cache.get("b").body == b"fresh"
+
+
+@allure.title("Test the cache invalidation is registered only while the app runs")
+def test_write_listener_lifetime():
+    listeners = list(db_utils._write_listeners)
+    app = create_app(InMemoryPatientRepository(MOCK_DB_RESPONSE))
+    assert db_utils._write_listeners == listeners
+
+    with TestClient(app):
+        assert len(db_utils._write_listeners) == len(listeners) + 1
+    assert db_utils._write_listeners == listeners
+
+
+@allure.title("Test cache entries expire after the TTL and are bounded by count and size")
+def test_response_cache_limits():
+    now = [0.0]
+    cache = ResponseCache(maxsize=2, max_bytes=10, ttl=5, clock=lambda: now[0])
+    cache.put("a", b"1234")
+    now[0] = 5.0
+    assert cache.get("a") is None
+
+    cache.put("b", b"1234")
+    cache.put("c", b"1234")
+    cache.put("d", b"1234")
+    assert cache.get("b") is None and len(cache) == 2
+
+    cache.put("e", b"12345678")
+    assert [key for key in "cde" if cache.get(key)] == ["e"]
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ("*", True), ('"x"', False), (None, False)],
+)
+@allure.title("Test If-None-Match matching")
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected